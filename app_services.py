@@ -76,6 +76,9 @@ VIDEO_EXT = {
 # Combined: all supported media files (photos + videos)
 ALL_MEDIA_EXT = SUPPORTED_EXT | VIDEO_EXT
 
+# Photos written per transaction by scan_repository()
+SCAN_COMMIT_EVERY = 200
+
 
 def _extract_image_metadata_with_timeout(file_path, timeout=2.0):
     """
@@ -379,59 +382,68 @@ def scan_repository(root_folder, incremental=False, cancel_callback=None):
 
     # --- Step 1: Process Photos ---
     print(f"[SCAN] Processing {total_photos} photos...")
-    for idx, file_path in enumerate(all_photos):
-        if cancel_callback and cancel_callback():
-            print("[SCAN] Cancel callback triggered — stopping scan gracefully.")
+    # Photos go in chunks: metadata is extracted with no transaction open, then
+    # the chunk is written in one short db.bulk() transaction, so the write
+    # lock is never held while files are being read.
+    for chunk_start in range(0, total_photos, SCAN_COMMIT_EVERY):
+        folders = []  # every photo's folder, skipped ones included, in scan order
+        pending = []
+        cancelled = False
+        for idx in range(chunk_start, min(chunk_start + SCAN_COMMIT_EVERY, total_photos)):
+            file_path = all_photos[idx]
+            if cancel_callback and cancel_callback():
+                print("[SCAN] Cancel callback triggered — stopping scan gracefully.")
+                cancelled = True
+                break
+
+            folders.append(file_path.parent)
+
+            # --- Step 2: Incremental skip check ---
+            stat = os.stat(file_path)
+            size_kb = stat.st_size / 1024
+            modified = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(stat.st_mtime))
+
+            if incremental:
+                existing = db.get_photo_metadata_by_path(str(file_path))
+                if existing and existing.get("size_kb") == size_kb and existing.get("modified") == modified:
+                    # Skip unchanged
+                    continue
+
+            # --- Step 3: Extract metadata with timeout protection ---
+            # Log every 10th file to track progress
+            if (idx + 1) % 10 == 0:
+                print(f"[SCAN] Processing {idx + 1}/{total_files}: {file_path.name}")
+
+            width, height, date_taken = _extract_image_metadata_with_timeout(file_path, timeout=2.0)
+            pending.append((file_path, size_kb, modified, width, height, date_taken))
+
+            # --- Step 5: Progress reporting (photos only) ---
+            processed = idx + 1
+            pct = int(processed / total_files * 100)
+            scan_signals.progress.emit(pct, f"Photos: {processed}/{total_photos} | Videos: 0/{total_videos}")
+
+        # --- Step 4: Insert or update the chunk ---
+        if folders:
+            with db.bulk():
+                for folder_path in folders:
+                    if str(folder_path) not in folder_map:
+                        parent_path = folder_path.parent if folder_path != root_folder else None
+                        parent_id = folder_map.get(str(parent_path)) if parent_path else None
+                        folder_map[str(folder_path)] = db.ensure_folder(
+                            str(folder_path), folder_path.name, parent_id, project_id
+                        )
+                        folder_count += 1
+                if pending:
+                    db.upsert_photo_metadata_many(
+                        [(str(file_path), folder_map[str(file_path.parent)], size_kb, modified,
+                          width, height, date_taken)
+                         for file_path, size_kb, modified, width, height, date_taken in pending],
+                        project_id=project_id,
+                    )
+            photo_count += len(pending)
+        if cancelled:
             return 0, 0
 
-        folder_path = file_path.parent
-        parent_path = folder_path.parent if folder_path != root_folder else None
-        parent_id = folder_map.get(str(parent_path)) if parent_path else None
-
-        if str(folder_path) not in folder_map:
-            folder_id = db.ensure_folder(str(folder_path), folder_path.name, parent_id, project_id)
-            folder_map[str(folder_path)] = folder_id
-            folder_count += 1
-        else:
-            folder_id = folder_map[str(folder_path)]
-
-        # --- Step 2: Incremental skip check ---
-        stat = os.stat(file_path)
-        size_kb = stat.st_size / 1024
-        modified = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(stat.st_mtime))
-
-        if incremental:
-            existing = db.get_photo_metadata_by_path(str(file_path))
-            if existing and existing.get("size_kb") == size_kb and existing.get("modified") == modified:
-                # Skip unchanged
-                continue
-
-        # --- Step 3: Extract metadata with timeout protection ---
-        # Log every 10th file to track progress
-        if (idx + 1) % 10 == 0:
-            print(f"[SCAN] Processing {idx + 1}/{total_files}: {file_path.name}")
-
-        width, height, date_taken = _extract_image_metadata_with_timeout(file_path, timeout=2.0)
-
-        # --- Step 4: Insert or update ---
-        db.upsert_photo_metadata(
-            path=str(file_path),
-            folder_id=folder_id,
-            size_kb=size_kb,
-            modified=modified,
-            width=width,
-            height=height,
-            date_taken=date_taken,
-            tags=None,
-            project_id=project_id,
-        )
-        photo_count += 1
-
-        # --- Step 5: Progress reporting (photos only) ---
-        processed = idx + 1
-        pct = int(processed / total_files * 100)
-        scan_signals.progress.emit(pct, f"Photos: {processed}/{total_photos} | Videos: 0/{total_videos}")
-
     # --- Step 2: Process Videos ---
     if total_videos > 0:
         print(f"[SCAN] Processing {total_videos} videos...")
@@ -483,7 +495,12 @@ def scan_repository(root_folder, incremental=False, cancel_callback=None):
         except Exception as e:
             print(f"[SCAN] ⚠️ Error processing videos: {e}")
 
-    # --- Step 6: Rebuild date index ---
+    # --- Step 6: Refresh planner stats and rebuild date index ---
+    try:
+        db.post_ingest_optimize()
+    except Exception as e:
+        print(f"[SCAN] ⚠️ Post-scan ANALYZE failed (non-critical): {e}")
+
     scan_signals.progress.emit(100, f"✅ Scan complete: {photo_count} photos, {video_count} videos, {folder_count} folders")
     print(f"[SCAN] Completed: {folder_count} folders, {photo_count} photos, {video_count} videos")
 
@@ -621,21 +638,15 @@ def rebuild_date_index_with_progress():
     db = ReferenceDB()
     with db._connect() as conn:
         total = conn.execute("SELECT COUNT(*) FROM photo_metadata").fetchone()[0]
-        if total == 0:
-            scan_signals.progress.emit(100, "No photos to index by date.")
-            return
-
-        done = 0
-        cursor = conn.execute("SELECT id FROM photo_metadata")
-        for row in cursor:
-            # If you already maintain a date index table or view, update it here
-            # This loop is just to simulate progress feedback
-            done += 1
-            pct = int(done / total * 100)
-            if done % 50 == 0 or done == total:
-                scan_signals.progress.emit(pct, f"Indexing dates… {done}/{total}")
-
-        scan_signals.progress.emit(100, f"📅 Date index ready ({total} photos).")
-        print(f"[INDEX] Date indexing completed: {total} photos")
+    if total == 0:
+        scan_signals.progress.emit(100, "No photos to index by date.")
+        return
+
+    db.rebuild_date_index(
+        progress_cb=lambda pct: scan_signals.progress.emit(pct, f"Indexing dates… {pct}%")
+    )
+
+    scan_signals.progress.emit(100, f"📅 Date index ready ({total} photos).")
+    print(f"[INDEX] Date indexing completed: {total} photos")
 
 
@@ -2360,6 +2360,11 @@ class MainWindow(QMainWindow):
         except Exception as e:
             print(f"[Shutdown] Thumb cache clear error: {e}")
 
+        try:
+            ReferenceDB.close_all_connections()
+        except Exception as e:
+            print(f"[Shutdown] Database close error: {e}")
+
         super().closeEvent(event)
 
     def _update_breadcrumb(self):
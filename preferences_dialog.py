@@ -14,15 +14,163 @@ from PySide6.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QListWidget, QListWidgetItem,
     QStackedWidget, QWidget, QLabel, QCheckBox, QComboBox, QLineEdit,
     QTextEdit, QPushButton, QSpinBox, QFormLayout, QGroupBox, QMessageBox,
-    QDialogButtonBox, QScrollArea, QFileDialog, QFrame
+    QDialogButtonBox, QScrollArea, QFileDialog, QFrame, QProgressDialog
 )
-from PySide6.QtCore import Qt, QSize, QProcess, QRect
+from PySide6.QtCore import Qt, QSize, QProcess, QRect, QThread, Signal
 from PySide6.QtGui import QGuiApplication, QPainter, QColor, QPen, QFont
 import sys
+import time
+import platform
+import subprocess
+import threading
+from collections import deque
 from pathlib import Path
 
 from translation_manager import get_translation_manager, tr
 from config.face_detection_config import get_face_config
+from utils.app_paths import insightface_check_flag, ffmpeg_check_flag
+
+try:
+    from utils.test_insightface_models import test_model_path as _test_model_path
+except ImportError:
+    _test_model_path = None
+
+_IS_WINDOWS = platform.system() == "Windows"
+
+# Model status label styles (error / ready / warning)
+_QSS_STATUS_ERROR = "QLabel { padding: 6px; background-color: #ffe0e0; border-radius: 4px; color: #d00; }"
+_QSS_STATUS_OK = "QLabel { padding: 6px; background-color: #e0ffe0; border-radius: 4px; color: #060; }"
+_QSS_STATUS_WARN = "QLabel { padding: 6px; background-color: #fff4e0; border-radius: 4px; color: #840; }"
+
+# Seconds a thumbnail cache stats result stays valid for repeat clicks
+_CACHE_STATS_TTL = 30.0
+
+
+class _ModelTestThread(QThread):
+    """Background thread that test-loads InsightFace models from a path."""
+
+    finished_signal = Signal(bool, str)
+
+    def __init__(self, test_path, parent=None):
+        super().__init__(parent)
+        self.test_path = test_path
+
+    def run(self):
+        if _test_model_path is None:
+            self.finished_signal.emit(False, "Test error: model test utility is not available")
+            return
+        try:
+            success, message = _test_model_path(self.test_path)
+            self.finished_signal.emit(success, message)
+        except Exception as e:
+            self.finished_signal.emit(False, f"Test error: {str(e)}")
+
+
+class _ModelDownloadThread(QThread):
+    """Background thread that runs download_face_models.py, streaming its output."""
+
+    progress = Signal(str)
+    finished_signal = Signal(bool, str)
+
+    TIMEOUT_SECS = 600  # 10 minute timeout
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._proc = None
+        self.cancelled = False
+
+    def cancel(self):
+        """Stop the download at the user's request."""
+        self.cancelled = True
+        self._terminate()
+
+    def _terminate(self):
+        proc = self._proc
+        if proc is not None and proc.poll() is None:
+            proc.terminate()
+
+    def run(self):
+        timed_out = threading.Event()
+
+        def on_timeout():
+            timed_out.set()
+            self._terminate()
+
+        timer = threading.Timer(self.TIMEOUT_SECS, on_timeout)
+        try:
+            self.progress.emit("Initializing download...")
+
+            # Run download_face_models.py script
+            script_path = Path("download_face_models.py")
+            if not script_path.exists():
+                self.finished_signal.emit(False, "download_face_models.py not found")
+                return
+
+            self.progress.emit("Downloading buffalo_l models (~200MB)...")
+            self._proc = subprocess.Popen(
+                [sys.executable, str(script_path)],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                bufsize=1
+            )
+            timer.start()
+
+            # Keep only the tail of the log for error reporting
+            tail = deque(maxlen=20)
+            for line in self._proc.stdout:
+                line = line.rstrip()
+                if line:
+                    tail.append(line)
+                    self.progress.emit(line)
+            returncode = self._proc.wait()
+
+            if timed_out.is_set():
+                self.finished_signal.emit(False, "Download timed out (>10 minutes)")
+            elif self.cancelled:
+                self.finished_signal.emit(False, "Download cancelled")
+            elif returncode == 0:
+                self.finished_signal.emit(True, "Models downloaded successfully!")
+            else:
+                error_msg = "\n".join(tail) or "Unknown error"
+                self.finished_signal.emit(False, f"Download failed:\n{error_msg}")
+
+        except Exception as e:
+            self.finished_signal.emit(False, f"Error: {str(e)}")
+        finally:
+            timer.cancel()
+            self._proc = None
+
+
+class _CacheStatsThread(QThread):
+    """Background thread that collects thumbnail cache statistics."""
+
+    done = Signal(dict)
+
+    def run(self):
+        try:
+            from thumb_cache_db import get_cache
+            stats = get_cache().get_stats()
+        except Exception as e:
+            stats = {"error": str(e)}
+        self.done.emit(stats)
+
+
+class _CacheMaintenanceThread(QThread):
+    """Background thread that runs one thumbnail cache job (purge or compact)."""
+
+    done = Signal(object, str)  # (job result, error message or "")
+
+    def __init__(self, job, parent=None):
+        super().__init__(parent)
+        self._job = job
+
+    def run(self):
+        try:
+            result, error = self._job(), ""
+        except Exception as e:
+            result, error = None, str(e)
+        self.done.emit(result, error)
 
 
 class BadgePreviewWidget(QWidget):
@@ -165,10 +313,25 @@ class PreferencesDialog(QDialog):
         # Track original settings for change detection
         self.original_settings = self._capture_settings()
 
+        # Sections edited since the dialog opened; _on_save skips the rest
+        self._dirty_sections = set()
+
         self._setup_ui()
         self._load_settings()
+        self._connect_change_tracking()
         self._apply_styling()
 
+        # Last thumbnail cache stats and when they were collected
+        self._cache_stats = None
+        self._cache_stats_time = 0.0
+
+        # Unsaved-changes prompt is reused across cancel clicks
+        self._unsaved_box = QMessageBox(self)
+        self._unsaved_box.setIcon(QMessageBox.Question)
+        self._unsaved_box.setWindowTitle(tr("preferences.unsaved_changes"))
+        self._unsaved_box.setText(tr("preferences.unsaved_changes_message"))
+        self._unsaved_box.setStandardButtons(QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel)
+
         # Check InsightFace model status after UI is ready
         self._check_model_status()
 
@@ -366,8 +529,8 @@ class PreferencesDialog(QDialog):
         self.cmb_cache_size = QComboBox()
         self.cmb_cache_size.setEditable(True)
         self.cmb_cache_size.setToolTip(tr("preferences.cache.size_mb_hint"))
-        for size in ["100", "250", "500", "1000", "2000"]:
-            self.cmb_cache_size.addItem(size)
+        for size in (100, 250, 500, 1000, 2000):
+            self.cmb_cache_size.addItem(str(size), size)
 
         cache_size_layout.addRow(tr("preferences.cache.size_mb") + ":", self.cmb_cache_size)
         cache_layout.addLayout(cache_size_layout)
@@ -391,8 +554,14 @@ class PreferencesDialog(QDialog):
         btn_purge_cache.setMaximumWidth(150)
         btn_purge_cache.clicked.connect(self._purge_cache)
 
+        btn_compact_cache = QPushButton("🗜️ Compact Cache")
+        btn_compact_cache.setToolTip("Return space freed by purges to the disk (may take a while)")
+        btn_compact_cache.setMaximumWidth(150)
+        btn_compact_cache.clicked.connect(self._compact_cache)
+
         cache_btn_layout.addWidget(btn_cache_stats)
         cache_btn_layout.addWidget(btn_purge_cache)
+        cache_btn_layout.addWidget(btn_compact_cache)
         cache_btn_layout.addStretch()
 
         cache_layout.addWidget(cache_btn_row)
@@ -838,22 +1007,22 @@ class PreferencesDialog(QDialog):
         self.spin_workers = QComboBox()
         self.spin_workers.setEditable(True)
         self.spin_workers.setToolTip(tr("preferences.metadata.workers_hint"))
-        for workers in ["2", "4", "6", "8", "12"]:
-            self.spin_workers.addItem(workers)
+        for workers in (2, 4, 6, 8, 12):
+            self.spin_workers.addItem(str(workers), workers)
         meta_layout.addRow(tr("preferences.metadata.workers") + ":", self.spin_workers)
 
         self.txt_meta_timeout = QComboBox()
         self.txt_meta_timeout.setEditable(True)
         self.txt_meta_timeout.setToolTip(tr("preferences.metadata.timeout_hint"))
-        for timeout in ["4.0", "6.0", "8.0", "12.0"]:
-            self.txt_meta_timeout.addItem(timeout)
+        for timeout in (4.0, 6.0, 8.0, 12.0):
+            self.txt_meta_timeout.addItem(str(timeout), timeout)
         meta_layout.addRow(tr("preferences.metadata.timeout") + ":", self.txt_meta_timeout)
 
         self.txt_meta_batch = QComboBox()
         self.txt_meta_batch.setEditable(True)
         self.txt_meta_batch.setToolTip(tr("preferences.metadata.batch_size_hint"))
-        for batch in ["50", "100", "200", "500"]:
-            self.txt_meta_batch.addItem(batch)
+        for batch in (50, 100, 200, 500):
+            self.txt_meta_batch.addItem(str(batch), batch)
         meta_layout.addRow(tr("preferences.metadata.batch_size") + ":", self.txt_meta_batch)
 
         self.chk_meta_auto = QCheckBox(tr("preferences.metadata.auto_run"))
@@ -937,7 +1106,7 @@ class PreferencesDialog(QDialog):
         # Appearance
         self.chk_dark.setChecked(self.settings.get("dark_mode", False))
         self.chk_cache.setChecked(self.settings.get("thumbnail_cache_enabled", True))
-        self.cmb_cache_size.setCurrentText(str(self.settings.get("cache_size_mb", 500)))
+        self._set_combo_number(self.cmb_cache_size, self.settings.get("cache_size_mb", 500))
         self.chk_cache_cleanup.setChecked(self.settings.get("cache_auto_cleanup", True))
 
         # Scanning
@@ -993,9 +1162,9 @@ class PreferencesDialog(QDialog):
         self.chk_decoder_warnings.setChecked(self.settings.get("show_decoder_warnings", False))
         self.chk_db_debug.setChecked(self.settings.get("db_debug_logging", False))
         self.chk_sql_echo.setChecked(self.settings.get("show_sql_queries", False))
-        self.spin_workers.setCurrentText(str(self.settings.get("meta_workers", 4)))
-        self.txt_meta_timeout.setCurrentText(str(self.settings.get("meta_timeout_secs", 8.0)))
-        self.txt_meta_batch.setCurrentText(str(self.settings.get("meta_batch", 200)))
+        self._set_combo_number(self.spin_workers, self.settings.get("meta_workers", 4))
+        self._set_combo_number(self.txt_meta_timeout, self.settings.get("meta_timeout_secs", 8.0))
+        self._set_combo_number(self.txt_meta_batch, self.settings.get("meta_batch", 200))
         self.chk_meta_auto.setChecked(self.settings.get("auto_run_backfill_after_scan", False))
 
     def _capture_settings(self) -> dict:
@@ -1029,15 +1198,37 @@ class PreferencesDialog(QDialog):
             "auto_run_backfill_after_scan": self.settings.get("auto_run_backfill_after_scan", False),
         }
 
+    @staticmethod
+    def _set_combo_number(combo: QComboBox, value):
+        """Select the preset entry holding value, or show it as custom text."""
+        index = combo.findData(value)
+        if index >= 0:
+            combo.setCurrentIndex(index)
+        else:
+            combo.setCurrentText(str(value))
+
+    @staticmethod
+    def _combo_number(combo: QComboBox, cast, default):
+        """
+        Read a numeric value from an editable combo box.
+
+        Preset entries carry their parsed value as item data, so only custom
+        text typed by the user needs to be parsed.
+        """
+        text = combo.currentText()
+        if combo.itemText(combo.currentIndex()) == text:
+            value = combo.currentData()
+            if value is not None:
+                return value
+        try:
+            return cast(text)
+        except ValueError:
+            return default
+
     def _on_cancel(self):
         """Handle cancel button - check for unsaved changes."""
         if self._has_changes():
-            reply = QMessageBox.question(
-                self,
-                tr("preferences.unsaved_changes"),
-                tr("preferences.unsaved_changes_message"),
-                QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel
-            )
+            reply = self._unsaved_box.exec()
 
             if reply == QMessageBox.Yes:
                 self._on_save()
@@ -1047,119 +1238,201 @@ class PreferencesDialog(QDialog):
         else:
             self.reject()
 
+    def _connect_change_tracking(self):
+        """Mark a settings section dirty whenever one of its widgets is edited."""
+        sections = {
+            "general": (self.chk_skip, self.chk_exif),
+            "appearance": (
+                self.chk_dark, self.cmb_language, self.chk_cache, self.cmb_cache_size,
+                self.chk_cache_cleanup, self.chk_badge_overlays, self.spin_badge_size,
+                self.cmb_badge_shape, self.spin_badge_max, self.chk_badge_shadow,
+            ),
+            "scanning": (self.txt_ignore_folders, self.chk_device_auto_refresh),
+            "gps": (
+                self.spin_cluster_radius, self.chk_reverse_geocoding,
+                self.spin_geocoding_timeout, self.chk_cache_location_names,
+            ),
+            "face": (
+                self.cmb_insightface_model, self.txt_model_path, self.spin_min_face_size,
+                self.spin_confidence, self.spin_cluster_eps, self.spin_min_samples,
+                self.chk_auto_cluster, self.chk_project_overrides, self.spin_proj_min_face,
+                self.spin_proj_confidence, self.spin_proj_eps, self.spin_proj_min_samples,
+                self.chk_show_low_conf, self.spin_max_workers, self.spin_batch_size,
+            ),
+            "video": (self.txt_ffprobe_path,),
+            "advanced": (
+                self.chk_decoder_warnings, self.chk_db_debug, self.chk_sql_echo,
+                self.spin_workers, self.txt_meta_timeout, self.txt_meta_batch,
+                self.chk_meta_auto,
+            ),
+        }
+
+        for section, widgets in sections.items():
+            mark = lambda *_, section=section: self._dirty_sections.add(section)
+            for widget in widgets:
+                if isinstance(widget, QCheckBox):
+                    widget.toggled.connect(mark)
+                elif isinstance(widget, QSpinBox):
+                    widget.valueChanged.connect(mark)
+                elif isinstance(widget, QComboBox):
+                    widget.currentIndexChanged.connect(mark)
+                    if widget.isEditable():
+                        widget.editTextChanged.connect(mark)
+                elif isinstance(widget, (QLineEdit, QTextEdit)):
+                    widget.textChanged.connect(mark)
+
     def _on_save(self):
-        """Save all settings and close dialog."""
+        """Save modified settings sections and close dialog."""
+        dirty = self._dirty_sections
+        settings = self.settings
+        face_config = self.face_config
+        save = settings.set
+        save_face = face_config.set
+        # Restart notices are shown together once everything is saved
+        restart_notices = []
+        offer_restart = False
+
         # General
-        self.settings.set("skip_unchanged_photos", self.chk_skip.isChecked())
-        self.settings.set("use_exif_for_date", self.chk_exif.isChecked())
+        if "general" in dirty:
+            save("skip_unchanged_photos", self.chk_skip.isChecked())
+            save("use_exif_for_date", self.chk_exif.isChecked())
 
         # Appearance
-        self.settings.set("dark_mode", self.chk_dark.isChecked())
-        self.settings.set("thumbnail_cache_enabled", self.chk_cache.isChecked())
+        if "appearance" in dirty:
+            save("dark_mode", self.chk_dark.isChecked())
+            save("thumbnail_cache_enabled", self.chk_cache.isChecked())
 
-        try:
-            cache_size = int(self.cmb_cache_size.currentText())
-        except ValueError:
-            cache_size = 500
-        self.settings.set("cache_size_mb", cache_size)
+            save("cache_size_mb", self._combo_number(self.cmb_cache_size, int, 500))
 
-        self.settings.set("cache_auto_cleanup", self.chk_cache_cleanup.isChecked())
+            save("cache_auto_cleanup", self.chk_cache_cleanup.isChecked())
 
-        # Language
-        selected_lang = self.cmb_language.currentData()
-        old_lang = self.settings.get("language", "en")
-        if selected_lang != old_lang:
-            self.settings.set("language", selected_lang)
-            QMessageBox.information(
-                self,
-                tr("preferences.appearance.restart_required"),
-                tr("preferences.appearance.restart_required_message")
-            )
+            # Language
+            selected_lang = self.cmb_language.currentData()
+            old_lang = settings.get("language", "en")
+            if selected_lang != old_lang:
+                save("language", selected_lang)
+                restart_notices.append((
+                    tr("preferences.appearance.restart_required"),
+                    tr("preferences.appearance.restart_required_message")
+                ))
 
         # Scanning
-        ignore_list = [x.strip() for x in self.txt_ignore_folders.toPlainText().splitlines() if x.strip()]
-        self.settings.set("ignore_folders", ignore_list)
-        self.settings.set("device_auto_refresh", self.chk_device_auto_refresh.isChecked())
+        if "scanning" in dirty:
+            ignore_list = [s for line in self.txt_ignore_folders.toPlainText().splitlines() if (s := line.strip())]
+            save("ignore_folders", ignore_list)
+            save("device_auto_refresh", self.chk_device_auto_refresh.isChecked())
 
         # Face Detection
-        self.face_config.set("insightface_model", self.cmb_insightface_model.currentData())
-        self.face_config.set("min_face_size", self.spin_min_face_size.value())
-        self.face_config.set("confidence_threshold", self.spin_confidence.value() / 100.0)
-        self.face_config.set("clustering_eps", self.spin_cluster_eps.value() / 100.0)
-        self.face_config.set("clustering_min_samples", self.spin_min_samples.value())
-        self.face_config.set("auto_cluster_after_scan", self.chk_auto_cluster.isChecked())
-        self.face_config.set("max_workers", self.spin_max_workers.value())
-        self.face_config.set("batch_size", self.spin_batch_size.value())
-        # Per-project overrides
-        if self.chk_project_overrides.isChecked():
-            self.face_config.set_project_overrides(self.current_project_id, {
-                "min_face_size": self.spin_proj_min_face.value(),
-                "confidence_threshold": self.spin_proj_confidence.value() / 100.0,
-                "clustering_eps": self.spin_proj_eps.value() / 100.0,
-                "clustering_min_samples": self.spin_proj_min_samples.value(),
-            })
-        else:
-            po = self.face_config.get("project_overrides", {})
-            if str(self.current_project_id) in po:
-                del po[str(self.current_project_id)]
-                self.face_config.set("project_overrides", po)
-        # UI low-confidence toggle
-        self.face_config.set("show_low_confidence", self.chk_show_low_conf.isChecked())
-        print(f"✅ Face detection settings saved: model={self.cmb_insightface_model.currentData()}, "
-              f"eps={self.spin_cluster_eps.value()}%, min_samples={self.spin_min_samples.value()}")
-
-        # InsightFace Model Path
-        model_path = self.txt_model_path.text().strip()
-        old_model_path = self.settings.get("insightface_model_path", "")
-        self.settings.set("insightface_model_path", model_path)
-
-        if model_path != old_model_path:
-            # Clear InsightFace check flag
-            flag_file = Path('.insightface_check_done')
-            if flag_file.exists():
+        if "face" in dirty:
+            save_face("insightface_model", self.cmb_insightface_model.currentData())
+            save_face("min_face_size", self.spin_min_face_size.value())
+            save_face("confidence_threshold", self.spin_confidence.value() / 100.0)
+            save_face("clustering_eps", self.spin_cluster_eps.value() / 100.0)
+            save_face("clustering_min_samples", self.spin_min_samples.value())
+            save_face("auto_cluster_after_scan", self.chk_auto_cluster.isChecked())
+            save_face("max_workers", self.spin_max_workers.value())
+            save_face("batch_size", self.spin_batch_size.value())
+            # Per-project overrides
+            if self.chk_project_overrides.isChecked():
+                face_config.set_project_overrides(self.current_project_id, {
+                    "min_face_size": self.spin_proj_min_face.value(),
+                    "confidence_threshold": self.spin_proj_confidence.value() / 100.0,
+                    "clustering_eps": self.spin_proj_eps.value() / 100.0,
+                    "clustering_min_samples": self.spin_proj_min_samples.value(),
+                })
+            else:
+                po = face_config.get("project_overrides", {})
+                if str(self.current_project_id) in po:
+                    del po[str(self.current_project_id)]
+                    save_face("project_overrides", po)
+            # UI low-confidence toggle
+            save_face("show_low_confidence", self.chk_show_low_conf.isChecked())
+            print(f"✅ Face detection settings saved: model={self.cmb_insightface_model.currentData()}, "
+                  f"eps={self.spin_cluster_eps.value()}%, min_samples={self.spin_min_samples.value()}")
+
+            # InsightFace Model Path
+            model_path = self.txt_model_path.text().strip()
+            old_model_path = settings.get("insightface_model_path", "")
+            save("insightface_model_path", model_path)
+
+            if model_path != old_model_path:
+                # Clear InsightFace check flag
                 try:
-                    flag_file.unlink()
+                    insightface_check_flag().unlink(missing_ok=True)
                     print("🔄 InsightFace check flag cleared - will re-check on next startup")
-                except Exception as e:
+                except OSError as e:
                     print(f"⚠️ Failed to clear InsightFace check flag: {e}")
 
-            print(f"🧑 InsightFace model path configured: {model_path or '(using default locations)'}")
+                print(f"🧑 InsightFace model path configured: {model_path or '(using default locations)'}")
 
         # Badge overlays
-        self.settings.set("badge_overlays_enabled", self.chk_badge_overlays.isChecked())
-        self.settings.set("badge_size_px", self.spin_badge_size.value())
-        self.settings.set("badge_shape", self.cmb_badge_shape.currentText())
-        self.settings.set("badge_max_count", self.spin_badge_max.value())
-        self.settings.set("badge_shadow", self.chk_badge_shadow.isChecked())
-        
+        if "appearance" in dirty:
+            save("badge_overlays_enabled", self.chk_badge_overlays.isChecked())
+            save("badge_size_px", self.spin_badge_size.value())
+            save("badge_shape", self.cmb_badge_shape.currentText())
+            save("badge_max_count", self.spin_badge_max.value())
+            save("badge_shadow", self.chk_badge_shadow.isChecked())
+
         # GPS & Location
-        self.settings.set("gps_clustering_radius_km", float(self.spin_cluster_radius.value()))
-        self.settings.set("gps_reverse_geocoding_enabled", self.chk_reverse_geocoding.isChecked())
-        self.settings.set("gps_geocoding_timeout_sec", float(self.spin_geocoding_timeout.value()))
-        self.settings.set("gps_cache_location_names", self.chk_cache_location_names.isChecked())
+        if "gps" in dirty:
+            save("gps_clustering_radius_km", float(self.spin_cluster_radius.value()))
+            save("gps_reverse_geocoding_enabled", self.chk_reverse_geocoding.isChecked())
+            save("gps_geocoding_timeout_sec", float(self.spin_geocoding_timeout.value()))
+            save("gps_cache_location_names", self.chk_cache_location_names.isChecked())
 
         # Video FFprobe path
-        ffprobe_path = self.txt_ffprobe_path.text().strip()
-        old_ffprobe_path = self.settings.get("ffprobe_path", "")
-        self.settings.set("ffprobe_path", ffprobe_path)
-        if ffprobe_path != old_ffprobe_path:
-            # Clear FFmpeg check flag
-            flag_file = Path('.ffmpeg_check_done')
-            if flag_file.exists():
+        if "video" in dirty:
+            ffprobe_path = self.txt_ffprobe_path.text().strip()
+            old_ffprobe_path = settings.get("ffprobe_path", "")
+            save("ffprobe_path", ffprobe_path)
+            if ffprobe_path != old_ffprobe_path:
+                # Clear FFmpeg check flag
                 try:
-                    flag_file.unlink()
+                    ffmpeg_check_flag().unlink(missing_ok=True)
                     print(tr("preferences.video.ffmpeg_path_changed"))
-                except Exception as e:
+                except OSError as e:
                     print(f"⚠️ Failed to clear FFmpeg check flag: {e}")
 
-            path_display = ffprobe_path if ffprobe_path else tr("preferences.video.ffmpeg_path_system")
-            print(tr("preferences.video.ffmpeg_path_configured", path=path_display))
+                path_display = ffprobe_path if ffprobe_path else tr("preferences.video.ffmpeg_path_system")
+                print(tr("preferences.video.ffmpeg_path_configured", path=path_display))
+
+                # Offer to restart
+                offer_restart = True
 
-            # Offer to restart
+        # Advanced
+        if "advanced" in dirty:
+            save("show_decoder_warnings", self.chk_decoder_warnings.isChecked())
+
+            if settings.get("show_decoder_warnings", False):
+                restart_notices.append((
+                    tr("preferences.diagnostics.restart_required"),
+                    tr("preferences.diagnostics.restart_required_message")
+                ))
+            else:
+                restart_notices.append((
+                    tr("preferences.diagnostics.restart_recommended"),
+                    tr("preferences.diagnostics.restart_recommended_message")
+                ))
+
+            save("db_debug_logging", self.chk_db_debug.isChecked())
+            save("show_sql_queries", self.chk_sql_echo.isChecked())
+
+            if self.chk_db_debug.isChecked():
+                print(tr("preferences.developer.developer_mode_enabled"))
+
+            # Metadata
+            save("meta_workers", self._combo_number(self.spin_workers, int, 4))
+            save("meta_timeout_secs", self._combo_number(self.txt_meta_timeout, float, 8.0))
+            save("meta_batch", self._combo_number(self.txt_meta_batch, int, 200))
+            save("auto_run_backfill_after_scan", self.chk_meta_auto.isChecked())
+
+        messages = [message for _, message in restart_notices]
+        if offer_restart:
+            messages.append(tr("preferences.video.restart_required_message"))
             reply = QMessageBox.question(
                 self,
                 tr("preferences.video.restart_required"),
-                tr("preferences.video.restart_required_message"),
+                "\n\n".join(messages),
                 QMessageBox.Yes | QMessageBox.No,
                 QMessageBox.Yes
             )
@@ -1170,75 +1443,54 @@ class PreferencesDialog(QDialog):
                 QProcess.startDetached(sys.executable, sys.argv)
                 QGuiApplication.quit()
                 return
-
-        # Advanced
-        self.settings.set("show_decoder_warnings", self.chk_decoder_warnings.isChecked())
-
-        if self.settings.get("show_decoder_warnings", False):
-            QMessageBox.information(
-                self,
-                tr("preferences.diagnostics.restart_required"),
-                tr("preferences.diagnostics.restart_required_message")
-            )
-        else:
-            QMessageBox.information(
-                self,
-                tr("preferences.diagnostics.restart_recommended"),
-                tr("preferences.diagnostics.restart_recommended_message")
-            )
-
-        self.settings.set("db_debug_logging", self.chk_db_debug.isChecked())
-        self.settings.set("show_sql_queries", self.chk_sql_echo.isChecked())
-
-        if self.chk_db_debug.isChecked():
-            print(tr("preferences.developer.developer_mode_enabled"))
-
-        # Metadata
-        self.settings.set("meta_workers", int(self.spin_workers.currentText()))
-        self.settings.set("meta_timeout_secs", float(self.txt_meta_timeout.currentText()))
-        self.settings.set("meta_batch", int(self.txt_meta_batch.currentText()))
-        self.settings.set("auto_run_backfill_after_scan", self.chk_meta_auto.isChecked())
+        elif restart_notices:
+            QMessageBox.information(self, restart_notices[0][0], "\n\n".join(messages))
 
         self.accept()
 
     def _has_changes(self) -> bool:
-        """Check if any settings have been modified."""
-        current = {
-            "skip_unchanged_photos": self.chk_skip.isChecked(),
-            "use_exif_for_date": self.chk_exif.isChecked(),
-            "dark_mode": self.chk_dark.isChecked(),
-            "language": self.cmb_language.currentData(),
-            "thumbnail_cache_enabled": self.chk_cache.isChecked(),
-            "cache_size_mb": int(self.cmb_cache_size.currentText()) if self.cmb_cache_size.currentText().isdigit() else 500,
-            "cache_auto_cleanup": self.chk_cache_cleanup.isChecked(),
-            "ignore_folders": [x.strip() for x in self.txt_ignore_folders.toPlainText().splitlines() if x.strip()],
-            "device_auto_refresh": self.chk_device_auto_refresh.isChecked(),
-            "insightface_model": self.cmb_insightface_model.currentData(),
-            "min_face_size": self.spin_min_face_size.value(),
-            "confidence_threshold": self.spin_confidence.value() / 100.0,
-            "clustering_eps": self.spin_cluster_eps.value() / 100.0,
-            "clustering_min_samples": self.spin_min_samples.value(),
-            "auto_cluster_after_scan": self.chk_auto_cluster.isChecked(),
-            "face_max_workers": self.spin_max_workers.value(),
-            "face_batch_size": self.spin_batch_size.value(),
-            "insightface_model_path": self.txt_model_path.text().strip(),
-            "ffprobe_path": self.txt_ffprobe_path.text().strip(),
-            "show_decoder_warnings": self.chk_decoder_warnings.isChecked(),
-            "db_debug_logging": self.chk_db_debug.isChecked(),
-            "show_sql_queries": self.chk_sql_echo.isChecked(),
-            "meta_workers": int(self.spin_workers.currentText()) if self.spin_workers.currentText().isdigit() else 4,
-            "meta_timeout_secs": float(self.txt_meta_timeout.currentText()) if self.txt_meta_timeout.currentText().replace('.', '').isdigit() else 8.0,
-            "meta_batch": int(self.txt_meta_batch.currentText()) if self.txt_meta_batch.currentText().isdigit() else 200,
-            "auto_run_backfill_after_scan": self.chk_meta_auto.isChecked(),
-        }
+        """Check if any settings have been modified, stopping at the first difference."""
+        if not self._dirty_sections:
+            return False
+
+        original = self.original_settings
+        checks = (
+            ("skip_unchanged_photos", lambda: self.chk_skip.isChecked()),
+            ("use_exif_for_date", lambda: self.chk_exif.isChecked()),
+            ("dark_mode", lambda: self.chk_dark.isChecked()),
+            ("language", lambda: self.cmb_language.currentData()),
+            ("thumbnail_cache_enabled", lambda: self.chk_cache.isChecked()),
+            ("cache_size_mb", lambda: self._combo_number(self.cmb_cache_size, int, 500)),
+            ("cache_auto_cleanup", lambda: self.chk_cache_cleanup.isChecked()),
+            ("ignore_folders", lambda: [s for line in self.txt_ignore_folders.toPlainText().splitlines() if (s := line.strip())]),
+            ("device_auto_refresh", lambda: self.chk_device_auto_refresh.isChecked()),
+            ("insightface_model", lambda: self.cmb_insightface_model.currentData()),
+            ("min_face_size", lambda: self.spin_min_face_size.value()),
+            ("confidence_threshold", lambda: self.spin_confidence.value() / 100.0),
+            ("clustering_eps", lambda: self.spin_cluster_eps.value() / 100.0),
+            ("clustering_min_samples", lambda: self.spin_min_samples.value()),
+            ("auto_cluster_after_scan", lambda: self.chk_auto_cluster.isChecked()),
+            ("face_max_workers", lambda: self.spin_max_workers.value()),
+            ("face_batch_size", lambda: self.spin_batch_size.value()),
+            ("insightface_model_path", lambda: self.txt_model_path.text().strip()),
+            ("ffprobe_path", lambda: self.txt_ffprobe_path.text().strip()),
+            ("show_decoder_warnings", lambda: self.chk_decoder_warnings.isChecked()),
+            ("db_debug_logging", lambda: self.chk_db_debug.isChecked()),
+            ("show_sql_queries", lambda: self.chk_sql_echo.isChecked()),
+            ("meta_workers", lambda: self._combo_number(self.spin_workers, int, 4)),
+            ("meta_timeout_secs", lambda: self._combo_number(self.txt_meta_timeout, float, 8.0)),
+            ("meta_batch", lambda: self._combo_number(self.txt_meta_batch, int, 200)),
+            ("auto_run_backfill_after_scan", lambda: self.chk_meta_auto.isChecked()),
+        )
 
-        return current != self.original_settings
+        for key, read in checks:
+            if read() != original[key]:
+                return True
+        return False
 
     def _browse_ffprobe(self):
         """Browse for ffprobe executable."""
-        import platform
-
-        if platform.system() == "Windows":
+        if _IS_WINDOWS:
             filter_str = "Executable Files (*.exe);;All Files (*.*)"
         else:
             filter_str = "All Files (*)"
@@ -1255,8 +1507,6 @@ class PreferencesDialog(QDialog):
 
     def _test_ffprobe(self):
         """Test ffprobe executable."""
-        import subprocess
-
         path = self.txt_ffprobe_path.text().strip()
         if not path:
             path = "ffprobe"  # Test system PATH
@@ -1309,9 +1559,6 @@ class PreferencesDialog(QDialog):
 
     def _test_model_path(self):
         """Test InsightFace model path."""
-        from PySide6.QtWidgets import QProgressDialog
-        from PySide6.QtCore import QThread, Signal
-
         path = self.txt_model_path.text().strip()
 
         if not path:
@@ -1336,21 +1583,6 @@ class PreferencesDialog(QDialog):
             return
 
         # Run comprehensive test
-        class TestThread(QThread):
-            finished_signal = Signal(bool, str)
-
-            def __init__(self, test_path):
-                super().__init__()
-                self.test_path = test_path
-
-            def run(self):
-                try:
-                    from utils.test_insightface_models import test_model_path
-                    success, message = test_model_path(self.test_path)
-                    self.finished_signal.emit(success, message)
-                except Exception as e:
-                    self.finished_signal.emit(False, f"Test error: {str(e)}")
-
         progress_dlg = QProgressDialog(
             "Testing InsightFace model loading...\nThis may take a moment...",
             None, 0, 0, self
@@ -1360,7 +1592,7 @@ class PreferencesDialog(QDialog):
         progress_dlg.setCancelButton(None)
         progress_dlg.setMinimumDuration(0)
 
-        test_thread = TestThread(path)
+        test_thread = _ModelTestThread(path, self)
 
         def on_test_finished(success, message):
             progress_dlg.close()
@@ -1392,86 +1624,43 @@ class PreferencesDialog(QDialog):
                     "❌ InsightFace library not installed\n"
                     "Install with: pip install insightface onnxruntime"
                 )
-                self.lbl_model_status.setStyleSheet(
-                    "QLabel { padding: 6px; background-color: #ffe0e0; border-radius: 4px; color: #d00; }"
-                )
+                self.lbl_model_status.setStyleSheet(_QSS_STATUS_ERROR)
                 self.btn_download_models.setEnabled(False)
             elif status['models_available']:
                 self.lbl_model_status.setText(
                     f"✅ Models installed and ready\n"
                     f"Location: {status['model_path']}"
                 )
-                self.lbl_model_status.setStyleSheet(
-                    "QLabel { padding: 6px; background-color: #e0ffe0; border-radius: 4px; color: #060; }"
-                )
+                self.lbl_model_status.setStyleSheet(_QSS_STATUS_OK)
                 self.btn_download_models.setEnabled(False)
             else:
                 self.lbl_model_status.setText(
                     "⚠️ Models not found\n"
                     "Click 'Download Models' to install buffalo_l face detection models"
                 )
-                self.lbl_model_status.setStyleSheet(
-                    "QLabel { padding: 6px; background-color: #fff4e0; border-radius: 4px; color: #840; }"
-                )
+                self.lbl_model_status.setStyleSheet(_QSS_STATUS_WARN)
                 self.btn_download_models.setEnabled(True)
         except Exception as e:
             self.lbl_model_status.setText(f"⚠️ Error checking status: {str(e)}")
-            self.lbl_model_status.setStyleSheet(
-                "QLabel { padding: 6px; background-color: #fff4e0; border-radius: 4px; color: #840; }"
-            )
+            self.lbl_model_status.setStyleSheet(_QSS_STATUS_WARN)
 
     def _download_models(self):
         """Download InsightFace models with progress dialog."""
-        from PySide6.QtWidgets import QProgressDialog
-        from PySide6.QtCore import QThread, Signal
-        import subprocess
-
-        class DownloadThread(QThread):
-            progress = Signal(str)
-            finished_signal = Signal(bool, str)
-
-            def run(self):
-                try:
-                    self.progress.emit("Initializing download...")
-
-                    # Run download_face_models.py script
-                    script_path = Path("download_face_models.py")
-                    if not script_path.exists():
-                        self.finished_signal.emit(False, "download_face_models.py not found")
-                        return
-
-                    self.progress.emit("Downloading buffalo_l models (~200MB)...")
-                    result = subprocess.run(
-                        [sys.executable, str(script_path)],
-                        capture_output=True,
-                        text=True,
-                        timeout=600  # 10 minute timeout
-                    )
-
-                    if result.returncode == 0:
-                        self.finished_signal.emit(True, "Models downloaded successfully!")
-                    else:
-                        error_msg = result.stderr or result.stdout or "Unknown error"
-                        self.finished_signal.emit(False, f"Download failed:\n{error_msg}")
-
-                except subprocess.TimeoutExpired:
-                    self.finished_signal.emit(False, "Download timed out (>10 minutes)")
-                except Exception as e:
-                    self.finished_signal.emit(False, f"Error: {str(e)}")
-
         progress_dlg = QProgressDialog("Downloading InsightFace models...", "Cancel", 0, 0, self)
         progress_dlg.setWindowTitle("Model Download")
         progress_dlg.setWindowModality(Qt.WindowModal)
-        progress_dlg.setCancelButton(None)  # Disable cancel during download
         progress_dlg.setMinimumDuration(0)
 
-        download_thread = DownloadThread()
+        download_thread = _ModelDownloadThread(self)
+        progress_dlg.canceled.connect(download_thread.cancel)
 
         def on_progress(msg):
             progress_dlg.setLabelText(msg)
 
         def on_finished(success, message):
             progress_dlg.close()
+            if download_thread.cancelled:
+                return
             if success:
                 QMessageBox.information(
                     self,
@@ -1496,49 +1685,118 @@ class PreferencesDialog(QDialog):
         progress_dlg.exec()
 
     def _show_cache_stats(self):
-        """Show thumbnail cache statistics."""
-        try:
-            from thumb_cache_db import get_cache
-            cache = get_cache()
-            stats = cache.get_stats()
+        """Show thumbnail cache statistics, collected off the GUI thread."""
+        if self._cache_stats and time.monotonic() - self._cache_stats_time < _CACHE_STATS_TTL:
+            self._display_cache_stats(self._cache_stats)
+            return
 
-            if "error" in stats:
-                QMessageBox.warning(self, "Thumbnail Cache Stats", f"Error: {stats['error']}")
-                return
+        progress_dlg = QProgressDialog("Collecting thumbnail cache statistics...", None, 0, 0, self)
+        progress_dlg.setWindowTitle("Thumbnail Cache Stats")
+        progress_dlg.setWindowModality(Qt.WindowModal)
+        progress_dlg.setCancelButton(None)
+        progress_dlg.setMinimumDuration(0)
 
-            msg = (
-                f"Entries: {stats['entries']}\n"
-                f"Size: {stats['size_mb']} MB\n"
-                f"Last Updated: {stats['last_updated']}\n"
-                f"Path: {stats['path']}"
-            )
-            QMessageBox.information(self, "Thumbnail Cache Stats", msg)
-        except Exception as e:
-            QMessageBox.warning(self, "Cache Stats", f"Error retrieving cache stats:\n{str(e)}")
+        stats_thread = _CacheStatsThread(self)
+
+        def on_done(stats):
+            progress_dlg.close()
+            if "error" not in stats:
+                self._cache_stats = stats
+                self._cache_stats_time = time.monotonic()
+            self._display_cache_stats(stats)
+
+        stats_thread.done.connect(on_done)
+        stats_thread.start()
+        progress_dlg.exec()
+
+    def _display_cache_stats(self, stats: dict):
+        """Show collected thumbnail cache statistics in a message box."""
+        if "error" in stats:
+            QMessageBox.warning(self, "Thumbnail Cache Stats", f"Error: {stats['error']}")
+            return
+
+        msg = (
+            f"Entries: {stats['entries']}\n"
+            f"Size: {stats['size_mb']} MB\n"
+            f"Last Updated: {stats['last_updated']}\n"
+            f"Path: {stats['path']}"
+        )
+        QMessageBox.information(self, "Thumbnail Cache Stats", msg)
 
     def _purge_cache(self):
-        """Purge old cache entries."""
-        try:
-            from thumb_cache_db import get_cache
-            cache = get_cache()
+        """Purge old cache entries off the GUI thread."""
+        reply = QMessageBox.question(
+            self,
+            "Purge Cache",
+            "Remove thumbnails older than 7 days?\n\nUse Compact Cache afterwards to shrink the file on disk.",
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.No
+        )
+        if reply != QMessageBox.Yes:
+            return
 
-            reply = QMessageBox.question(
-                self,
-                "Purge Cache",
-                "Remove thumbnails older than 7 days?\n\nThis will free up disk space.",
-                QMessageBox.Yes | QMessageBox.No,
-                QMessageBox.No
-            )
+        def purge():
+            from thumb_cache_db import get_cache
+            return get_cache().purge_stale(max_age_days=7)
 
-            if reply == QMessageBox.Yes:
-                cache.purge_stale(max_age_days=7)
+        def on_done(purged, error):
+            if error:
+                QMessageBox.warning(self, "Purge Cache", f"Error purging cache:\n{error}")
+            else:
                 QMessageBox.information(
                     self,
                     "Purge Complete",
-                    "Old thumbnails (older than 7 days) have been purged."
+                    f"Purged {purged} old thumbnails (older than 7 days)."
                 )
-        except Exception as e:
-            QMessageBox.warning(self, "Purge Cache", f"Error purging cache:\n{str(e)}")
+
+        self._run_cache_job("Purge Cache", "Removing old thumbnails...", purge, on_done)
+
+    def _compact_cache(self):
+        """VACUUM the thumbnail cache off the GUI thread."""
+        reply = QMessageBox.question(
+            self,
+            "Compact Cache",
+            "Compact the thumbnail cache file?\n\nThis can take a while on a large cache.",
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.No
+        )
+        if reply != QMessageBox.Yes:
+            return
+
+        def compact():
+            from thumb_cache_db import get_cache
+            return get_cache().compact()
+
+        def on_done(freed_mb, error):
+            if error:
+                QMessageBox.warning(self, "Compact Cache", f"Error compacting cache:\n{error}")
+            else:
+                QMessageBox.information(
+                    self,
+                    "Compact Complete",
+                    f"Reclaimed {freed_mb:.1f} MB of disk space."
+                )
+
+        self._run_cache_job("Compact Cache", "Compacting thumbnail cache...", compact, on_done)
+
+    def _run_cache_job(self, title: str, label: str, job, on_done):
+        """Run a thumbnail cache job on a worker thread behind a busy dialog."""
+        progress_dlg = QProgressDialog(label, None, 0, 0, self)
+        progress_dlg.setWindowTitle(title)
+        progress_dlg.setWindowModality(Qt.WindowModal)
+        progress_dlg.setCancelButton(None)
+        progress_dlg.setMinimumDuration(0)
+
+        job_thread = _CacheMaintenanceThread(job, self)
+
+        def finished(result, error):
+            progress_dlg.close()
+            self._cache_stats = None
+            on_done(result, error)
+
+        job_thread.done.connect(finished)
+        job_thread.start()
+        progress_dlg.exec()
 
     def _update_badge_preview(self):
         """Update the badge preview widget with current settings."""
@@ -16,11 +16,17 @@ import os, time
 import io
 import shutil
 import json
+import logging
 import argparse
 import traceback
 import warnings
+import itertools
 import threading
+import weakref
+from collections import Counter, defaultdict, deque
 from contextlib import contextmanager
+from operator import itemgetter
+from pathlib import Path
 
 from datetime import datetime
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -28,17 +34,518 @@ ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 
 from db_config import get_db_filename
 
+# Optional C-accelerated JSON for the blobs this module stores (face-merge
+# snapshots, export history). Output stays str so the TEXT columns and
+# json.loads() readers are unchanged.
+try:
+    import orjson
+
+    def _json_dumps(obj) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+except ImportError:
+    _json_dumps = json.dumps
+
 DB_FILE = get_db_filename()
 
+# Connection-level tuning applied once per pooled handle (sqlite has no global
+# equivalent). WAL is deliberately not enabled: the repository layer pins a
+# rollback journal, see repository.base_repository.DatabaseConnection. The
+# journal-dependent settings are applied in _open_pooled_connection().
+_CONNECTION_PRAGMAS = (
+    "PRAGMA foreign_keys = ON",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -65536",    # 64 MB page cache
+    "PRAGMA mmap_size = 268435456",  # 256 MB memory-mapped reads
+)
+
+# Columns added to photo_metadata by the ensure_* migrations, as (name, declaration)
+_META_STATUS_COLUMNS = (
+    ("metadata_status", "TEXT DEFAULT 'pending'"),
+    ("metadata_fail_count", "INTEGER DEFAULT 0"),
+)
+_CREATED_COLUMNS = (
+    ("created_ts", "INTEGER"),
+    ("created_date", "TEXT"),
+    ("created_year", "INTEGER"),
+)
+
+# post_ingest_optimize() samples its ANALYZE; at most once per this many
+# seconds it runs an unsampled pass instead
+_FULL_ANALYZE_INTERVAL = 24 * 3600
+_INGEST_TABLES = ("photo_metadata", "video_metadata", "photo_folders")
+
+# Queued match_audit rows (see flush_audit): written once this many are
+# waiting; past the hard cap the oldest are dropped, with a warning.
+_AUDIT_FLUSH_AT = 1_000
+_AUDIT_MAX_ROWS = 10_000
+
+# Keep photo_folders.photo_count equal to the folder's photo_metadata rows, so
+# folder counts are a primary-key lookup. Installed by
+# ReferenceDB.ensure_folder_photo_counts() (and by the repository schema).
+_FOLDER_PHOTO_COUNT_TRIGGERS = (
+    """CREATE TRIGGER IF NOT EXISTS trg_photo_metadata_count_ins
+    AFTER INSERT ON photo_metadata
+    BEGIN
+        UPDATE photo_folders SET photo_count = photo_count + 1 WHERE id = NEW.folder_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_photo_metadata_count_del
+    AFTER DELETE ON photo_metadata
+    BEGIN
+        UPDATE photo_folders SET photo_count = photo_count - 1 WHERE id = OLD.folder_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS trg_photo_metadata_count_move
+    AFTER UPDATE OF folder_id ON photo_metadata
+    WHEN OLD.folder_id IS NOT NEW.folder_id
+    BEGIN
+        UPDATE photo_folders SET photo_count = photo_count - 1 WHERE id = OLD.folder_id;
+        UPDATE photo_folders SET photo_count = photo_count + 1 WHERE id = NEW.folder_id;
+    END""",
+)
+
+# One branch's images, shared by get_project_images() and get_images_by_branch().
+_SQL_PROJECT_IMAGES_BY_BRANCH = "SELECT image_path FROM project_images WHERE project_id = ? AND branch_key = ?"
+
+# insert_or_update_photo() and insert_or_update_photos_many(): size in bytes
+# and mtime as a Unix timestamp (os.stat() values), stored as size_kb and
+# local-time modified text.
+_SQL_UPSERT_PHOTO = """
+    INSERT INTO photo_metadata (path, folder_id, project_id, size_kb, modified, width, height)
+    VALUES (?1, ?2, ?3, ?4 / 1024.0, datetime(?5, 'unixepoch', 'localtime'), ?6, ?7)
+    ON CONFLICT(path, project_id) DO UPDATE SET
+        folder_id = excluded.folder_id,
+        size_kb   = excluded.size_kb,
+        modified  = excluded.modified,
+        width     = excluded.width,
+        height    = excluded.height
+"""
+# mark_metadata_success() and mark_metadata_success_many().
+_SQL_MARK_META_SUCCESS = """
+    UPDATE photo_metadata
+    SET width = ?, height = ?, date_taken = ?, metadata_status = 'ok', metadata_fail_count = 0, updated_at = ?
+    WHERE path = ?
+"""
+# upsert_photo_metadata() and upsert_photo_metadata_many(): with/without the
+# created_* columns, and with/without extracted metadata (which also resets
+# metadata_status/metadata_fail_count).
+_SQL_UPSERT_META_CREATED_OK = """
+    INSERT INTO photo_metadata (path, folder_id, project_id, size_kb, modified, width, height, embedding, date_taken, tags, updated_at,
+                                created_ts, created_date, created_year, metadata_status, metadata_fail_count)
+    VALUES (?, ?, ?, ?, ?, ?, ?, NULL, ?, ?, ?, ?, ?, ?, 'ok', 0)
+    ON CONFLICT(path, project_id) DO UPDATE SET
+        folder_id = excluded.folder_id,
+        size_kb   = excluded.size_kb,
+        modified  = excluded.modified,
+        width     = excluded.width,
+        height    = excluded.height,
+        date_taken= excluded.date_taken,
+        tags      = excluded.tags,
+        updated_at= excluded.updated_at,
+        created_ts   = COALESCE(excluded.created_ts, created_ts),
+        created_date = COALESCE(excluded.created_date, created_date),
+        created_year = COALESCE(excluded.created_year, created_year),
+        metadata_status = CASE WHEN excluded.width IS NOT NULL OR excluded.date_taken IS NOT NULL THEN 'ok' ELSE metadata_status END,
+        metadata_fail_count = CASE WHEN excluded.width IS NOT NULL OR excluded.date_taken IS NOT NULL THEN 0 ELSE metadata_fail_count END
+"""
+_SQL_UPSERT_META_CREATED = """
+    INSERT INTO photo_metadata (path, folder_id, project_id, size_kb, modified, width, height, embedding, date_taken, tags, updated_at,
+                                created_ts, created_date, created_year)
+    VALUES (?, ?, ?, ?, ?, ?, ?, NULL, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(path, project_id) DO UPDATE SET
+        folder_id = excluded.folder_id,
+        size_kb   = excluded.size_kb,
+        modified  = excluded.modified,
+        width     = excluded.width,
+        height    = excluded.height,
+        date_taken= excluded.date_taken,
+        tags      = excluded.tags,
+        updated_at= excluded.updated_at,
+        created_ts   = COALESCE(excluded.created_ts, created_ts),
+        created_date = COALESCE(excluded.created_date, created_date),
+        created_year = COALESCE(excluded.created_year, created_year)
+"""
+_SQL_UPSERT_META_OK = """
+    INSERT INTO photo_metadata (path, folder_id, project_id, size_kb, modified, width, height, embedding, date_taken, tags, updated_at, metadata_status, metadata_fail_count)
+    VALUES (?, ?, ?, ?, ?, ?, ?, NULL, ?, ?, ?, 'ok', 0)
+    ON CONFLICT(path, project_id) DO UPDATE SET
+        folder_id = excluded.folder_id,
+        size_kb   = excluded.size_kb,
+        modified  = excluded.modified,
+        width     = excluded.width,
+        height    = excluded.height,
+        date_taken= excluded.date_taken,
+        tags      = excluded.tags,
+        updated_at= excluded.updated_at,
+        metadata_status = CASE WHEN excluded.width IS NOT NULL OR excluded.date_taken IS NOT NULL THEN 'ok' ELSE metadata_status END,
+        metadata_fail_count = CASE WHEN excluded.width IS NOT NULL OR excluded.date_taken IS NOT NULL THEN 0 ELSE metadata_fail_count END
+"""
+_SQL_UPSERT_META = """
+    INSERT INTO photo_metadata (path, folder_id, project_id, size_kb, modified, width, height, embedding, date_taken, tags, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, NULL, ?, ?, ?)
+    ON CONFLICT(path, project_id) DO UPDATE SET
+        folder_id = excluded.folder_id,
+        size_kb   = excluded.size_kb,
+        modified  = excluded.modified,
+        width     = excluded.width,
+        height    = excluded.height,
+        date_taken= excluded.date_taken,
+        tags      = excluded.tags,
+        updated_at= excluded.updated_at
+"""
+
+# Year and month counters of the sidebar date tree (count_for_year/month and
+# the video and media forms). They take a half-open [first day, first day
+# after) created_date pair from _year_range()/_month_range(), which the
+# planner bounds on both ends; project forms bind the project first.
+_SQL_COUNT_PHOTOS_RANGE_PROJECT = "SELECT COUNT(*) FROM photo_metadata WHERE project_id = ? AND created_date >= ? AND created_date < ?"
+_SQL_COUNT_PHOTOS_RANGE = "SELECT COUNT(*) FROM photo_metadata WHERE created_date >= ? AND created_date < ?"
+_SQL_COUNT_VIDEOS_RANGE_PROJECT = "SELECT COUNT(*) FROM video_metadata WHERE project_id = ? AND created_date >= ? AND created_date < ?"
+_SQL_COUNT_VIDEOS_RANGE = "SELECT COUNT(*) FROM video_metadata WHERE created_date >= ? AND created_date < ?"
+_SQL_COUNT_MEDIA_RANGE_PROJECT = """
+    SELECT
+        (SELECT COUNT(*) FROM photo_metadata WHERE project_id = ?1 AND created_date >= ?2 AND created_date < ?3)
+        +
+        (SELECT COUNT(*) FROM video_metadata WHERE project_id = ?1 AND created_date >= ?2 AND created_date < ?3)
+"""
+_SQL_COUNT_MEDIA_RANGE = """
+    SELECT
+        (SELECT COUNT(*) FROM photo_metadata WHERE created_date >= ?1 AND created_date < ?2)
+        +
+        (SELECT COUNT(*) FROM video_metadata WHERE created_date >= ?1 AND created_date < ?2)
+"""
+
+# Day-grid indexes (get_images_by_date, get_videos_by_date, get_media_by_date
+# with a project): equality on (project_id, created_date) followed by the
+# ORDER BY columns, so the rows come out of the index already sorted and the
+# path is read from the index itself. Keyed by the table they belong to.
+_DAY_GRID_INDEXES = {
+    "photo_metadata": "CREATE INDEX IF NOT EXISTS idx_photo_metadata_project_day "
+                      "ON photo_metadata(project_id, created_date, created_ts, path)",
+    "video_metadata": "CREATE INDEX IF NOT EXISTS idx_video_metadata_project_day "
+                      "ON video_metadata(project_id, created_date, created_ts, path)",
+}
+
+# Legacy schema used by ReferenceDB._ensure_db() when the repository layer is
+# unavailable. Executed as one script so the DDL is parsed and journaled once.
+_SCHEMA_SQL = """
+-- Reference images
+CREATE TABLE IF NOT EXISTS reference_entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    filepath TEXT NOT NULL UNIQUE,
+    label TEXT NOT NULL
+);
+
+-- Match audit logging
+CREATE TABLE IF NOT EXISTS match_audit (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    filename TEXT NOT NULL,
+    matched_label TEXT,
+    confidence REAL,
+    match_mode TEXT,
+    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Label thresholds
+CREATE TABLE IF NOT EXISTS reference_labels (
+    label TEXT PRIMARY KEY,
+    folder_path TEXT NOT NULL,
+    threshold REAL DEFAULT 0.3
+);
+
+-- Projects
+CREATE TABLE IF NOT EXISTS projects (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS branches (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    project_id INTEGER NOT NULL,
+    branch_key TEXT NOT NULL,
+    display_name TEXT NOT NULL,
+    FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE,
+    UNIQUE(project_id, branch_key)
+);
+
+CREATE TABLE IF NOT EXISTS project_images (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    project_id INTEGER NOT NULL,
+    branch_key TEXT,
+    image_path TEXT NOT NULL,
+    label TEXT,   -- optional label (face-based grouping)
+    FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE
+);
+
+-- Face crops (per-branch thumbnails; DB is the source of truth), with idempotent uniqueness
+CREATE TABLE IF NOT EXISTS face_crops (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    project_id INTEGER NOT NULL,
+    branch_key TEXT NOT NULL,
+    image_path TEXT NOT NULL,  -- original photo
+    crop_path  TEXT NOT NULL,  -- saved face-crop (thumbnail-sized OK)
+    is_representative INTEGER DEFAULT 0,
+    FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE,
+    UNIQUE(project_id, branch_key, crop_path)
+);
+
+CREATE INDEX IF NOT EXISTS idx_face_crops_proj ON face_crops(project_id);
+CREATE INDEX IF NOT EXISTS idx_face_crops_proj_branch ON face_crops(project_id, branch_key);
+CREATE INDEX IF NOT EXISTS idx_face_crops_proj_rep ON face_crops(project_id, is_representative);
+CREATE INDEX IF NOT EXISTS idx_face_crops_rep_only ON face_crops(project_id, is_representative, branch_key, crop_path) WHERE is_representative = 1;
+
+CREATE TABLE IF NOT EXISTS face_branch_reps (
+    project_id INTEGER NOT NULL,
+    branch_key TEXT NOT NULL,
+    label TEXT,
+    count INTEGER DEFAULT 0,
+    centroid BLOB,
+    rep_path TEXT,          -- path to chosen rep crop on disk
+    rep_thumb_png BLOB,     -- optional in-DB PNG
+    PRIMARY KEY (project_id, branch_key),
+    FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE
+);
+
+-- Face merge history (for undo)
+CREATE TABLE IF NOT EXISTS face_merge_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    project_id INTEGER NOT NULL,
+    target_branch TEXT NOT NULL,
+    source_branches TEXT NOT NULL,
+    snapshot TEXT NOT NULL,         -- JSON blob of pre-merge state
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS export_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    project_id INTEGER,
+    branch_key TEXT,
+    photo_count INTEGER,
+    source_paths TEXT,
+    dest_paths TEXT,
+    dest_folder TEXT,
+    timestamp TEXT
+);
+
+CREATE TABLE IF NOT EXISTS photo_folders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    path TEXT UNIQUE NOT NULL,
+    parent_id INTEGER NULL,
+    FOREIGN KEY(parent_id) REFERENCES photo_folders(id)
+);
+
+-- photo_metadata: metadata_status / metadata_fail_count columns at creation time for fresh DBs
+CREATE TABLE IF NOT EXISTS photo_metadata (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT UNIQUE NOT NULL,
+    folder_id INTEGER NOT NULL,
+    size_kb REAL,
+    modified TEXT,
+    width INTEGER,
+    height INTEGER,
+    embedding BLOB,
+    date_taken TEXT,
+    tags TEXT,
+    updated_at TEXT,
+    metadata_status TEXT DEFAULT 'pending',
+    metadata_fail_count INTEGER DEFAULT 0,
+    created_ts INTEGER,
+    created_date TEXT,
+    created_year INTEGER,
+    FOREIGN KEY(folder_id) REFERENCES photo_folders(id)
+);
+
+-- Tagging tables (normalized structure)
+CREATE TABLE IF NOT EXISTS tags (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT UNIQUE NOT NULL COLLATE NOCASE
+);
+
+CREATE TABLE IF NOT EXISTS photo_tags (
+    photo_id INTEGER NOT NULL,
+    tag_id   INTEGER NOT NULL,
+    PRIMARY KEY (photo_id, tag_id),
+    FOREIGN KEY (photo_id) REFERENCES photo_metadata(id) ON DELETE CASCADE,
+    FOREIGN KEY (tag_id) REFERENCES tags(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_tags_name ON tags(name);
+CREATE INDEX IF NOT EXISTS idx_photo_tags_photo ON photo_tags(photo_id);
+CREATE INDEX IF NOT EXISTS idx_photo_tags_tag ON photo_tags(tag_id);
+
+-- Folder hierarchy index for faster tree operations
+CREATE INDEX IF NOT EXISTS idx_folder_parent ON photo_folders(parent_id);
+
+CREATE INDEX IF NOT EXISTS idx_fbreps_proj ON face_branch_reps(project_id);
+CREATE INDEX IF NOT EXISTS idx_fbreps_proj_branch ON face_branch_reps(project_id, branch_key);
+
+CREATE INDEX IF NOT EXISTS idx_branches_project ON branches(project_id);
+CREATE INDEX IF NOT EXISTS idx_branches_key ON branches(project_id, branch_key);
+CREATE INDEX IF NOT EXISTS idx_projimgs_project ON project_images(project_id);
+CREATE INDEX IF NOT EXISTS idx_projimgs_branch ON project_images(project_id, branch_key);
+CREATE INDEX IF NOT EXISTS idx_projimgs_path ON project_images(image_path);
+CREATE INDEX IF NOT EXISTS idx_projimgs_project_path ON project_images(project_id, image_path);
+CREATE INDEX IF NOT EXISTS idx_projimgs_project_label ON project_images(project_id, label) WHERE label IS NOT NULL;
+"""
+
+# Run after the ADD COLUMN upgrade in _ensure_db(), since older databases may
+# lack some of these columns until then.
+_PHOTO_METADATA_INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS idx_meta_date      ON photo_metadata(date_taken);
+CREATE INDEX IF NOT EXISTS idx_meta_modified  ON photo_metadata(modified);
+CREATE INDEX IF NOT EXISTS idx_meta_updated   ON photo_metadata(updated_at);
+CREATE INDEX IF NOT EXISTS idx_meta_folder    ON photo_metadata(folder_id);
+CREATE INDEX IF NOT EXISTS idx_meta_status    ON photo_metadata(metadata_status);
+CREATE INDEX IF NOT EXISTS idx_meta_path      ON photo_metadata(path);
+CREATE INDEX IF NOT EXISTS idx_photo_created_year ON photo_metadata(created_year);
+CREATE INDEX IF NOT EXISTS idx_photo_created_date ON photo_metadata(created_date);
+CREATE INDEX IF NOT EXISTS idx_photo_created_ts   ON photo_metadata(created_ts);
+"""
+
+
+def _walk_files(root: str):
+    """
+    Top-down directory walk yielding (dir_path, [DirEntry of files]).
+
+    Like os.walk(), but hands back the os.scandir() entries themselves so
+    callers can use entry.stat() and entry.name without rebuilding paths.
+    Unreadable directories are skipped and directory symlinks are not
+    followed, matching os.walk() defaults.
+    """
+    try:
+        with os.scandir(root) as it:
+            entries = list(it)
+    except OSError:
+        return
+    files, subdirs = [], []
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif entry.is_file():
+                files.append(entry)
+        except OSError:
+            continue
+    yield root, files
+    for path in subdirs:
+        yield from _walk_files(path)
+
+
+_CREATED_DATETIME_FORMATS = (
+    "%Y:%m:%d %H:%M:%S",   # EXIF DateTimeOriginal
+    "%Y-%m-%d %H:%M:%S",
+    "%Y/%m/%d %H:%M:%S",
+    "%d.%m.%Y %H:%M:%S",
+    "%Y-%m-%d",
+)
+
+
+def _year_range(year) -> tuple[str, str] | None:
+    """Half-open created_date bounds of a year, or None if year is not a number."""
+    try:
+        y = int(year)
+    except (TypeError, ValueError):
+        return None
+    return (f"{y:04d}-01-01", f"{y + 1:04d}-01-01")
+
+
+def _month_range(year, month) -> tuple[str, str] | None:
+    """Half-open created_date bounds of a month, or None if either part is not a number."""
+    try:
+        y, m = int(year), int(month)
+    except (TypeError, ValueError):
+        return None
+    ny, nm = (y + 1, 1) if m == 12 else (y, m + 1)
+    return (f"{y:04d}-{m:02d}-01", f"{ny:04d}-{nm:02d}-01")
+
+
+def _parse_created_datetime(s: str | None) -> datetime | None:
+    """
+    Parse a date_taken/modified string in one of _CREATED_DATETIME_FORMATS.
+
+    The zero-padded "YYYY?MM?DD HH:MM:SS" shapes (EXIF, ISO, slashes) and a
+    bare "YYYY-MM-DD", i.e. nearly every value a scan writes, are sliced
+    directly; strptime is only the fallback for anything else.
+    """
+    if not s:
+        return None
+    n = len(s)
+    if n == 19 and s[4] in ":-/" and s[7] == s[4] and s[10] == " " and s[13] == ":" and s[16] == ":":
+        try:
+            return datetime(int(s[0:4]), int(s[5:7]), int(s[8:10]),
+                            int(s[11:13]), int(s[14:16]), int(s[17:19]))
+        except ValueError:
+            pass
+    elif n == 10 and s[4] == "-" and s[7] == "-":
+        try:
+            return datetime(int(s[0:4]), int(s[5:7]), int(s[8:10]))
+        except ValueError:
+            pass
+    for f in _CREATED_DATETIME_FORMATS:
+        try:
+            return datetime.strptime(s, f)
+        except ValueError:
+            pass
+    return None
+
+
+class _PooledConnection:
+    """
+    Per-thread slot holding a pooled connection.
+
+    The slot lives in thread-local storage, so it (and the connection) is
+    released when the owning thread exits. The pool registry only keeps weak
+    references, which sqlite3.Connection itself does not support.
+    """
+    __slots__ = ("conn", "generation", "__weakref__")
+
+    def __init__(self, conn, generation):
+        self.conn = conn
+        self.generation = generation
+
+
+class _ConnectionScope:
+    """
+    Context manager returned by ReferenceDB._connect(): hands out a pooled
+    connection and, when settle is set, commits it on a clean exit or rolls
+    it back on error. It never closes the connection. A plain class rather
+    than a @contextmanager generator, since every query goes through it.
+    """
+    __slots__ = ("conn", "settle")
+
+    def __init__(self, conn, settle):
+        self.conn = conn
+        self.settle = settle
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.settle:
+            if exc_type is None:
+                try:
+                    self.conn.commit()  # Auto-commit on successful context exit
+                except Exception:
+                    self.conn.rollback()
+                    raise
+            else:
+                self.conn.rollback()  # Auto-rollback on exception
+        return False
+
 
 class ReferenceDB:
     # CRITICAL FIX: Singleton pattern with thread-safe connection pooling
     # Prevents multiple instances creating separate connections
     _instance = None
     _lock = threading.Lock()
-    _connection_pool = {}
+    _connection_pool = weakref.WeakValueDictionary()  # thread id (or (id, "ro")) -> _PooledConnection
     _pool_lock = threading.Lock()
-    _max_pool_size = 10  # Maximum number of pooled connections
+    _pool_local = threading.local()
+    _pool_generation = 0  # bumped by close_all_connections() to retire cached handles
+    _schema_lock = threading.Lock()
+    _table_columns_cache = {}  # (db_file, table) -> frozenset of column names
     
     def __new__(cls, db_file=None):
         """
@@ -84,24 +591,18 @@ class ReferenceDB:
         import os
         self.db_file = os.path.abspath(db_file)
 
-        # NEW: Use repository layer for schema management
-        # This automatically handles schema creation and migrations
-        try:
-            from repository.base_repository import DatabaseConnection
-            self._db_connection = DatabaseConnection(self.db_file, auto_init=True)
-        except ImportError:
-            # Fallback for environments where repository layer isn't available
-            warnings.warn(
-                "Repository layer not available, falling back to legacy schema management. "
-                "This fallback will be removed in a future version.",
-                DeprecationWarning,
-                stacklevel=2
-            )
-            self._db_connection = None
-            self._ensure_db()  # Legacy fallback
-
-        # Lazy cache to know if created_* columns exist (None = unknown)
-        self._created_cols_present = None
+        # Schema management (repository layer) is deferred to the first
+        # connection, see _ensure_repo(), so constructing an unused instance
+        # costs neither the import nor the schema check.
+        self._db_connection = None
+        self._schema_ready = False
+        # Lowest project id, memoized by _get_or_create_default_project()
+        self._default_project_id: int | None = None
+        # time.monotonic() of the last unsampled ANALYZE, see post_ingest_optimize()
+        self._last_full_analyze = None
+        # match_audit rows for metadata failures, written by flush_audit()
+        self._audit_buf = deque(maxlen=_AUDIT_MAX_ROWS)
+        self._audit_lock = threading.Lock()
         
         # Mark as initialized
         self._initialized = True        
@@ -135,282 +636,79 @@ class ReferenceDB:
         # Full schema management should use repository.base_repository.DatabaseConnection
 
         conn = sqlite3.connect(self.db_file)
-        c = conn.cursor()
-
-        # Reference images
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS reference_entries (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                filepath TEXT NOT NULL UNIQUE,
-                label TEXT NOT NULL
-            )
-        ''')
-
-        # Match audit logging
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS match_audit (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                filename TEXT NOT NULL,
-                matched_label TEXT,
-                confidence REAL,
-                match_mode TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        # Label thresholds
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS reference_labels (
-                label TEXT PRIMARY KEY,
-                folder_path TEXT NOT NULL,
-                threshold REAL DEFAULT 0.3
-            )
-        ''')
-
-        # --- NEW TABLES: Projects ---
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS projects (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                folder TEXT NOT NULL,
-                mode TEXT NOT NULL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS branches (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                project_id INTEGER NOT NULL,
-                branch_key TEXT NOT NULL,
-                display_name TEXT NOT NULL,
-                FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE,
-                UNIQUE(project_id, branch_key)
-            )
-        ''')
-
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS project_images (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                project_id INTEGER NOT NULL,                
-                branch_key TEXT,
-                image_path TEXT NOT NULL,
-                label TEXT,   -- ✅ new: optional label (face-based grouping)
-                FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE
-            )
-        ''')
-
-        # --- face crops, with idempotent uniqueness ---
-        
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS face_crops (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                project_id INTEGER NOT NULL,
-                branch_key TEXT NOT NULL,
-                image_path TEXT NOT NULL,  -- original photo
-                crop_path  TEXT NOT NULL,  -- saved face-crop (thumbnail-sized OK)
-                is_representative INTEGER DEFAULT 0,
-                FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE,
-                UNIQUE(project_id, branch_key, crop_path)
-            )
-        ''')
-        
-
-        # --- MIGRATION: singular → plural table name if an older DB exists ---
-        # If 'face_crop' exists and 'face_crops' does not, rename it.
-        has_old = c.execute(
-            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='face_crop'"
-        ).fetchone()
-        has_new = c.execute(
-            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='face_crops'"
-        ).fetchone()
-        if has_old and not has_new:
-            c.execute("ALTER TABLE face_crop RENAME TO face_crops")
-
-
-        # --- Face crops (per-branch thumbnails; DB is the source of truth) ---
-
-        # helpful indexes
-        c.execute("CREATE INDEX IF NOT EXISTS idx_face_crops_proj ON face_crops(project_id)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_face_crops_proj_branch ON face_crops(project_id, branch_key)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_face_crops_proj_rep ON face_crops(project_id, is_representative)")
-
-        # --- NEW: reps table you already upsert into elsewhere ---
-        
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS face_branch_reps (
-                project_id INTEGER NOT NULL,
-                branch_key TEXT NOT NULL,
-                label TEXT,
-                count INTEGER DEFAULT 0,
-                centroid BLOB,
-                rep_path TEXT,          -- path to chosen rep crop on disk
-                rep_thumb_png BLOB,     -- optional in-DB PNG
-                PRIMARY KEY (project_id, branch_key),
-                FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE
-            )
-        ''')
-
-
-        # --------------------------------------------------
-        # Face merge history (for undo)
-        # --------------------------------------------------
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS face_merge_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                project_id INTEGER NOT NULL,
-                target_branch TEXT NOT NULL,
-                source_branches TEXT NOT NULL,
-                snapshot TEXT NOT NULL,         -- JSON blob of pre-merge state
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS export_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                project_id INTEGER,
-                branch_key TEXT,
-                photo_count INTEGER,
-                source_paths TEXT,
-                dest_paths TEXT,
-                dest_folder TEXT,
-                timestamp TEXT
-            )
-        ''')    
-                
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS photo_folders (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                path TEXT UNIQUE NOT NULL,
-                parent_id INTEGER NULL,
-                FOREIGN KEY(parent_id) REFERENCES photo_folders(id)
-            )
-        ''')
-       
-        # photo_metadata: add metadata_status / metadata_fail_count columns at creation time for fresh DBs.
-
-        c.execute('''
-            CREATE TABLE IF NOT EXISTS photo_metadata (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                path TEXT UNIQUE NOT NULL,
-                folder_id INTEGER NOT NULL,
-                size_kb REAL,
-                modified TEXT,
-                width INTEGER,
-                height INTEGER,
-                embedding BLOB,
-                date_taken TEXT,
-                tags TEXT,
-                updated_at TEXT,
-                metadata_status TEXT DEFAULT 'pending',
-                metadata_fail_count INTEGER DEFAULT 0,
-                created_ts INTEGER,
-                created_date TEXT,
-                created_year INTEGER,
-                FOREIGN KEY(folder_id) REFERENCES photo_folders(id)
-            )
-        ''')
-
-        # --- Tagging tables (new normalized structure) ---
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS tags (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT UNIQUE NOT NULL COLLATE NOCASE
-            )
-        """)
-
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS photo_tags (
-                photo_id INTEGER NOT NULL,
-                tag_id   INTEGER NOT NULL,
-                PRIMARY KEY (photo_id, tag_id),
-                FOREIGN KEY (photo_id) REFERENCES photo_metadata(id) ON DELETE CASCADE,
-                FOREIGN KEY (tag_id) REFERENCES tags(id) ON DELETE CASCADE
-        )
-        """)
+        try:
+            # --- MIGRATION: singular → plural table name if an older DB exists ---
+            # Must run before the schema script, which would create an empty face_crops.
+            has_old = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='face_crop'"
+            ).fetchone()
+            has_new = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='face_crops'"
+            ).fetchone()
+            if has_old and not has_new:
+                conn.execute("ALTER TABLE face_crop RENAME TO face_crops")
+                conn.commit()
 
-        # Helpful indexes
-        c.execute("CREATE INDEX IF NOT EXISTS idx_tags_name ON tags(name)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_photo_tags_photo ON photo_tags(photo_id)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_photo_tags_tag ON photo_tags(tag_id)")
-
-        # --- Add missing columns dynamically if upgrading from older schema ---
-        existing_cols = [r[1] for r in c.execute("PRAGMA table_info(photo_metadata)")]
-        wanted_cols = {
-            "size_kb": "REAL",
-            "modified": "TEXT",
-            "embedding": "BLOB",
-            "date_taken": "TEXT",
-            "tags": "TEXT",
-            "updated_at": "TEXT",
-            "metadata_status": "TEXT DEFAULT 'pending'",
-            "metadata_fail_count": "INTEGER DEFAULT 0",
-            "created_ts": "INTEGER",
-            "created_date": "TEXT",
-            "created_year": "INTEGER",
-        }
-        for col, col_type in wanted_cols.items():
-            if col not in existing_cols:
+            # All tables and their indexes: one parse, one journal cycle
+            conn.executescript("BEGIN IMMEDIATE;\n" + _SCHEMA_SQL + "\nCOMMIT;")
+
+            # --- Add missing columns dynamically if upgrading from older schema ---
+            c = conn.cursor()
+            existing_cols = [r[1] for r in c.execute("PRAGMA table_info(photo_metadata)")]
+            wanted_cols = {
+                "size_kb": "REAL",
+                "modified": "TEXT",
+                "embedding": "BLOB",
+                "date_taken": "TEXT",
+                "tags": "TEXT",
+                "updated_at": "TEXT",
+                "metadata_status": "TEXT DEFAULT 'pending'",
+                "metadata_fail_count": "INTEGER DEFAULT 0",
+                "created_ts": "INTEGER",
+                "created_date": "TEXT",
+                "created_year": "INTEGER",
+            }
+            missing = [(col, col_type) for col, col_type in wanted_cols.items() if col not in existing_cols]
+            if missing:
+                # One schema rewrite for all missing columns instead of one per ALTER
+                alters = "".join(
+                    f"ALTER TABLE photo_metadata ADD COLUMN {col} {col_type};\n" for col, col_type in missing
+                )
                 try:
-                    # Some SQLite versions don't accept column default expressions with ALTER TABLE, so split
-                    if col == "metadata_fail_count":
-                        c.execute(f"ALTER TABLE photo_metadata ADD COLUMN {col} INTEGER DEFAULT 0")
-                    elif col == "metadata_status":
-                        c.execute(f"ALTER TABLE photo_metadata ADD COLUMN {col} TEXT DEFAULT 'pending'")
-                    else:
-                        c.execute(f"ALTER TABLE photo_metadata ADD COLUMN {col} {col_type}")
-                except Exception:
-                    # best-effort: ignore if it fails (older DB locked, etc.)
-                    pass
-                    
-#                c.execute(f"ALTER TABLE photo_metadata ADD COLUMN {col} {col_type}")
-
-
-        # helpful indexes for date & metadata
-        c.execute("CREATE INDEX IF NOT EXISTS idx_meta_date      ON photo_metadata(date_taken)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_meta_modified  ON photo_metadata(modified)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_meta_updated   ON photo_metadata(updated_at)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_meta_folder    ON photo_metadata(folder_id)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_meta_status    ON photo_metadata(metadata_status)")
-
-        # PERFORMANCE: Add path index for faster lookups (photo existence checks, tag operations)
-        c.execute("CREATE INDEX IF NOT EXISTS idx_meta_path ON photo_metadata(path)")
-
-        # indexes for created_* columns (used for date-based navigation)
-        c.execute("CREATE INDEX IF NOT EXISTS idx_photo_created_year ON photo_metadata(created_year)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_photo_created_date ON photo_metadata(created_date)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_photo_created_ts ON photo_metadata(created_ts)")
-
-        # PERFORMANCE: Add folder hierarchy index for faster tree operations
-        c.execute("CREATE INDEX IF NOT EXISTS idx_folder_parent ON photo_folders(parent_id)")
-
-        c.execute("CREATE INDEX IF NOT EXISTS idx_fbreps_proj ON face_branch_reps(project_id)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_fbreps_proj_branch ON face_branch_reps(project_id, branch_key)")
-        
-
-
-        # ---- helpful indexes (no-op if already present) ----
-        c.execute("CREATE INDEX IF NOT EXISTS idx_branches_project ON branches(project_id)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_branches_key ON branches(project_id, branch_key)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_projimgs_project ON project_images(project_id)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_projimgs_branch ON project_images(project_id, branch_key)")
-        c.execute("CREATE INDEX IF NOT EXISTS idx_projimgs_path ON project_images(image_path)")
-        
-        
-        conn.commit()
-        conn.close()
+                    conn.executescript("BEGIN IMMEDIATE;\n" + alters + "COMMIT;")
+                except sqlite3.Error:
+                    # best-effort: retry column by column, ignoring failures (older DB locked, etc.)
+                    if conn.in_transaction:
+                        conn.rollback()
+                    for col, col_type in missing:
+                        try:
+                            c.execute(f"ALTER TABLE photo_metadata ADD COLUMN {col} {col_type}")
+                        except sqlite3.Error:
+                            pass
+                    conn.commit()
+
+            # photo_metadata indexes reference columns the loop above may have just added
+            conn.executescript("BEGIN IMMEDIATE;\n" + _PHOTO_METADATA_INDEX_SQL + "\nCOMMIT;")
+        finally:
+            conn.close()
 
     # --- Safe connection wrapper with pooling ---
-    @contextmanager
-    def _connect(self):
+    def _connect(self, read_only: bool = False):
         """
         CRITICAL FIX: Thread-safe connection pooling.
         
         Provides a context-managed database connection from the connection pool.
         Connections are reused across queries to minimize overhead and prevent
-        connection proliferation.
+        connection proliferation. Each thread keeps its handle in thread-local
+        storage, so repeat calls skip both the pool lock and a reconnect.
+
+        With read_only=True the thread's second, reader handle is used instead
+        (opened with mode=ro), so pure lookups never take the write lock and
+        keep their own warm page cache. It has nothing to commit, so exiting
+        the block costs nothing.
+
+        Inside a bulk() block the writer handle neither commits nor rolls
+        back on exit; bulk() settles the whole transaction once.
         
         Usage:
             with self._connect() as conn:
@@ -421,54 +719,177 @@ class ReferenceDB:
             sqlite3.Connection: A connection from the pool with foreign keys enabled
                                and Row factory configured.
         """
-        thread_id = threading.get_ident()
-        conn = None
-        
-        with self._pool_lock:
-            # Try to get existing connection for this thread
-            if thread_id in self._connection_pool:
-                conn = self._connection_pool[thread_id]
-                
-                # Verify connection is still valid
-                try:
-                    conn.execute("SELECT 1")
-                except sqlite3.Error:
-                    # Connection is broken, remove it and create new one
-                    try:
-                        conn.close()
-                    except sqlite3.Error as e:
-                        # BUG-H6 FIX: Log connection close failures
-                        print(f"[ReferenceDB] Failed to close broken connection: {e}")
-                    conn = None
-                    del self._connection_pool[thread_id]
-        
-        # Create new connection if needed
-        if conn is None:
-            conn = sqlite3.connect(self.db_file, check_same_thread=False)
-            conn.execute("PRAGMA foreign_keys = ON")
-            conn.row_factory = sqlite3.Row  # Always return dict-like rows
-            
-            with self._pool_lock:
-                # Clean up pool if it's too large
-                if len(self._connection_pool) >= self._max_pool_size:
-                    # Remove oldest connection (simple FIFO eviction)
-                    oldest_thread = next(iter(self._connection_pool))
-                    try:
-                        self._connection_pool[oldest_thread].close()
-                    except sqlite3.Error as e:
-                        # BUG-H6 FIX: Log pool cleanup failures
-                        print(f"[ReferenceDB] Failed to close pooled connection: {e}")
-                    del self._connection_pool[oldest_thread]
-                
-                # Add new connection to pool
-                self._connection_pool[thread_id] = conn
-        
+        # Hot path: the calling thread's cached handle, no lock and no probe query
+        attr = "ro_slot" if read_only else "slot"
+        slot = getattr(self._pool_local, attr, None)
+        if slot is None or slot.generation != ReferenceDB._pool_generation:
+            slot = self._open_pooled_connection(read_only)
+        settle = not read_only and not getattr(self._pool_local, "bulk_depth", 0)
+        return _ConnectionScope(slot.conn, settle)
+
+    @contextmanager
+    def bulk(self):
+        """
+        Run a series of writes on the calling thread as one transaction:
+
+            with db.bulk():
+                for ...:
+                    folder_id = db.ensure_folder(...)
+                    db.upsert_photo_metadata(...)
+
+        The write lock is taken once (BEGIN IMMEDIATE) and the batch is
+        committed once on exit, or rolled back if the block raises. Nested
+        bulk() blocks join the outer one. Methods that commit explicitly
+        still end the batch early, and reads on the read-only handle do not
+        see the batch until it commits.
+        """
+        depth = getattr(self._pool_local, "bulk_depth", 0)
+        if depth:
+            self._pool_local.bulk_depth = depth + 1
+            try:
+                yield self
+            finally:
+                self._pool_local.bulk_depth = depth
+            return
+        with self._connect() as conn:
+            self._begin_immediate(conn)
+            self._pool_local.bulk_depth = 1
+            self._pool_local.bulk_stamp = time.strftime("%Y-%m-%d %H:%M:%S")
+            try:
+                yield self
+            finally:
+                self._pool_local.bulk_depth = 0
+                self._pool_local.bulk_stamp = None
+
+    def _updated_at(self) -> str:
+        """
+        updated_at text for a write: the current local time, or inside bulk()
+        the one stamp taken when the batch began, so a batch carries a single
+        value and pays for one strftime.
+        """
+        return getattr(self._pool_local, "bulk_stamp", None) or time.strftime("%Y-%m-%d %H:%M:%S")
+
+    @staticmethod
+    def _begin_immediate(conn) -> None:
+        """Take the write lock up front, unless already inside a transaction (e.g. bulk())."""
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+
+    def _table_columns(self, conn, table: str) -> frozenset:
+        """
+        Column names of table, probed with PRAGMA table_info once per database.
+        Call _invalidate_table_columns() after altering the table.
+        """
+        key = (self.db_file, table)
+        cols = self._table_columns_cache.get(key)
+        if cols is None:
+            cols = frozenset(r[1] for r in conn.execute(f"PRAGMA table_info({table})"))
+            self._table_columns_cache[key] = cols
+        return cols
+
+    def _invalidate_table_columns(self, table: str | None = None) -> None:
+        """Forget cached column probes for table (or every table when None)."""
+        for key in list(self._table_columns_cache):
+            if table is None or key[1] == table:
+                self._table_columns_cache.pop(key, None)
+
+    @staticmethod
+    def _analyze_tables(conn, *tables: str) -> None:
+        """
+        Refresh planner statistics (sqlite_stat1) for tables after bulk changes.
+        analysis_limit turns each ANALYZE into a sampled pass, so this stays
+        cheap on large libraries.
+        """
+        conn.execute("PRAGMA analysis_limit = 400")
         try:
-            yield conn
-            conn.commit()  # Auto-commit on successful context exit
-        except Exception:
-            conn.rollback()  # Auto-rollback on exception
-            raise
+            for table in tables:
+                conn.execute(f"ANALYZE {table}")
+        finally:
+            conn.execute("PRAGMA analysis_limit = 0")
+
+    def post_ingest_optimize(self) -> None:
+        """
+        Refresh planner statistics after a scan has written a batch of rows.
+
+        Without fresh sqlite_stat1 rows the planner keeps choosing indexes by
+        the pre-scan shape of the tables (e.g. for list_years_with_counts).
+        The ANALYZE is sampled except for one full pass per
+        _FULL_ANALYZE_INTERVAL; PRAGMA optimize then covers any other table
+        whose stats have drifted.
+        """
+        now = time.monotonic()
+        full = self._last_full_analyze is None or now - self._last_full_analyze >= _FULL_ANALYZE_INTERVAL
+        with self._connect() as conn:
+            tables = [t for t in _INGEST_TABLES if self._table_columns(conn, t)]
+            if full:
+                for table in tables:
+                    conn.execute(f"ANALYZE {table}")
+                self._last_full_analyze = now
+            else:
+                self._analyze_tables(conn, *tables)
+            conn.execute("PRAGMA optimize")
+
+    def _ensure_repo(self):
+        """
+        Set up the repository-layer DatabaseConnection on first use.
+
+        This automatically handles schema creation and migrations before the
+        first pooled connection touches the database.
+        """
+        if self._schema_ready:
+            return
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            try:
+                from repository.base_repository import DatabaseConnection
+                self._db_connection = DatabaseConnection(self.db_file, auto_init=True)
+            except ImportError:
+                # Fallback for environments where repository layer isn't available
+                warnings.warn(
+                    "Repository layer not available, falling back to legacy schema management. "
+                    "This fallback will be removed in a future version.",
+                    DeprecationWarning,
+                    stacklevel=2
+                )
+                self._db_connection = None
+                self._ensure_db()  # Legacy fallback
+            self._schema_ready = True
+
+    def _open_pooled_connection(self, read_only: bool = False):
+        """Open the calling thread's connection and register it in the pool."""
+        self._ensure_repo()
+        if read_only:
+            uri = Path(self.db_file).resolve().as_uri() + "?mode=ro"
+            conn = sqlite3.connect(uri, timeout=5.0, check_same_thread=False,
+                                   cached_statements=256, uri=True)
+        else:
+            conn = sqlite3.connect(self.db_file, timeout=5.0, check_same_thread=False,
+                                   cached_statements=256)
+        for pragma in _CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0].lower()
+        if journal_mode == "wal":
+            # Halving fsyncs is only crash-safe under WAL; keep FULL for rollback journals
+            conn.execute("PRAGMA synchronous = NORMAL")
+            # Fewer, larger checkpoints during scans and backfills (~40 MB of WAL)
+            conn.execute("PRAGMA wal_autocheckpoint = 10000")
+        elif journal_mode == "delete" and not read_only:
+            # Same rollback journal and locking as DELETE, but a commit truncates
+            # the journal file instead of deleting and re-creating it
+            conn.execute("PRAGMA journal_mode = TRUNCATE")
+        if not read_only:
+            # Cheap on open: only re-analyzes tables whose stats are missing
+            # or have drifted, sampling at most 2000 rows per index
+            conn.execute("PRAGMA optimize = 0x10002")
+        conn.row_factory = sqlite3.Row  # Always return dict-like rows
+
+        key = (threading.get_ident(), "ro") if read_only else threading.get_ident()
+        with self._pool_lock:
+            slot = _PooledConnection(conn, ReferenceDB._pool_generation)
+            self._connection_pool[key] = slot
+        setattr(self._pool_local, "ro_slot" if read_only else "slot", slot)
+        return slot
     
     @classmethod
     def close_all_connections(cls):
@@ -477,16 +898,40 @@ class ReferenceDB:
         
         Call this method when the application is shutting down to ensure
         all database connections are properly closed.
+
+        Before the first handle goes, PRAGMA optimize(0x12) refreshes planner
+        statistics for every table that needs them (time-bounded ANALYZE), so
+        the next session picks the composite indexes. Queued match_audit
+        rows (see flush_audit) are written first.
         """
+        instance = cls._instance
+        if instance is not None and getattr(instance, "_initialized", False):
+            instance.flush_audit()
         with cls._pool_lock:
-            for thread_id, conn in list(cls._connection_pool.items()):
+            count = 0
+            optimized = False
+            for thread_id, slot in list(cls._connection_pool.items()):
+                if not optimized:
+                    try:
+                        slot.conn.execute("PRAGMA optimize(0x12)")
+                        optimized = True
+                    except sqlite3.Error as e:
+                        print(f"[ReferenceDB] PRAGMA optimize skipped: {e}")
                 try:
-                    conn.close()
+                    slot.conn.close()
+                    count += 1
                     print(f"[ReferenceDB] Closed connection for thread {thread_id}")
                 except Exception as e:
                     print(f"[ReferenceDB] Warning: Failed to close connection for thread {thread_id}: {e}")
             cls._connection_pool.clear()
-            print(f"[ReferenceDB] All {len(cls._connection_pool)} connections closed")
+            # Threads still holding a slot from the old generation reconnect lazily
+            ReferenceDB._pool_generation += 1
+            cls._table_columns_cache.clear()
+            print(f"[ReferenceDB] All {count} connections closed")
+
+    def close(self):
+        """Optimize and close every pooled connection (see close_all_connections)."""
+        self.close_all_connections()
         
 
     # ---- New lightweight helpers for UI (fast SQL-backed) ----
@@ -496,43 +941,37 @@ class ReferenceDB:
         Returns 0 if none found.
         """
         with self._connect() as conn:
-            cur = conn.cursor()
-            cur.execute("""
-                SELECT COUNT(*) FROM project_images
-                WHERE project_id = ? AND branch_key = ?
-            """, (project_id, branch_key))
-            row = cur.fetchone()
+            row = conn.execute("SELECT COUNT(*) FROM project_images WHERE project_id = ? AND branch_key = ?", (project_id, branch_key)).fetchone()
             return int(row[0]) if row and row[0] is not None else 0
 
-    def get_all_folders(self, project_id: int | None = None) -> list[dict]:
+    def get_all_folders(self, project_id: int | None = None) -> list[sqlite3.Row]:
         """
-        Return all folders as list of dicts: {id, parent_id, path, name}.
+        Return all folders as sqlite3.Row objects keyed by id, parent_id, path, name.
+        Rows support row["id"] like a dict; call dict(row) where a real dict is needed.
 
         Args:
             project_id: Filter folders by project_id (Schema v3.0.0 direct column filtering).
                        If None, returns all folders globally (backward compatibility).
 
         Returns:
-            List of folder dicts with keys: id, parent_id, path, name
+            List of folder rows with keys: id, parent_id, path, name
 
         Note: Schema v3.0.0 uses direct project_id column in photo_folders table.
               This is much faster than v2.0.0's junction table approach.
         """
         with self._connect() as conn:
-            cur = conn.cursor()
             if project_id is not None:
                 # Schema v3.0.0: Direct project_id column filtering
-                cur.execute("""
+                return conn.execute("""
                     SELECT id, parent_id, path, name
                     FROM photo_folders
                     WHERE project_id = ?
                     ORDER BY parent_id IS NOT NULL, parent_id, name
-                """, (project_id,))
-            else:
-                # No filter - return all folders globally (backward compatibility)
-                cur.execute("SELECT id, parent_id, path, name FROM photo_folders ORDER BY parent_id IS NOT NULL, parent_id, name")
-            rows = [{"id": r[0], "parent_id": r[1], "path": r[2], "name": r[3]} for r in cur.fetchall()]
-        return rows
+                """, (project_id,)).fetchall()
+            # No filter - return all folders globally (backward compatibility)
+            return conn.execute(
+                "SELECT id, parent_id, path, name FROM photo_folders ORDER BY parent_id IS NOT NULL, parent_id, name"
+            ).fetchall()
 
     def count_for_folder(self, folder_id: int, project_id: int | None = None) -> int:
         """
@@ -547,49 +986,112 @@ class ReferenceDB:
 
         Note: Schema v3.0.0 uses direct project_id column in photo_metadata table.
         """
-        with self._connect() as conn:
-            cur = conn.cursor()
+        with self._connect(read_only=True) as conn:
+            return self._folder_photo_count(conn, folder_id, project_id)
+
+    def _folder_photo_count(self, conn, folder_id: int, project_id: int | None) -> int:
+        """
+        Photo count of one folder: the trigger-maintained photo_folders.photo_count
+        when the database has it, otherwise COUNT(*) over photo_metadata.
+        """
+        if "photo_count" in self._table_columns(conn, "photo_folders"):
             if project_id is not None:
-                # Schema v3.0.0: Filter by project_id
-                cur.execute("SELECT COUNT(*) FROM photo_metadata WHERE folder_id = ? AND project_id = ?", (folder_id, project_id))
+                row = conn.execute("SELECT photo_count FROM photo_folders WHERE id = ? AND project_id = ?", (folder_id, project_id)).fetchone()
             else:
-                # No project filter
-                cur.execute("SELECT COUNT(*) FROM photo_metadata WHERE folder_id = ?", (folder_id,))
-            row = cur.fetchone()
-            return int(row[0]) if row and row[0] is not None else 0
+                row = conn.execute("SELECT photo_count FROM photo_folders WHERE id = ?", (folder_id,)).fetchone()
+        elif project_id is not None:
+            # Schema v3.0.0: Filter by project_id
+            row = conn.execute("SELECT COUNT(*) FROM photo_metadata WHERE folder_id = ? AND project_id = ?", (folder_id, project_id)).fetchone()
+        else:
+            # No project filter
+            row = conn.execute("SELECT COUNT(*) FROM photo_metadata WHERE folder_id = ?", (folder_id,)).fetchone()
+        return int(row[0]) if row and row[0] is not None else 0
 
     # ======================================================
     #           REFERENCE ENTRIES
     # ======================================================
 
-    def rebuild_date_index(self, progress_cb=None):
+    def rebuild_date_index(self, progress_cb=None, chunk_size: int = 10000) -> int:
         """
-        Rebuild or refresh the date index used for date branches.
-        Optionally calls progress_cb(percentage) to report progress.
+        Rebuild created_ts / created_date / created_year from date_taken (or
+        modified, when date_taken is empty) for every photo, in SQL, one id
+        range of chunk_size at a time. Dates SQLite cannot parse (e.g.
+        "DD.MM.YYYY HH:MM:SS") go through _parse_created_datetime() instead;
+        rows whose date neither can parse keep their current values, and rows
+        already up to date are not rewritten.
+        Optionally calls progress_cb(percentage) after each chunk that moves the
+        integer percentage.
+        Returns the number of rows updated.
         """
         with self._connect() as conn:
-            cur = conn.cursor()
-            # Count total photos
-            total = cur.execute("SELECT COUNT(*) FROM photo_metadata").fetchone()[0]
-            if total == 0:
-                if progress_cb:
-                    progress_cb(100)
-                return
-
-            # Simple loop over photos to (re)index dates
-            done = 0
-            for row in cur.execute("SELECT id, capture_date FROM photo_metadata"):
-                photo_id, date_str = row
-                # --- place your actual date indexing logic here ---
-                # e.g. insert/update into a date index table
-                # (if you already have one, you can just skip this step)
-                done += 1
-                if progress_cb and total:
-                    progress_cb(int(done * 100 / total))
-
-            conn.commit()
+            lo, hi = conn.execute("SELECT MIN(id), MAX(id) FROM photo_metadata").fetchone()
+        if lo is None:
             if progress_cb:
                 progress_cb(100)
+            return 0
+
+        # EXIF-style "YYYY:MM:DD ..." and "YYYY/MM/DD ..." normalized to the ISO form
+        # SQLite's date functions accept; anything else yields NULL. modified is
+        # only the source when there is no date_taken, so an unparsable
+        # date_taken never lets the file time overwrite its created_* values.
+        iso = "datetime(replace(replace(substr({col}, 1, 10), ':', '-'), '/', '-') || substr({col}, 11, 9))"
+        dt = (f"CASE WHEN date_taken IS NULL OR date_taken = '' THEN {iso.format(col='modified')} "
+              f"ELSE {iso.format(col='date_taken')} END")
+        # created_ts is a local-time epoch like datetime.timestamp() in
+        # _normalize_created_fields(); unchanged rows fail the IS NOT test
+        sql = f"""
+            UPDATE photo_metadata
+            SET created_ts = src.ts, created_date = src.d, created_year = src.y
+            FROM (
+                SELECT id,
+                       CAST(strftime('%s', dt, 'utc') AS INTEGER) AS ts,
+                       date(dt) AS d,
+                       CAST(strftime('%Y', dt) AS INTEGER) AS y
+                FROM (SELECT id, {dt} AS dt FROM photo_metadata WHERE id BETWEEN ? AND ?)
+                WHERE dt IS NOT NULL
+            ) AS src
+            WHERE photo_metadata.id = src.id
+              AND (created_ts IS NOT src.ts OR created_date IS NOT src.d OR created_year IS NOT src.y)
+        """
+        # The rows the statement above skipped because SQLite could not parse their date
+        leftovers_sql = f"""
+            SELECT id, date_taken, modified, created_ts, created_date, created_year
+            FROM photo_metadata
+            WHERE id BETWEEN ? AND ?
+              AND {dt} IS NULL
+              AND COALESCE(NULLIF(date_taken, ''), NULLIF(modified, '')) IS NOT NULL
+        """
+
+        span = hi - lo + 1
+        updated = 0
+        last_pct = -1
+        for start in range(lo, hi + 1, chunk_size):
+            # Short write transaction per chunk so readers aren't blocked for the whole rebuild
+            with self._connect() as conn:
+                bounds = (start, start + chunk_size - 1)
+                updated += conn.execute(sql, bounds).rowcount
+                fixes = []
+                for row_id, taken, modified, *current in conn.execute(leftovers_sql, bounds):
+                    t = _parse_created_datetime(taken or modified)
+                    if t is None:
+                        continue
+                    new = (int(t.timestamp()), f"{t.year:04d}-{t.month:02d}-{t.day:02d}", t.year)
+                    if tuple(current) != new:
+                        fixes.append((*new, row_id))
+                if fixes:
+                    updated += conn.executemany(
+                        "UPDATE photo_metadata SET created_ts = ?, created_date = ?, created_year = ? WHERE id = ?",
+                        fixes,
+                    ).rowcount
+            # Only report whole-percent changes; small chunks would otherwise repeat values
+            pct = min(100, (start + chunk_size - lo) * 100 // span)
+            if progress_cb and pct != last_pct:
+                progress_cb(pct)
+                last_pct = pct
+
+        if progress_cb and last_pct != 100:
+            progress_cb(100)
+        return updated
 
 
     def merge_face_branches(self, project_id, src_branch, target_branch, keep_label=None):
@@ -599,6 +1101,8 @@ class ReferenceDB:
         Returns number of faces moved.
         """
         with self._connect() as conn:
+            # Take the write lock up front: one lock acquisition for the whole merge
+            self._begin_immediate(conn)
             cur = conn.cursor()
 
             # Update face_crops table - move all faces from source to target
@@ -643,7 +1147,8 @@ class ReferenceDB:
 
             conn.commit()
             cur.close()
-            print(f"✅ merge_face_branches: moved {moved} faces from {src_branch} → {target_branch} (project {project_id})")
+            self.logger.debug("merge_face_branches: moved %d faces from %s -> %s (project %s)",
+                              moved, src_branch, target_branch, project_id)
             return moved
 
 
@@ -653,30 +1158,33 @@ class ReferenceDB:
         Handles both legacy branches and face clusters.
         """
         with self._connect() as conn:
-            cur = conn.cursor()
+            self._begin_immediate(conn)
 
             # Delete from legacy tables
-            cur.execute("DELETE FROM branches WHERE project_id=? AND branch_key=?", (project_id, branch_key))
-            cur.execute("DELETE FROM project_images WHERE project_id=? AND branch_key=?", (project_id, branch_key))
+            conn.execute("DELETE FROM branches WHERE project_id=? AND branch_key=?", (project_id, branch_key))
+            conn.execute("DELETE FROM project_images WHERE project_id=? AND branch_key=?", (project_id, branch_key))
 
             # Delete from face detection tables
-            cur.execute("DELETE FROM face_crops WHERE project_id=? AND branch_key=?", (project_id, branch_key))
-            cur.execute("DELETE FROM face_branch_reps WHERE project_id=? AND branch_key=?", (project_id, branch_key))
+            conn.execute("DELETE FROM face_crops WHERE project_id=? AND branch_key=?", (project_id, branch_key))
+            conn.execute("DELETE FROM face_branch_reps WHERE project_id=? AND branch_key=?", (project_id, branch_key))
 
             conn.commit()
-            cur.close()
-            print(f"🗑️ delete_branch: removed branch '{branch_key}' from project {project_id}")
+            self.logger.debug("delete_branch: removed branch '%s' from project %s", branch_key, project_id)
 
  
     def insert_reference(self, filepath, label):
+        self.insert_references_bulk([(filepath, label)])
+
+    def insert_references_bulk(self, rows):
+        """Insert or replace (filepath, label) pairs in one transaction."""
         try:
             with self._connect() as conn:
-                conn.execute(
+                conn.executemany(
                     "INSERT OR REPLACE INTO reference_entries (filepath, label) VALUES (?, ?)",
-                    (filepath, label)
+                    rows
                 )
         except Exception as e:
-            print(f"[DB ERROR] insert_reference failed: {e}")
+            print(f"[DB ERROR] insert_references_bulk failed: {e}")
 
     def get_all_references(self):
         with self._connect() as conn:
@@ -687,35 +1195,61 @@ class ReferenceDB:
             conn.execute("DELETE FROM reference_entries WHERE filepath = ?", (filepath,))
             
             
+    @staticmethod
+    def _existing_files(paths):
+        """
+        Return the subset of paths that are existing files.
+
+        Paths are grouped by parent directory and each directory is listed once
+        with os.scandir, instead of one stat() per path.
+        """
+        by_dir = defaultdict(list)
+        for path in paths:
+            parent, name = os.path.split(path)
+            by_dir[parent].append((path, name))
+
+        found = set()
+        for parent, entries in by_dir.items():
+            try:
+                with os.scandir(parent or ".") as it:
+                    files = {os.path.normcase(e.name) for e in it if e.is_file()}
+            except OSError:
+                continue  # directory gone or unreadable: none of its files exist
+            found.update(path for path, name in entries if os.path.normcase(name) in files)
+        return found
+
     def get_all_references_existing(self):
         """Return only references whose files still exist."""
         rows = self.get_all_references()
-        existing = [r for r in rows if os.path.isfile(r[2])]
-        return existing
+        found = self._existing_files(r[2] for r in rows)
+        return [r for r in rows if r[2] in found]
 
     def purge_missing_references(self) -> int:
         """Delete reference entries whose files no longer exist. Returns count removed."""
         rows = self.get_all_references()
-        removed = 0
-        with self._connect() as conn:
-            for _id, label, path in rows:
-                if not os.path.isfile(path):
-                    conn.execute("DELETE FROM reference_entries WHERE id = ?", (_id,))
-                    removed += 1
-        return removed
+        found = self._existing_files(r[2] for r in rows)
+        missing_ids = [(_id,) for _id, label, path in rows if path not in found]
+        if missing_ids:
+            with self._connect() as conn:
+                conn.executemany("DELETE FROM reference_entries WHERE id = ?", missing_ids)
+        return len(missing_ids)
 
     # ======================================================
     #           MATCH AUDIT
     # ======================================================
     def log_match_result(self, filename, label, score, match_mode=None):
+        self.log_match_results_bulk([(filename, label, score, match_mode)])
+
+    def log_match_results_bulk(self, rows):
+        """Log (filename, label, score, match_mode) tuples in one transaction."""
         try:
             with self._connect() as conn:
-                conn.execute(
+                conn.executemany(
                     "INSERT INTO match_audit (filename, matched_label, confidence, match_mode) VALUES (?, ?, ?, ?)",
-                    (filename, label, score, match_mode)
+                    rows
                 )
         except Exception as e:
-            print(f"[DB ERROR] log_match_result failed: {e}")
+            print(f"[DB ERROR] log_match_results_bulk failed: {e}")
 
     # ======================================================
     #           LABELS
@@ -735,20 +1269,20 @@ class ReferenceDB:
             return [row[0] for row in conn.execute("SELECT DISTINCT label FROM reference_labels")]
 
     def get_all_label_metadata(self):
+        """Return sqlite3.Row objects keyed by label, folder, threshold."""
         with self._connect() as conn:
-            cur = conn.execute("SELECT label, folder_path, threshold FROM reference_labels")
-            return [{"label": row[0], "folder": row[1], "threshold": row[2]} for row in cur.fetchall()]
+            return conn.execute(
+                "SELECT label, folder_path AS folder, threshold FROM reference_labels"
+            ).fetchall()
 
     def get_label_folder(self, label: str):
         with self._connect() as conn:
-            cur = conn.execute("SELECT folder_path FROM reference_labels WHERE label = ?", (label,))
-            row = cur.fetchone()
+            row = conn.execute("SELECT folder_path FROM reference_labels WHERE label = ?", (label,)).fetchone()
             return row[0] if row else None
 
     def get_threshold_for_label(self, label: str) -> float:
         with self._connect() as conn:
-            cur = conn.execute("SELECT threshold FROM reference_labels WHERE label = ?", (label,))
-            row = cur.fetchone()
+            row = conn.execute("SELECT threshold FROM reference_labels WHERE label = ?", (label,)).fetchone()
             return row[0] if row else 0.3
 
     def set_threshold_for_label(self, label: str, threshold: float):
@@ -782,6 +1316,8 @@ class ReferenceDB:
     def delete_project(self, project_id: int):
         with self._connect() as conn:
             conn.execute("DELETE FROM projects WHERE id = ?", (project_id,))
+        if self._default_project_id == project_id:
+            self._default_project_id = None
 
     # ======================================================
     #           BRANCHES
@@ -790,17 +1326,15 @@ class ReferenceDB:
     def create_branch(self, project_id: int, branch_key: str, display_name: str) -> int:
         """Create a branch if it doesn't exist already. Returns branch ID."""
         with self._connect() as conn:
-            cur = conn.cursor()
             # check if it already exists
-            cur.execute(
+            row = conn.execute(
                 "SELECT id FROM branches WHERE project_id = ? AND branch_key = ?",
                 (project_id, branch_key)
-            )
-            row = cur.fetchone()
+            ).fetchone()
             if row:
                 return row[0]  # ✅ already exists — don't reinsert
 
-            cur.execute(
+            cur = conn.execute(
                 '''
                 INSERT INTO branches (project_id, branch_key, display_name)
                 VALUES (?, ?, ?)
@@ -821,15 +1355,21 @@ class ReferenceDB:
         """
         out = []
         with self._connect() as conn:
-            cur = conn.execute(
-                "SELECT branch_key, display_name FROM branches WHERE project_id = ? ORDER BY branch_key",
-                (project_id,)
-            )
-            rows = [{"branch_key": r[0], "display_name": r[1]} for r in cur.fetchall()]
+            # Branches plus the "All Photos" total in one round-trip. The total row
+            # has a NULL branch_key, so it sorts first. Schema v3.0.0: path is
+            # UNIQUE per project, so COUNT(*) equals the old COUNT(DISTINCT path).
+            fetched = conn.execute(
+                """
+                SELECT branch_key, display_name, NULL FROM branches WHERE project_id = ?
+                UNION ALL
+                SELECT NULL, NULL, COUNT(*) FROM photo_metadata WHERE project_id = ?
+                ORDER BY 1
+                """,
+                (project_id, project_id)
+            ).fetchall()
 
-            # Get total photo count for "All Photos" - Schema v3.0.0: filter by project_id
-            cur.execute("SELECT COUNT(DISTINCT path) FROM photo_metadata WHERE project_id = ?", (project_id,))
-            total_count = cur.fetchone()[0]
+        total_count = fetched[0][2]
+        rows = [{"branch_key": r[0], "display_name": r[1]} for r in fetched[1:]]
 
         # ensure 'all' exists and is first, with count
         has_all = any(r["branch_key"] == "all" for r in rows)
@@ -856,25 +1396,32 @@ class ReferenceDB:
 
     def delete_branches_for_project(self, project_id: int, prefix: str = "face_"):
         """Delete all branches (and associated project_images) for a project that start with a given prefix."""
+        if not prefix:
+            raise ValueError("prefix must not be empty")
+        # Prefix as a half-open key range [prefix, next_prefix): both DELETEs become a
+        # range scan on their (project_id, branch_key) index. LIKE would also treat
+        # the "_" in "face_" as a wildcard.
+        next_prefix = prefix[:-1] + chr(ord(prefix[-1]) + 1)
         with self._connect() as conn:
             # delete project_images for those branches
             conn.execute(
                 '''
-                DELETE FROM project_images 
-                WHERE project_id = ? AND branch_key LIKE ?
+                DELETE FROM project_images
+                WHERE project_id = ? AND branch_key >= ? AND branch_key < ?
                 ''',
-                (project_id, f"{prefix}%")
+                (project_id, prefix, next_prefix)
             )
             # delete branches themselves
             conn.execute(
                 '''
-                DELETE FROM branches 
-                WHERE project_id = ? AND branch_key LIKE ?
+                DELETE FROM branches
+                WHERE project_id = ? AND branch_key >= ? AND branch_key < ?
                 ''',
-                (project_id, f"{prefix}%")
+                (project_id, prefix, next_prefix)
             )
             conn.commit()
-        print(f"🗑️ Deleted face branches with prefix '{prefix}' for project {project_id}")
+        self.logger.debug("delete_branches_for_project: deleted branches with prefix '%s' for project %s",
+                          prefix, project_id)
 
     # ======================================================
     #           PROJECT IMAGES
@@ -882,10 +1429,14 @@ class ReferenceDB:
     
     # --- Accept Label
     def add_project_image(self, project_id: int, image_path: str, branch_key: str = None, label: str = None) -> int:
-        """Insert an image into a branch for a project. Supports optional face label."""
+        """
+        Insert an image into a branch for a project. Supports optional face label.
+
+        Single-row path that returns the new row id; code inserting many
+        images should use add_project_images_iter() instead.
+        """
         with self._connect() as conn:
-            cur = conn.cursor()
-            cur.execute(
+            cur = conn.execute(
                 '''
                 INSERT INTO project_images (project_id, image_path, branch_key, label)
                 VALUES (?, ?, ?, ?)
@@ -907,49 +1458,31 @@ class ReferenceDB:
         CRITICAL FIX: 'all' is now treated as a specific branch, not "return everything".
         This prevents count inflation (e.g., showing 554 instead of 298).
         """
-        with self._connect() as conn:
-            cur = conn.cursor()
-
+        with self._connect(read_only=True) as conn:
             # 🟢 Case 1: No branch specified - return all UNIQUE images
+            # (DISTINCT is read in order off idx_projimgs_project_path, no temp B-tree)
             if branch_key is None:
-                cur.execute(
-                    "SELECT DISTINCT image_path FROM project_images WHERE project_id = ?",
-                    (project_id,)
-                )
-                rows = cur.fetchall()
-                paths = [row[0] for row in rows]
-                return paths
+                rows = conn.execute("SELECT DISTINCT image_path FROM project_images WHERE project_id = ?", (project_id,))
+                return [row[0] for row in rows]
 
             # 🟢 Case 2: 'all' branch - filter specifically for branch_key='all'
             # CRITICAL: This is the fix for count inflation bug
             if branch_key == "all" or branch_key == "__ALL__":
-                cur.execute(
-                    "SELECT image_path FROM project_images WHERE project_id = ? AND branch_key = ?",
-                    (project_id, 'all')
-                )
-                rows = cur.fetchall()
-                paths = [row[0] for row in rows]
-                return paths
+                rows = conn.execute(_SQL_PROJECT_IMAGES_BY_BRANCH, (project_id, 'all'))
+                return [row[0] for row in rows]
 
             # 🟠 Case 3: exact branch_key match (date-based or face_x)
-            cur.execute(
-                "SELECT image_path FROM project_images WHERE project_id = ? AND branch_key = ?",
-                (project_id, branch_key)
-            )
-            rows = cur.fetchall()
-            if rows:
-                paths = [row[0] for row in rows]
-                return paths
-
             # 🔎 Case 4: fallback — maybe user clicked "Person A" which is a label, not a branch_key
-            cur.execute(
-                "SELECT image_path FROM project_images WHERE project_id = ? AND label = ?",
-                (project_id, branch_key)
-            )
-            rows = cur.fetchall()
+            # Both cases in one round trip; the label arm only runs when no branch matched.
+            rows = conn.execute("""
+                SELECT image_path FROM project_images WHERE project_id = ?1 AND branch_key = ?2
+                UNION ALL
+                SELECT image_path FROM project_images
+                WHERE project_id = ?1 AND label = ?2
+                  AND NOT EXISTS (SELECT 1 FROM project_images WHERE project_id = ?1 AND branch_key = ?2)
+            """, (project_id, branch_key)).fetchall()
             if rows:
-                paths = [row[0] for row in rows]
-                return paths
+                return [row[0] for row in rows]
 
             # ❌ Nothing found
             self.logger.debug(f"No images found for branch or label '{branch_key}' (project={project_id})")
@@ -1027,20 +1560,35 @@ class ReferenceDB:
         return new_id
 
 
+    def add_project_images_iter(self, project_id: int, image_paths, branch_key: str = None,
+                                label: str = None, chunk_size: int = 1000) -> int:
+        """
+        Insert images from any iterable (e.g. a generator) into a branch.
+
+        Paths are consumed lazily in chunks of chunk_size, each written with
+        one executemany; all chunks share a single transaction. Duplicates
+        are ignored. Returns the number of rows actually inserted.
+        """
+        inserted = 0
+        it = iter(image_paths)
+        with self._connect() as conn:
+            while True:
+                chunk = [(project_id, path, branch_key, label)
+                         for path in itertools.islice(it, chunk_size)]
+                if not chunk:
+                    break
+                inserted += conn.executemany("""
+                    INSERT OR IGNORE INTO project_images (project_id, image_path, branch_key, label)
+                    VALUES (?, ?, ?, ?)
+                """, chunk).rowcount
+        return inserted
+
+
     def add_project_images_bulk(self, project_id: int, image_paths: list, branch_key: str = None, label: str = None):
         """Insert many images into a branch efficiently. Ignores duplicates."""
         if not image_paths:
             return 0
-        with self._connect() as conn:
-            cur = conn.cursor()
-            cur.executemany(
-                '''
-                INSERT OR IGNORE INTO project_images (project_id, image_path, branch_key, label)
-                VALUES (?, ?, ?, ?)
-                ''',
-                [(project_id, path, branch_key, label) for path in image_paths]
-            )
-            conn.commit()
+        self.add_project_images_iter(project_id, image_paths, branch_key, label)
         print(f"📸 Bulk-inserted {len(image_paths)} images into branch '{branch_key}' (label={label}) for project {project_id}")
         return len(image_paths)
 
@@ -1076,7 +1624,7 @@ class ReferenceDB:
             cur.execute("""
                 SELECT branch_key, label, count, centroid, rep_path, rep_thumb_png
                 FROM face_branch_reps
-                WHERE project_id=?
+                WHERE project_id = ?
                 ORDER BY branch_key ASC
             """, (project_id,))
             rows = cur.fetchall()
@@ -1093,6 +1641,37 @@ class ReferenceDB:
             return result
 
 
+    def get_face_branch_centroids(self, project_id: int, min_count: int = 0):
+        """
+        Decode every stored branch centroid of a project into one float32 matrix.
+
+        Returns (reps, centroids): reps[i] is a dict (branch_key, label, count)
+        describing row i of centroids, an (N, D) numpy array, so callers can
+        score all branches with a single matrix product instead of decoding
+        bytes per branch. Branches with fewer than min_count faces, and blobs
+        whose size does not match the common embedding width, are skipped.
+        """
+        import numpy as np
+
+        with self._connect(read_only=True) as con:
+            rows = con.execute("""
+                SELECT branch_key, label, count, centroid
+                FROM face_branch_reps
+                WHERE project_id = ? AND centroid IS NOT NULL AND COALESCE(count, 0) >= ?
+                ORDER BY branch_key ASC
+            """, (project_id, min_count)).fetchall()
+
+        sizes = Counter(len(r[3]) for r in rows if r[3] and len(r[3]) % 4 == 0)
+        if not sizes:
+            return [], np.empty((0, 0), dtype=np.float32)
+        width = sizes.most_common(1)[0][0]
+        rows = [r for r in rows if r[3] and len(r[3]) == width]
+
+        reps = [{"branch_key": r[0], "label": r[1], "count": r[2] or 0} for r in rows]
+        centroids = np.frombuffer(b"".join(bytes(r[3]) for r in rows), dtype=np.float32)
+        return reps, centroids.reshape(len(rows), width // 4)
+
+
     # ======================================================
     #           FACE CROPS / REPRESENTATIVES    
     # ---------- FACE CROP HELPERS (PATH-BASED) ----------
@@ -1103,18 +1682,19 @@ class ReferenceDB:
             con.execute("DELETE FROM face_crops WHERE project_id = ?", (project_id,))
 
 
-    def add_face_crops_bulk(self, project_id: int, rows: list[tuple]) -> None:
+    def add_face_crops_bulk(self, project_id: int, rows) -> None:
         """
         rows: (branch_key, image_path, crop_path, is_representative: bool/int)
         Idempotent thanks to UNIQUE(project_id, branch_key, crop_path).
+        Any iterable works, including a generator: it is streamed into one
+        executemany inside one bulk() transaction, never copied into a list.
         """
-        if not rows:
-            return
-        with self._connect() as con:
-            con.executemany("""
+        params = ((project_id, b, p, c, int(rep)) for (b, p, c, rep) in rows)
+        with self.bulk(), self._connect() as conn:
+            conn.executemany("""
                 INSERT OR IGNORE INTO face_crops (project_id, branch_key, image_path, crop_path, is_representative)
                 VALUES (?, ?, ?, ?, ?)
-            """, [(project_id, b, p, c, int(rep)) for (b, p, c, rep) in rows])
+            """, params)
 
 
     def get_face_branch_summary(self, project_id: int) -> list[dict]:
@@ -1122,37 +1702,33 @@ class ReferenceDB:
         Return face-branch rows with a representative crop if present.
         Looks first in face_crops (is_representative=1), then falls back to
         face_branch_reps.rep_path if the first is missing.
-        """
-        sql = """
-        WITH reps AS (
-            SELECT branch_key, crop_path
-            FROM face_crops
-            WHERE project_id = ? AND is_representative = 1
-        ),
-        reps_fallback AS (
-            SELECT branch_key, rep_path AS crop_path
-            FROM face_branch_reps
-            WHERE project_id = ?
-        ),
-        counts AS (
-            SELECT branch_key, COUNT(*) AS cnt
-            FROM face_crops
-            WHERE project_id = ?
-            GROUP BY branch_key
-        )
-        SELECT b.branch_key,
-               b.display_name,
-               COALESCE(r.crop_path, rf.crop_path) AS rep_crop,
-               COALESCE(c.cnt, 0) AS face_count
-        FROM branches b
-        LEFT JOIN reps r          ON r.branch_key  = b.branch_key
-        LEFT JOIN reps_fallback rf ON rf.branch_key = b.branch_key
-        LEFT JOIN counts c        ON c.branch_key  = b.branch_key
-        WHERE b.project_id = ? AND b.branch_key LIKE 'face_%'
-        ORDER BY b.branch_key;
-        """
-        with self._connect() as con:
-            cur = con.execute(sql, (project_id, project_id, project_id, project_id))
+
+        Each per-branch lookup is a correlated subquery answered by an index
+        seek (idx_face_crops_rep_only, the face_branch_reps primary key,
+        idx_face_crops_proj_branch) instead of materializing whole-project
+        CTEs over face_crops twice.
+        """
+        with self._connect(read_only=True) as con:
+            # Face branches are the key range ['face_', 'face`') ('`' follows '_'),
+            # which seeks the (project_id, branch_key) index; LIKE 'face_%' cannot,
+            # and it also treats '_' as a wildcard.
+            cur = con.execute("""
+                SELECT b.branch_key,
+                       b.display_name,
+                       COALESCE(
+                           (SELECT fc.crop_path FROM face_crops fc
+                            WHERE fc.project_id = ?1 AND fc.is_representative = 1
+                              AND fc.branch_key = b.branch_key
+                            LIMIT 1),
+                           (SELECT r.rep_path FROM face_branch_reps r
+                            WHERE r.project_id = ?1 AND r.branch_key = b.branch_key)
+                       ) AS rep_crop,
+                       (SELECT COUNT(*) FROM face_crops fc
+                        WHERE fc.project_id = ?1 AND fc.branch_key = b.branch_key) AS face_count
+                FROM branches b
+                WHERE b.project_id = ?1 AND b.branch_key >= 'face_' AND b.branch_key < 'face`'
+                ORDER BY b.branch_key
+            """, (project_id,))
             return [{
                 "branch_key": row[0],
                 "display_name": row[1],
@@ -1166,7 +1742,9 @@ class ReferenceDB:
         with self._connect() as con:
             con.execute("DELETE FROM face_crops WHERE project_id=?", (project_id,))
             con.execute("DELETE FROM face_branch_reps WHERE project_id=?", (project_id,))
-            con.execute("DELETE FROM branches WHERE project_id=? AND branch_key LIKE 'face_%'", (project_id,))
+            con.execute("DELETE FROM branches WHERE project_id=? AND branch_key >= 'face_' AND branch_key < 'face`'",
+                        (project_id,))
+            self._analyze_tables(con, "face_crops", "face_branch_reps", "branches")
             con.commit()
         print(f"🧹 Reset all face data for project {project_id}.")
 
@@ -1205,37 +1783,42 @@ class ReferenceDB:
         Moves all reference_entries and (optionally) project-related entries.
         If project_id is provided, also merges project_images / face_crops / face_branch_reps.
         """
-        if not source_labels:
+        sources = [src for src in source_labels if src != target_label]
+        if not sources:
             return
+        # All source labels travel as one JSON array; each statement below
+        # expands it with json_each(), so the statement count is fixed.
+        params = (target_label, _json_dumps(sources), project_id)
         with self._connect() as conn:
-            for src in source_labels:
-                if src == target_label:
-                    continue
+            # --- Global reference tables ---
+            conn.execute(
+                "UPDATE reference_entries SET label = ?1 "
+                "WHERE label IN (SELECT value FROM json_each(?2))", params[:2]
+            )
+            conn.execute(
+                "DELETE FROM reference_labels WHERE label IN (SELECT value FROM json_each(?2))",
+                params[:2]
+            )
 
-                # --- Global reference tables ---
+            # --- Project-scoped tables (optional) ---
+            if project_id is not None:
+                # Update label fields in project_images
                 conn.execute(
-                    "UPDATE reference_entries SET label = ? WHERE label = ?",
-                    (target_label, src)
+                    "UPDATE project_images SET label = ?1 "
+                    "WHERE project_id = ?3 AND label IN (SELECT value FROM json_each(?2))", params
+                )
+                # Update face_crops branch names
+                conn.execute(
+                    "UPDATE face_crops SET branch_key = 'face_' || ?1 "
+                    "WHERE project_id = ?3 AND branch_key IN (SELECT 'face_' || value FROM json_each(?2))",
+                    params
+                )
+                # Remove old representative branch rows
+                conn.execute(
+                    "DELETE FROM face_branch_reps "
+                    "WHERE project_id = ?3 AND branch_key IN (SELECT 'face_' || value FROM json_each(?2))",
+                    params
                 )
-                conn.execute("DELETE FROM reference_labels WHERE label = ?", (src,))
-
-                # --- Project-scoped tables (optional) ---
-                if project_id is not None:
-                    # Update label fields in project_images
-                    conn.execute(
-                        "UPDATE project_images SET label = ? WHERE project_id = ? AND label = ?",
-                        (target_label, project_id, src)
-                    )
-                    # Update face_crops branch names
-                    conn.execute(
-                        "UPDATE face_crops SET branch_key = ? WHERE project_id = ? AND branch_key = ?",
-                        (f'face_{target_label}', project_id, f'face_{src}')
-                    )
-                    # Remove old representative branch rows
-                    conn.execute(
-                        "DELETE FROM face_branch_reps WHERE project_id = ? AND branch_key = ?",
-                        (project_id, f'face_{src}')
-                    )
             conn.commit()
 
 
@@ -1249,31 +1832,38 @@ class ReferenceDB:
 
 
     def log_export_action(self, project_id, branch_key, count, source_paths, dest_paths, dest_folder):
-        """Archive export action in DB (minimal)."""
-        import json, datetime
-        ts = datetime.datetime.now().isoformat()
-        with self._connect() as conn:
-            conn.execute("""
-                INSERT INTO export_history (project_id, branch_key, photo_count, source_paths, dest_paths, dest_folder, timestamp)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-        """, (
+        """
+        Archive export action in DB (minimal).
+
+        Path lists are encoded before the write lock is taken, so a large
+        export holds the database only for the INSERT itself.
+        """
+        row = (
             project_id,
             branch_key,
             count,
-            json.dumps(source_paths),
-            json.dumps(dest_paths),
+            _json_dumps(list(source_paths)),
+            _json_dumps(list(dest_paths)),
             dest_folder,
-            ts
-        ))
-        conn.commit()
+            datetime.now().isoformat(),
+        )
+        with self._connect() as conn:
+            conn.execute("""
+                INSERT INTO export_history (project_id, branch_key, photo_count, source_paths, dest_paths, dest_folder, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, row)
 
 
-    def scan_repository(self, repo_path: str, project_id: int = None):
+    def scan_repository(self, repo_path: str, project_id: int = None, batch_size: int = 1000):
         """Recursively scan a photo repo and index in photo_folders and photo_metadata.
 
+        The whole walk runs in one write transaction; photo rows are upserted
+        with executemany in batches of batch_size.
+
         Args:
             repo_path: Path to repository to scan
             project_id: Project ID (uses default if None)
+            batch_size: Photo rows buffered per executemany call
         """
         repo = Path(repo_path).resolve()
         if not repo.exists():
@@ -1285,52 +1875,68 @@ class ReferenceDB:
 
         supported_ext = {'.jpg', '.jpeg', '.png', '.webp', '.heic', '.tif', '.tiff'}
 
-        def get_or_create_folder(conn, folder_path: Path):
-            parent_id = None
-            parent = folder_path.parent if folder_path.parent != folder_path else None
-            if parent and parent.exists():
-                cur = conn.cursor()
-                cur.execute("SELECT id FROM photo_folders WHERE path=? AND project_id=?", (str(parent), project_id))
-                prow = cur.fetchone()
-                if prow:
-                    parent_id = prow[0]
-                else:
-                    parent_id = get_or_create_folder(conn, parent)
-
-            cur = conn.cursor()
-            cur.execute("SELECT id FROM photo_folders WHERE path=? AND project_id=?", (str(folder_path), project_id))
-            row = cur.fetchone()
+        # path -> folder id for every folder seen so far. The walk is top-down,
+        # so a folder's parent is always resolved before the folder itself.
+        folder_id_by_path: dict[str, int] = {}
+
+        # ?5 is the file's integer mtime (Unix epoch). SQLite renders it as the
+        # local-time "YYYY-MM-DD HH:MM:SS" text the modified column has always
+        # held. created_* stay NULL so the created_* backfill dates the row, from
+        # date_taken once metadata is read. Unchanged files match the conflict
+        # target but fail the WHERE, so a re-scan writes no page for them.
+        upsert_sql = """
+            INSERT INTO photo_metadata (path, folder_id, project_id, size_kb, modified, width, height, embedding, tags, updated_at)
+            VALUES (?1, ?2, ?3, ?4, datetime(?5, 'unixepoch', 'localtime'), NULL, NULL, NULL, NULL,
+                    datetime(?5, 'unixepoch', 'localtime'))
+            ON CONFLICT(path, project_id) DO UPDATE SET
+                folder_id=excluded.folder_id,
+                size_kb=excluded.size_kb,
+                modified=excluded.modified,
+                updated_at=excluded.updated_at
+            WHERE photo_metadata.size_kb IS NOT excluded.size_kb
+               OR photo_metadata.modified IS NOT excluded.modified
+               OR photo_metadata.folder_id IS NOT excluded.folder_id
+        """
+
+        def get_or_create_folder(conn, folder_path: Path) -> int:
+            key = str(folder_path)
+            row = conn.execute("SELECT id FROM photo_folders WHERE path=? AND project_id=?",
+                               (key, project_id)).fetchone()
             if row:
-                return row[0]
-            cur.execute(
-                "INSERT INTO photo_folders (parent_id, path, name, project_id) VALUES (?, ?, ?, ?)",
-                (parent_id, str(folder_path), folder_path.name, project_id)
-            )
-            conn.commit()
-            return cur.lastrowid
+                folder_id = row[0]
+            else:
+                parent = folder_path.parent if folder_path.parent != folder_path else None
+                parent_id = folder_id_by_path.get(str(parent)) if parent else None
+                folder_id = conn.execute(
+                    "INSERT INTO photo_folders (parent_id, path, name, project_id) VALUES (?, ?, ?, ?)",
+                    (parent_id, key, folder_path.name, project_id)
+                ).lastrowid
+            folder_id_by_path[key] = folder_id
+            return folder_id
 
         with self._connect() as conn:
-            for root, dirs, files in os.walk(repo):
-                folder_path = Path(root)
-                folder_id = get_or_create_folder(conn, folder_path)
-                for f in files:
-                    p = folder_path / f
-                    if p.suffix.lower() not in supported_ext:
+            # One transaction (and one journal sync) for the whole walk;
+            # _connect() commits on exit and rolls back on error.
+            self._begin_immediate(conn)
+            # The repo's ancestors are registered once, outermost first
+            for ancestor in reversed(repo.parents):
+                get_or_create_folder(conn, ancestor)
+            batch = []
+            for root, files in _walk_files(str(repo)):
+                folder_id = get_or_create_folder(conn, Path(root))
+                for entry in files:
+                    if os.path.splitext(entry.name)[1].lower() not in supported_ext:
                         continue
-                    stat = p.stat()
-                    size_kb = stat.st_size / 1024
-                    modified = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(stat.st_mtime))
-
-                    conn.execute("""
-                        INSERT INTO photo_metadata (path, folder_id, name, size_kb, modified, width, height, embedding, tags, updated_at)
-                        VALUES (?, ?, ?, ?, ?, NULL, NULL, NULL, NULL, ?)
-                        ON CONFLICT(path) DO UPDATE SET
-                            folder_id=excluded.folder_id,
-                            size_kb=excluded.size_kb,
-                            modified=excluded.modified,
-                            updated_at=excluded.updated_at
-                    """, (str(p), folder_id, p.name, size_kb, modified, modified))
-            conn.commit()
+                    # DirEntry.stat() reuses the directory listing where the OS
+                    # provides it (Windows) instead of a second path lookup
+                    stat = entry.stat()
+                    batch.append((entry.path, folder_id, project_id, stat.st_size / 1024, int(stat.st_mtime)))
+                    if len(batch) >= batch_size:
+                        conn.executemany(upsert_sql, batch)
+                        batch.clear()
+            if batch:
+                conn.executemany(upsert_sql, batch)
+            self._analyze_tables(conn, "photo_folders", "photo_metadata")
 
 
     def get_child_folders(self, parent_id, project_id: int | None = None):
@@ -1348,45 +1954,26 @@ class ReferenceDB:
         Note: Use IS NULL for root folders, because `parent_id = NULL` returns nothing in SQL.
               Schema v3.0.0 uses direct project_id column in photo_folders table.
         """
-        with self._connect() as conn:
-            cur = conn.cursor()
+        with self._connect(read_only=True) as conn:
             if project_id is not None:
                 # Schema v3.0.0: Direct project_id column filtering
                 if parent_id is None:
-                    cur.execute("""
-                        SELECT id, name
-                        FROM photo_folders
-                        WHERE parent_id IS NULL AND project_id = ?
-                        ORDER BY name
-                    """, (project_id,))
+                    cur = conn.execute("SELECT id, name FROM photo_folders WHERE parent_id IS NULL AND project_id = ? ORDER BY name", (project_id,))
                 else:
-                    cur.execute("""
-                        SELECT id, name
-                        FROM photo_folders
-                        WHERE parent_id = ? AND project_id = ?
-                        ORDER BY name
-                    """, (parent_id, project_id))
+                    cur = conn.execute("SELECT id, name FROM photo_folders WHERE parent_id = ? AND project_id = ? ORDER BY name", (parent_id, project_id))
             else:
                 # No filter - return all folders (backward compatibility)
                 if parent_id is None:
-                    cur.execute("""
-                        SELECT id, name FROM photo_folders
-                        WHERE parent_id IS NULL
-                        ORDER BY name
-                    """)
+                    cur = conn.execute("SELECT id, name FROM photo_folders WHERE parent_id IS NULL ORDER BY name")
                 else:
-                    cur.execute("""
-                        SELECT id, name FROM photo_folders
-                        WHERE parent_id = ?
-                        ORDER BY name
-                    """, (parent_id,))
+                    cur = conn.execute("SELECT id, name FROM photo_folders WHERE parent_id = ? ORDER BY name", (parent_id,))
             rows = [{"id": r[0], "name": r[1]} for r in cur.fetchall()]
         return rows
 
 
     def get_descendant_folder_ids(self, folder_id: int, project_id: int | None = None) -> list[int]:
         """
-        Recursively get all descendant folder IDs for a given folder.
+        Get all descendant folder IDs for a given folder with one recursive CTE.
 
         Args:
             folder_id: The root folder ID
@@ -1396,25 +1983,35 @@ class ReferenceDB:
             List including the folder_id itself and all nested subfolders
 
         Note: Schema v3.0.0 filters by direct project_id column in photo_folders table.
+              Each recursive step seeks idx_photo_folders_project_parent
+              (or idx_photo_folders_parent_project_name without a project filter).
         """
-        result = [folder_id]
         try:
-            with self._connect() as conn:
-                cur = conn.cursor()
-                # Get immediate children
+            with self._connect(read_only=True) as conn:
+                # The whole subtree in one statement. UNION rather than UNION ALL
+                # so a corrupt parent_id cycle ends.
                 if project_id is not None:
                     # Schema v3.0.0: Filter by project_id
-                    cur.execute("SELECT id FROM photo_folders WHERE parent_id = ? AND project_id = ?", (folder_id, project_id))
+                    rows = conn.execute("""
+                        WITH RECURSIVE sub(id) AS (
+                            SELECT ?
+                            UNION
+                            SELECT f.id FROM photo_folders f JOIN sub ON f.parent_id = sub.id
+                            WHERE f.project_id = ?
+                        )
+                        SELECT id FROM sub
+                    """, (folder_id, project_id))
                 else:
                     # No project filter
-                    cur.execute("SELECT id FROM photo_folders WHERE parent_id = ?", (folder_id,))
-                children = [r[0] for r in cur.fetchall()]
-
-                # Recursively get descendants of each child
-                for child_id in children:
-                    result.extend(self.get_descendant_folder_ids(child_id, project_id=project_id))
-
-            return result
+                    rows = conn.execute("""
+                        WITH RECURSIVE sub(id) AS (
+                            SELECT ?
+                            UNION
+                            SELECT f.id FROM photo_folders f JOIN sub ON f.parent_id = sub.id
+                        )
+                        SELECT id FROM sub
+                    """, (folder_id,))
+                return [r[0] for r in rows]
         except Exception as e:
             print(f"[DB ERROR] get_descendant_folder_ids failed: {e}")
             return [folder_id]  # Fallback to just the folder itself
@@ -1434,35 +2031,44 @@ class ReferenceDB:
         Note: Schema v3.0.0 uses direct project_id column in photo_metadata table.
         """
         try:
-            with self._connect() as conn:
-                cur = conn.cursor()
-
+            with self._connect(read_only=True) as conn:
                 if include_subfolders:
-                    # Get folder and all descendant folder IDs
-                    folder_ids = self.get_descendant_folder_ids(folder_id, project_id=project_id)
-                    placeholders = ','.join('?' * len(folder_ids))
-
+                    # Folder subtree and its photos in one statement, so the SQL
+                    # text never depends on how many folders the subtree holds
                     if project_id is not None:
                         # Schema v3.0.0: Filter by project_id
-                        query = f"SELECT path FROM photo_metadata WHERE folder_id IN ({placeholders}) AND project_id = ? ORDER BY path"
-                        cur.execute(query, folder_ids + [project_id])
+                        cur = conn.execute("""
+                            WITH RECURSIVE sub(id) AS (
+                                SELECT ?1
+                                UNION
+                                SELECT f.id FROM photo_folders f JOIN sub ON f.parent_id = sub.id
+                                WHERE f.project_id = ?2
+                            )
+                            SELECT path FROM photo_metadata WHERE folder_id IN sub AND project_id = ?2 ORDER BY path
+                        """, (folder_id, project_id))
                     else:
                         # No project filter
-                        query = f"SELECT path FROM photo_metadata WHERE folder_id IN ({placeholders}) ORDER BY path"
-                        cur.execute(query, folder_ids)
-
-                    rows = [r[0] for r in cur.fetchall()]
-                    print(f"[DB] get_images_by_folder({folder_id}, subfolders=True, project={project_id}) -> {len(rows)} paths from {len(folder_ids)} folders")
+                        cur = conn.execute("""
+                            WITH RECURSIVE sub(id) AS (
+                                SELECT ?
+                                UNION
+                                SELECT f.id FROM photo_folders f JOIN sub ON f.parent_id = sub.id
+                            )
+                            SELECT path FROM photo_metadata WHERE folder_id IN sub ORDER BY path
+                        """, (folder_id,))
+
+                    rows = list(map(itemgetter(0), cur))
+                    print(f"[DB] get_images_by_folder({folder_id}, subfolders=True, project={project_id}) -> {len(rows)} paths")
                 else:
                     # Only this folder
                     if project_id is not None:
                         # Schema v3.0.0: Filter by project_id
-                        cur.execute("SELECT path FROM photo_metadata WHERE folder_id = ? AND project_id = ? ORDER BY path", (folder_id, project_id))
+                        cur = conn.execute("SELECT path FROM photo_metadata WHERE folder_id = ? AND project_id = ? ORDER BY path", (folder_id, project_id))
                     else:
                         # No project filter
-                        cur.execute("SELECT path FROM photo_metadata WHERE folder_id = ? ORDER BY path", (folder_id,))
+                        cur = conn.execute("SELECT path FROM photo_metadata WHERE folder_id = ? ORDER BY path", (folder_id,))
 
-                    rows = [r[0] for r in cur.fetchall()]
+                    rows = list(map(itemgetter(0), cur))
                     print(f"[DB] get_images_by_folder({folder_id}, subfolders=False, project={project_id}) -> {len(rows)} paths")
 
                 return rows
@@ -1483,14 +2089,8 @@ class ReferenceDB:
 
         Note: Schema v3.0.0 uses direct project_id column in photo_metadata table.
         """
-        with self._connect() as conn:
-            if project_id is not None:
-                # Schema v3.0.0: Filter by project_id
-                cur = conn.execute("SELECT COUNT(*) FROM photo_metadata WHERE folder_id=? AND project_id=?", (folder_id, project_id))
-            else:
-                # No project filter
-                cur = conn.execute("SELECT COUNT(*) FROM photo_metadata WHERE folder_id=?", (folder_id,))
-            return cur.fetchone()[0] or 0
+        with self._connect(read_only=True) as conn:
+            return self._folder_photo_count(conn, folder_id, project_id)
 
     def update_folder_counts(self):
         """Recalculate photo counts per folder for Sidebar display."""
@@ -1501,8 +2101,33 @@ class ReferenceDB:
                 FROM photo_metadata
                 GROUP BY folder_id
             """)
+            self._analyze_tables(conn, "photo_metadata", "photo_folders")
             conn.commit()
 
+    def ensure_folder_photo_counts(self) -> None:
+        """
+        Add photo_folders.photo_count plus the triggers that maintain it
+        (idempotent). Counts are backfilled once, when the triggers are first
+        installed; after that every photo_metadata insert, delete and folder
+        move keeps them current.
+        """
+        with self._connect() as conn:
+            installed = conn.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_photo_metadata_count_%'"
+            ).fetchone()[0]
+            if installed == len(_FOLDER_PHOTO_COUNT_TRIGGERS):
+                return
+            self._begin_immediate(conn)
+            if "photo_count" not in self._table_columns(conn, "photo_folders"):
+                conn.execute("ALTER TABLE photo_folders ADD COLUMN photo_count INTEGER NOT NULL DEFAULT 0")
+                self._invalidate_table_columns("photo_folders")
+            conn.execute("""
+                UPDATE photo_folders SET photo_count =
+                    (SELECT COUNT(*) FROM photo_metadata pm WHERE pm.folder_id = photo_folders.id)
+            """)
+            for trigger in _FOLDER_PHOTO_COUNT_TRIGGERS:
+                conn.execute(trigger)
+
     def get_folder_photo_count(self, folder_id, project_id: int | None = None):
         """
         Get photo count for a specific folder.
@@ -1516,15 +2141,8 @@ class ReferenceDB:
 
         Note: Schema v3.0.0 uses direct project_id column in photo_metadata table.
         """
-        with self._connect() as conn:
-            if project_id is not None:
-                # Schema v3.0.0: Filter by project_id
-                cur = conn.execute("SELECT COUNT(*) FROM photo_metadata WHERE folder_id=? AND project_id=?", (folder_id, project_id))
-            else:
-                # No project filter
-                cur = conn.execute("SELECT COUNT(*) FROM photo_metadata WHERE folder_id=?", (folder_id,))
-            row = cur.fetchone()
-            return row[0] if row else 0
+        with self._connect(read_only=True) as conn:
+            return self._folder_photo_count(conn, folder_id, project_id)
 
     # === Phase 3: Drag & Drop Support ===
     def set_folder_for_image(self, path: str, folder_id: int):
@@ -1548,41 +2166,42 @@ class ReferenceDB:
         Return list of image paths based on branch selection.
         Uses old project_images table for compatibility.
         """
-        print(f"[get_images_by_branch] project_id={project_id}, branch_key='{branch_key}'")
-        with self._connect() as conn:
+        with self._connect(read_only=True) as conn:
             cur = conn.cursor()
-            cur.execute("""
-                SELECT image_path FROM project_images
-                WHERE project_id = ? AND branch_key = ?
-            """, (project_id, branch_key))
+            cur.execute(_SQL_PROJECT_IMAGES_BY_BRANCH, (project_id, branch_key))
             results = [row[0] for row in cur.fetchall()]
-            print(f"[get_images_by_branch] Found {len(results)} photos")
-            if len(results) == 0:
-                # Debug: show what branch_keys exist in DB
+            self.logger.debug("[get_images_by_branch] project_id=%s, branch_key=%r: found %d photos",
+                              project_id, branch_key, len(results))
+            if not results and self.logger.isEnabledFor(logging.DEBUG):
+                # Debug: show what branch_keys exist in DB (diagnostic query only runs at DEBUG)
                 cur.execute("""
-                    SELECT DISTINCT branch_key FROM project_images WHERE project_id = ?
+                    SELECT DISTINCT branch_key FROM project_images WHERE project_id = ? LIMIT 10
                 """, (project_id,))
                 existing_keys = [row[0] for row in cur.fetchall()]
-                print(f"[get_images_by_branch] Available branch_keys in DB: {existing_keys[:10]}")
+                self.logger.debug("[get_images_by_branch] Available branch_keys in DB: %s", existing_keys)
             return results
 
     def _get_or_create_default_project(self):
-        """Get or create default project for scans. Returns project_id."""
+        """
+        Get or create default project for scans. Returns project_id.
+        An existing project's id is memoized (the lowest id only changes when
+        that project is deleted, see delete_project), so scans do not pay a
+        SELECT per folder/photo.
+        """
+        if self._default_project_id is not None:
+            return self._default_project_id
         with self._connect() as conn:
-            cur = conn.cursor()
             # Try to get first project
-            cur.execute("SELECT id FROM projects ORDER BY id ASC LIMIT 1")
-            row = cur.fetchone()
+            row = conn.execute("SELECT id FROM projects ORDER BY id ASC LIMIT 1").fetchone()
             if row:
+                self._default_project_id = row[0]
                 return row[0]
 
             # No projects exist - create default
-            cur.execute(
+            return conn.execute(
                 "INSERT INTO projects (name, folder, mode) VALUES (?, ?, ?)",
                 ("Default Project", ".", "date")
-            )
-            conn.commit()
-            return cur.lastrowid
+            ).lastrowid
 
     def ensure_folder(self, path: str, name: str, parent_id: int | None, project_id: int = None):
         """Return folder_id; create if not exists.
@@ -1598,52 +2217,57 @@ class ReferenceDB:
             project_id = self._get_or_create_default_project()
 
         with self._connect() as conn:
-            cur = conn.cursor()
             # Check if folder exists for this project
-            cur.execute("SELECT id FROM photo_folders WHERE path=? AND project_id=?", (path, project_id))
-            row = cur.fetchone()
+            row = conn.execute("SELECT id FROM photo_folders WHERE path = ? AND project_id = ?", (path, project_id)).fetchone()
             if row:
                 return row[0]
-            cur.execute(
-                "INSERT INTO photo_folders (name, path, parent_id, project_id) VALUES (?,?,?,?)",
-                (name, path, parent_id, project_id)
-            )
-            conn.commit()
-            return cur.lastrowid
+            return conn.execute("INSERT INTO photo_folders (name, path, parent_id, project_id) VALUES (?, ?, ?, ?)", (name, path, parent_id, project_id)).lastrowid
+
+    def insert_or_update_photo(self, path, folder_id, size, mtime, width, height, project_id: int = None):
+        """
+        Upsert into photo_metadata based on (path, project_id), as one statement.
 
-    def insert_or_update_photo(self, path, folder_id, size, mtime, width, height):
-        """Upsert into photo_metadata based on path."""
+        Args:
+            size: File size in bytes (stored as size_kb)
+            mtime: Modification time as a Unix timestamp (stored as modified)
+            project_id: Project ID (uses default if None)
+        """
+        if project_id is None:
+            project_id = self._get_or_create_default_project()
         with self._connect() as conn:
-            cur = conn.cursor()
-            cur.execute("SELECT id FROM photo_metadata WHERE path=?", (path,))
-            row = cur.fetchone()
-            if row:
-                cur.execute("""
-                    UPDATE photo_metadata
-                    SET folder_id=?, size=?, mtime=?, width=?, height=?
-                    WHERE path=?
-                """, (folder_id, size, mtime, width, height, path))
-            else:
-                cur.execute("""
-                    INSERT INTO photo_metadata (path, folder_id, size, mtime, width, height)
-                    VALUES (?,?,?,?,?,?)
-                """, (path, folder_id, size, mtime, width, height))
-            conn.commit()
+            conn.execute(_SQL_UPSERT_PHOTO, (path, folder_id, project_id, size, mtime, width, height))
+
+    def insert_or_update_photos_many(self, rows, project_id: int = None, chunk_size: int = 5000) -> int:
+        """
+        Batch form of insert_or_update_photo().
+
+        rows: iterable of (path, folder_id, size, mtime, width, height). Written
+        with executemany in chunks of chunk_size, all inside one IMMEDIATE
+        transaction. Returns the number of rows inserted or updated.
+        """
+        if project_id is None:
+            project_id = self._get_or_create_default_project()
+        written = 0
+        it = iter(rows)
+        with self._connect() as conn:
+            self._begin_immediate(conn)
+            while True:
+                chunk = [(path, folder_id, project_id, size, mtime, width, height)
+                         for (path, folder_id, size, mtime, width, height) in itertools.islice(it, chunk_size)]
+                if not chunk:
+                    break
+                written += conn.executemany(_SQL_UPSERT_PHOTO, chunk).rowcount
+        return written
 
     def get_photo_metadata_by_path(self, path: str):
         """Return all metadata columns for a given photo path."""
-        with self._connect() as conn:
-            cur = conn.cursor()
-            cur.execute("""
+        with self._connect(read_only=True) as conn:
+            row = conn.execute("""
                 SELECT path, folder_id, size_kb, modified, width, height, embedding, date_taken, tags
                 FROM photo_metadata
                 WHERE path = ?
-            """, (path,))
-            row = cur.fetchone()
-            if not row:
-                return None
-            cols = [d[0] for d in cur.description]
-            return dict(zip(cols, row))
+            """, (path,)).fetchone()
+            return dict(row) if row else None
 
     # --- 🎬 Video Methods (Phase 4.3) ---
 
@@ -1658,50 +2282,43 @@ class ReferenceDB:
         Returns:
             Video metadata dict or None
         """
-        with self._connect() as conn:
-            cur = conn.cursor()
-            cur.execute("""
+        with self._connect(read_only=True) as conn:
+            row = conn.execute("""
                 SELECT id, path, folder_id, project_id, size_kb, modified,
                        duration_seconds, width, height, fps, codec, bitrate,
                        date_taken, created_ts, created_date, created_year,
                        metadata_status, thumbnail_status
                 FROM video_metadata
                 WHERE path = ? AND project_id = ?
-            """, (path, project_id))
-            row = cur.fetchone()
-            if not row:
-                return None
-            cols = [d[0] for d in cur.description]
-            return dict(zip(cols, row))
+            """, (path, project_id)).fetchone()
+            return dict(row) if row else None
 
     # ---------------------------
     # Metadata backfill helpers
     # ---------------------------
+    def _add_missing_columns(self, conn, table: str, columns) -> None:
+        """
+        ALTER in whichever (name, declaration) pairs table lacks. The probe is
+        re-read rather than cached, so call this inside the write transaction
+        and no ALTER can fail on a column another connection just added.
+        """
+        self._invalidate_table_columns(table)
+        cols = self._table_columns(conn, table)
+        for name, decl in columns:
+            if name not in cols:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+        self._invalidate_table_columns(table)
+
     def ensure_metadata_columns(self) -> None:
         """
         Idempotent: ensure metadata_status and metadata_fail_count exist.
         Call before running any backfill jobs.
         """
         with self._connect() as conn:
-            cur = conn.cursor()
-            cur.execute("PRAGMA table_info(photo_metadata)")
-            cols = {r[1] for r in cur.fetchall()}
-            if "metadata_status" not in cols:
-                try:
-                    cur.execute("ALTER TABLE photo_metadata ADD COLUMN metadata_status TEXT DEFAULT 'pending'")
-                except Exception:
-                    pass
-            if "metadata_fail_count" not in cols:
-                try:
-                    cur.execute("ALTER TABLE photo_metadata ADD COLUMN metadata_fail_count INTEGER DEFAULT 0")
-                except Exception:
-                    pass
-            # ensure index
-            try:
-                cur.execute("CREATE INDEX IF NOT EXISTS idx_meta_status    ON photo_metadata(metadata_status)")
-            except Exception:
-                pass
-            conn.commit()
+            # One transaction for the whole migration
+            self._begin_immediate(conn)
+            self._add_missing_columns(conn, "photo_metadata", _META_STATUS_COLUMNS)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_meta_status    ON photo_metadata(metadata_status)")
 
     def get_images_missing_metadata(self, limit: int | None = None, max_failures: int = 3) -> list[str]:
         """
@@ -1711,20 +2328,105 @@ class ReferenceDB:
          - OR metadata_status IN ('pending','failed_retry') and metadata_fail_count < max_failures
         This allows re-trying transient failures up to max_failures.
         """
-        q = """
-            SELECT path FROM photo_metadata
-            WHERE (width IS NULL OR height IS NULL OR date_taken IS NULL)
-               OR (metadata_status IN ('pending','failed_retry') AND COALESCE(metadata_fail_count,0) < ?)
+        n = int(limit) if limit and limit > 0 else -1  # LIMIT -1 returns every row
+        with self._connect(read_only=True) as conn:
+            rows = conn.execute("""
+                SELECT path FROM photo_metadata
+                WHERE (width IS NULL OR height IS NULL OR date_taken IS NULL)
+                   OR (metadata_status IN ('pending','failed_retry') AND COALESCE(metadata_fail_count,0) < ?1)
+                LIMIT ?2
+            """, (int(max_failures), n)).fetchall()
+        return [r[0] for r in rows]
+
+    def claim_metadata_batch(self, limit: int | None = None, max_failures: int = 3) -> list[str]:
+        """
+        Claim up to limit photos that need metadata extraction (all of them when
+        limit is None) and return their paths.
+
+        Uses the same criteria as get_images_missing_metadata(), but the rows
+        are switched to metadata_status='in_progress' in the same IMMEDIATE
+        transaction that selects them, so two backfill runs never get the same
+        path. Finish each path with mark_metadata_success(_many) or
+        mark_metadata_failure(_many); hand back unprocessed ones with
+        release_metadata_claims(). While a run is alive it re-stamps its
+        outstanding claims with refresh_metadata_claims(); claims a crashed run
+        left behind stop being refreshed and are recovered by
+        release_stale_metadata_claims().
+        """
+        n = int(limit) if limit and limit > 0 else -1
+        with self._connect() as conn:
+            # Plain SELECT + UPDATE by id rather than UPDATE ... RETURNING,
+            # which would need SQLite 3.35
+            self._begin_immediate(conn)
+            rows = conn.execute("""
+                SELECT id, path FROM photo_metadata
+                WHERE metadata_status IS NOT 'in_progress'
+                  AND ((width IS NULL OR height IS NULL OR date_taken IS NULL)
+                       OR (metadata_status IN ('pending','failed_retry') AND COALESCE(metadata_fail_count,0) < ?1))
+                LIMIT ?2
+            """, (int(max_failures), n)).fetchall()
+            claimed_at = self._updated_at()
+            conn.executemany(
+                "UPDATE photo_metadata SET metadata_status = 'in_progress', updated_at = ? WHERE id = ?",
+                ((claimed_at, r[0]) for r in rows),
+            )
+        return [r[1] for r in rows]
+
+    def refresh_metadata_claims(self, paths) -> int:
+        """
+        Heartbeat for a live backfill run: re-stamp updated_at on the given
+        paths that are still 'in_progress', so release_stale_metadata_claims()
+        in another run does not take them back. Returns the number of rows
+        refreshed.
         """
-        params = [int(max_failures)]
-        if limit and limit > 0:
-            q += " LIMIT ?"
-            params.append(int(limit))
+        refreshed_at = self._updated_at()
         with self._connect() as conn:
-            cur = conn.cursor()
-            cur.execute(q, params)
-            rows = cur.fetchall()
-            return [r[0] for r in rows]
+            return conn.executemany(
+                "UPDATE photo_metadata SET updated_at = ? WHERE path = ? AND metadata_status = 'in_progress'",
+                ((refreshed_at, p) for p in paths),
+            ).rowcount
+
+    def release_stale_metadata_claims(self, stale_after: int = 600, max_failures: int = 3) -> int:
+        """
+        Reset 'in_progress' claims not refreshed for stale_after seconds, i.e.
+        left by a run that died before release_metadata_claims(). Live runs
+        refresh their claims well inside that window (see
+        refresh_metadata_claims()). Backfill runs call this when they start.
+        Returns the number of rows reset.
+        """
+        stale_before = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(time.time() - stale_after))
+        with self._connect() as conn:
+            # Failure states are rebuilt from the fail count the way
+            # mark_metadata_failure() sets them; anything else goes back to 'pending'
+            return conn.execute("""
+                UPDATE photo_metadata
+                SET metadata_status = CASE
+                        WHEN COALESCE(metadata_fail_count, 0) >= ?1 THEN 'failed'
+                        WHEN COALESCE(metadata_fail_count, 0) > 0 THEN 'failed_retry'
+                        ELSE 'pending'
+                    END
+                WHERE metadata_status = 'in_progress' AND updated_at < ?2
+            """, (int(max_failures), stale_before)).rowcount
+
+    def release_metadata_claims(self, paths, max_failures: int = 3) -> int:
+        """
+        Hand back claimed paths that were not processed: 'failed'/'failed_retry'
+        by fail count, else 'pending'. Paths already marked ok/failed since are
+        left alone. Returns the number of rows released.
+        """
+        max_failures = int(max_failures)
+        with self._connect() as conn:
+            # Same reset as release_stale_metadata_claims(); at worst a path
+            # costs one extra extraction
+            return conn.executemany("""
+                UPDATE photo_metadata
+                SET metadata_status = CASE
+                        WHEN COALESCE(metadata_fail_count, 0) >= ?1 THEN 'failed'
+                        WHEN COALESCE(metadata_fail_count, 0) > 0 THEN 'failed_retry'
+                        ELSE 'pending'
+                    END
+                WHERE path = ?2 AND metadata_status = 'in_progress'
+            """, ((max_failures, p) for p in paths)).rowcount
 
     def mark_metadata_success(self, path: str, width: int | None, height: int | None, date_taken: str | None) -> bool:
         """
@@ -1733,13 +2435,8 @@ class ReferenceDB:
         """
         try:
             with self._connect() as conn:
-                cur = conn.cursor()
-                cur.execute("""
-                    UPDATE photo_metadata
-                    SET width = ?, height = ?, date_taken = ?, metadata_status = 'ok', metadata_fail_count = 0, updated_at = ?
-                    WHERE path = ?
-                """, (width, height, date_taken, time.strftime("%Y-%m-%d %H:%M:%S"), path))
-                conn.commit()
+                conn.execute(_SQL_MARK_META_SUCCESS,
+                             (width, height, date_taken, self._updated_at(), path))
             return True
         except Exception as e:
             safe = getattr(self, "safe_log", None)
@@ -1753,32 +2450,23 @@ class ReferenceDB:
     def mark_metadata_failure(self, path: str, error: str | None = None, max_retries: int = 3) -> bool:
         """
         Increment metadata_fail_count and set metadata_status to 'failed_retry' or 'failed' if threshold reached.
-        Also logs the error in match_audit (lightweight reuse).
+        Also queues the error for match_audit (lightweight reuse); see flush_audit().
         """
         try:
             with self._connect() as conn:
-                cur = conn.cursor()
-                cur.execute("SELECT COALESCE(metadata_fail_count,0) FROM photo_metadata WHERE path = ?", (path,))
-                row = cur.fetchone()
+                row = conn.execute("SELECT COALESCE(metadata_fail_count,0) FROM photo_metadata WHERE path = ?", (path,)).fetchone()
                 if not row:
                     # missing row: nothing to mark
                     return False
                 fail_count = (row[0] or 0) + 1
                 status = 'failed' if fail_count >= int(max_retries) else 'failed_retry'
-                cur.execute("""
+                conn.execute("""
                     UPDATE photo_metadata
                     SET metadata_fail_count = ?, metadata_status = ?, updated_at = ?
                     WHERE path = ?
-                """, (fail_count, status, time.strftime("%Y-%m-%d %H:%M:%S"), path))
-                # lightweight logging in match_audit for diagnostic purposes
-                try:
-                    cur.execute("""
-                        INSERT INTO match_audit (filename, matched_label, confidence, match_mode)
-                        VALUES (?, ?, ?, ?)
-                    """, (path, f"[meta_fail:{status}]", None, error or "meta_backfill"))
-                except Exception:
-                    pass
-                conn.commit()
+                """, (fail_count, status, self._updated_at(), path))
+            # lightweight logging in match_audit, batched by flush_audit()
+            self._queue_audit([(path, f"[meta_fail:{status}]", None, error or "meta_backfill")])
             return True
         except Exception as e:
             safe = getattr(self, "safe_log", None)
@@ -1789,28 +2477,140 @@ class ReferenceDB:
                     pass
             return False
 
+    def mark_metadata_success_many(self, rows) -> int:
+        """
+        Batch form of mark_metadata_success().
+
+        rows: iterable of (path, width, height, date_taken). All rows are
+        written with one executemany in a single transaction and share one
+        updated_at stamp. Returns the number of rows updated (0 on error).
+        """
+        updated_at = self._updated_at()
+        params = ((w, h, dt, updated_at, path) for (path, w, h, dt) in rows)
+        try:
+            with self._connect() as conn:
+                return conn.executemany(_SQL_MARK_META_SUCCESS, params).rowcount
+        except Exception as e:
+            safe = getattr(self, "safe_log", None)
+            if safe:
+                try:
+                    safe(f"[DB] mark_metadata_success_many failed: {e}")
+                except Exception:
+                    pass
+            return 0
+
+    def mark_metadata_failure_many(self, rows, max_retries: int = 3) -> int:
+        """
+        Batch form of mark_metadata_failure().
+
+        rows: iterable of (path, error). Each path's fail count is bumped and
+        its status set to 'failed_retry' or 'failed' in SQL, all in a single
+        transaction; the audit rows are queued for flush_audit(). Returns the
+        number of rows updated (0 on error).
+        """
+        rows = list(rows)
+        if not rows:
+            return 0
+        updated_at = self._updated_at()
+        max_retries = int(max_retries)
+        try:
+            with self._connect() as conn:
+                # New fail count and status derived in SQL, so no per-path SELECT first
+                n = conn.executemany("""
+                    UPDATE photo_metadata
+                    SET metadata_fail_count = COALESCE(metadata_fail_count, 0) + 1,
+                        metadata_status = CASE WHEN COALESCE(metadata_fail_count, 0) + 1 >= ?1
+                                               THEN 'failed' ELSE 'failed_retry' END,
+                        updated_at = ?2
+                    WHERE path = ?3
+                """, ((max_retries, updated_at, path) for (path, _error) in rows)).rowcount
+                # The statuses it wrote, read back in one query for the audit log
+                status_by_path = dict(conn.execute("""
+                    SELECT path, metadata_status FROM photo_metadata
+                    WHERE path IN (SELECT value FROM json_each(?))
+                """, (_json_dumps([path for (path, _error) in rows]),)).fetchall())
+            # lightweight logging in match_audit, batched by flush_audit()
+            self._queue_audit([
+                (path, f"[meta_fail:{status_by_path[path]}]", None, error or "meta_backfill")
+                for (path, error) in rows if path in status_by_path
+            ])
+            return n
+        except Exception as e:
+            safe = getattr(self, "safe_log", None)
+            if safe:
+                try:
+                    safe(f"[DB] mark_metadata_failure_many failed: {e}")
+                except Exception:
+                    pass
+            return 0
+
+    def _queue_audit(self, rows: list) -> None:
+        """Queue match_audit rows; flushes once _AUDIT_FLUSH_AT are waiting."""
+        if not rows:
+            return
+        with self._audit_lock:
+            dropped = max(0, len(self._audit_buf) + len(rows) - _AUDIT_MAX_ROWS)
+            self._audit_buf.extend(rows)
+            pending = len(self._audit_buf)
+        if dropped:
+            self.logger.warning(f"match_audit queue full, dropped {dropped} oldest rows")
+        if pending >= _AUDIT_FLUSH_AT:
+            self.flush_audit()
+
+    def flush_audit(self) -> int:
+        """
+        Write the queued metadata-failure rows to match_audit with one
+        executemany. Runs when the queue reaches _AUDIT_FLUSH_AT rows, at the
+        end of backfill runs, and from close_all_connections() before
+        shutting down. On failure the rows go back to the front of the queue
+        for the next flush. Returns the number written.
+        """
+        with self._audit_lock:
+            rows = [self._audit_buf.popleft() for _ in range(len(self._audit_buf))]
+        if not rows:
+            return 0
+        try:
+            with self._connect() as conn:
+                conn.executemany("""
+                    INSERT INTO match_audit (filename, matched_label, confidence, match_mode)
+                    VALUES (?, ?, ?, ?)
+                """, rows)
+            return len(rows)
+        except Exception as e:
+            with self._audit_lock:
+                # On overflow extendleft pushes out the newest rows (right end)
+                dropped = max(0, len(self._audit_buf) + len(rows) - _AUDIT_MAX_ROWS)
+                self._audit_buf.extendleft(reversed(rows))
+            self.logger.warning(
+                f"flush_audit failed, {len(rows)} rows requeued"
+                + (f" ({dropped} dropped, queue full)" if dropped else "") + f": {e}"
+            )
+            return 0
+
     def reset_metadata_failures(self, path: str) -> bool:
         """Reset metadata status and fail count for manual retry."""
         try:
             with self._connect() as conn:
-                cur = conn.cursor()
-                cur.execute("UPDATE photo_metadata SET metadata_status='pending', metadata_fail_count=0 WHERE path = ?", (path,))
-                conn.commit()
+                conn.execute("UPDATE photo_metadata SET metadata_status='pending', metadata_fail_count=0 WHERE path = ?", (path,))
             return True
         except Exception:
             return False
 
     def get_metadata_stats(self) -> dict:
-        """Return counts: pending, ok, failed_retry, failed, total_missing."""
-        with self._connect() as conn:
-            cur = conn.cursor()
-            stats = {}
-            for s in ("ok", "pending", "failed_retry", "failed"):
-                cur.execute("SELECT COUNT(*) FROM photo_metadata WHERE metadata_status = ?", (s,))
-                stats[s] = cur.fetchone()[0] or 0
-            cur.execute("SELECT COUNT(*) FROM photo_metadata WHERE width IS NULL OR height IS NULL OR date_taken IS NULL")
-            stats["missing_metadata"] = cur.fetchone()[0] or 0
-            return stats
+        """Return counts: ok, pending, failed_retry, failed, in_progress, missing_metadata."""
+        with self._connect(read_only=True) as conn:
+            # Every bucket from a single pass over the table
+            row = conn.execute("""
+                SELECT SUM(CASE WHEN metadata_status = 'ok' THEN 1 ELSE 0 END),
+                       SUM(CASE WHEN metadata_status = 'pending' THEN 1 ELSE 0 END),
+                       SUM(CASE WHEN metadata_status = 'failed_retry' THEN 1 ELSE 0 END),
+                       SUM(CASE WHEN metadata_status = 'failed' THEN 1 ELSE 0 END),
+                       SUM(CASE WHEN metadata_status = 'in_progress' THEN 1 ELSE 0 END),
+                       SUM(CASE WHEN width IS NULL OR height IS NULL OR date_taken IS NULL THEN 1 ELSE 0 END)
+                FROM photo_metadata
+            """).fetchone()
+        keys = ("ok", "pending", "failed_retry", "failed", "in_progress", "missing_metadata")
+        return {k: v or 0 for k, v in zip(keys, row)}
 
     # Keep existing methods below mostly unchanged — but ensure upsert_photo_metadata sets metadata_status ok when metadata present.
     def upsert_photo_metadata(self, path, folder_id, size_kb, modified, width, height, date_taken=None, tags=None, project_id=None):
@@ -1828,147 +2628,92 @@ class ReferenceDB:
             project_id = self._get_or_create_default_project()
 
         with self._connect() as conn:
-            cur = conn.cursor()
             ok_meta = (width is not None and height is not None) or (date_taken is not None)
+            updated_at = self._updated_at()
             if self._has_created_columns():
                 c_ts, c_date, c_year = self._normalize_created_fields(date_taken, modified)
                 # When metadata is present, mark metadata_status ok
-                if ok_meta:
-                    cur.execute("""
-                        INSERT INTO photo_metadata (path, folder_id, project_id, size_kb, modified, width, height, embedding, date_taken, tags, updated_at,
-                                                    created_ts, created_date, created_year, metadata_status, metadata_fail_count)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, NULL, ?, ?, ?, ?, ?, ?, 'ok', 0)
-                        ON CONFLICT(path, project_id) DO UPDATE SET
-                            folder_id = excluded.folder_id,
-                            size_kb   = excluded.size_kb,
-                            modified  = excluded.modified,
-                            width     = excluded.width,
-                            height    = excluded.height,
-                            date_taken= excluded.date_taken,
-                            tags      = excluded.tags,
-                            updated_at= excluded.updated_at,
-                            created_ts   = COALESCE(excluded.created_ts, created_ts),
-                            created_date = COALESCE(excluded.created_date, created_date),
-                            created_year = COALESCE(excluded.created_year, created_year),
-                            metadata_status = CASE WHEN excluded.width IS NOT NULL OR excluded.date_taken IS NOT NULL THEN 'ok' ELSE metadata_status END,
-                            metadata_fail_count = CASE WHEN excluded.width IS NOT NULL OR excluded.date_taken IS NOT NULL THEN 0 ELSE metadata_fail_count END
-                    """, (
-                        path, folder_id, project_id, size_kb, modified, width, height,
-                        date_taken, tags, time.strftime("%Y-%m-%d %H:%M:%S"),
-                        c_ts, c_date, c_year
-                    ))
-                else:
-                    cur.execute("""
-                        INSERT INTO photo_metadata (path, folder_id, project_id, size_kb, modified, width, height, embedding, date_taken, tags, updated_at,
-                                                    created_ts, created_date, created_year)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, NULL, ?, ?, ?, ?, ?, ?)
-                        ON CONFLICT(path, project_id) DO UPDATE SET
-                            folder_id = excluded.folder_id,
-                            size_kb   = excluded.size_kb,
-                            modified  = excluded.modified,
-                            width     = excluded.width,
-                            height    = excluded.height,
-                            date_taken= excluded.date_taken,
-                            tags      = excluded.tags,
-                            updated_at= excluded.updated_at,
-                            created_ts   = COALESCE(excluded.created_ts, created_ts),
-                            created_date = COALESCE(excluded.created_date, created_date),
-                            created_year = COALESCE(excluded.created_year, created_year)
-                    """, (
-                        path, folder_id, project_id, size_kb, modified, width, height,
-                        date_taken, tags, time.strftime("%Y-%m-%d %H:%M:%S"),
-                        c_ts, c_date, c_year
-                    ))
+                conn.execute(
+                    _SQL_UPSERT_META_CREATED_OK if ok_meta else _SQL_UPSERT_META_CREATED,
+                    (path, folder_id, project_id, size_kb, modified, width, height,
+                     date_taken, tags, updated_at, c_ts, c_date, c_year),
+                )
             else:
-                if ok_meta:
-                    cur.execute("""
-                        INSERT INTO photo_metadata (path, folder_id, project_id, size_kb, modified, width, height, embedding, date_taken, tags, updated_at, metadata_status, metadata_fail_count)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, NULL, ?, ?, ?, 'ok', 0)
-                        ON CONFLICT(path, project_id) DO UPDATE SET
-                            folder_id = excluded.folder_id,
-                            size_kb   = excluded.size_kb,
-                            modified  = excluded.modified,
-                            width     = excluded.width,
-                            height    = excluded.height,
-                            date_taken= excluded.date_taken,
-                            tags      = excluded.tags,
-                            updated_at= excluded.updated_at,
-                            metadata_status = CASE WHEN excluded.width IS NOT NULL OR excluded.date_taken IS NOT NULL THEN 'ok' ELSE metadata_status END,
-                            metadata_fail_count = CASE WHEN excluded.width IS NOT NULL OR excluded.date_taken IS NOT NULL THEN 0 ELSE metadata_fail_count END
-                    """, (path, folder_id, project_id, size_kb, modified, width, height, date_taken, tags, time.strftime("%Y-%m-%d %H:%M:%S")))
-                else:
-                    cur.execute("""
-                        INSERT INTO photo_metadata (path, folder_id, project_id, size_kb, modified, width, height, embedding, date_taken, tags, updated_at)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, NULL, ?, ?, ?)
-                        ON CONFLICT(path, project_id) DO UPDATE SET
-                            folder_id = excluded.folder_id,
-                            size_kb   = excluded.size_kb,
-                            modified  = excluded.modified,
-                            width     = excluded.width,
-                            height    = excluded.height,
-                            date_taken= excluded.date_taken,
-                            tags      = excluded.tags,
-                            updated_at= excluded.updated_at
-                    """, (path, folder_id, project_id, size_kb, modified, width, height, date_taken, tags, time.strftime("%Y-%m-%d %H:%M:%S")))
-            conn.commit()
+                conn.execute(
+                    _SQL_UPSERT_META_OK if ok_meta else _SQL_UPSERT_META,
+                    (path, folder_id, project_id, size_kb, modified, width, height,
+                     date_taken, tags, updated_at),
+                )
+
+    def upsert_photo_metadata_many(self, rows, project_id: int = None) -> int:
+        """
+        Batch form of upsert_photo_metadata() (tags left NULL).
+
+        rows: iterable of (path, folder_id, size_kb, modified, width, height,
+        date_taken). Written with at most two executemany calls (rows with
+        and without metadata) in one IMMEDIATE transaction, or in the
+        caller's bulk(). Returns the number of rows written.
+        """
+        if project_id is None:
+            project_id = self._get_or_create_default_project()
+        updated_at = self._updated_at()
+        created = self._has_created_columns()
+        with_meta, without_meta = [], []
+        for (path, folder_id, size_kb, modified, width, height, date_taken) in rows:
+            params = (path, folder_id, project_id, size_kb, modified, width, height,
+                      date_taken, None, updated_at)
+            if created:
+                params += self._normalize_created_fields(date_taken, modified)
+            ok_meta = (width is not None and height is not None) or (date_taken is not None)
+            (with_meta if ok_meta else without_meta).append(params)
+        written = 0
+        with self._connect() as conn:
+            self._begin_immediate(conn)
+            if with_meta:
+                sql = _SQL_UPSERT_META_CREATED_OK if created else _SQL_UPSERT_META_OK
+                written += conn.executemany(sql, with_meta).rowcount
+            if without_meta:
+                sql = _SQL_UPSERT_META_CREATED if created else _SQL_UPSERT_META
+                written += conn.executemany(sql, without_meta).rowcount
+        return written
 
 
     # --------------------------
     # Date helpers & queries
     # --------------------------
     def _has_created_columns(self) -> bool:
-        """Detect once and cache whether created_* columns exist."""
-        if self._created_cols_present is not None:
-            return self._created_cols_present
-        with self._connect() as conn:
-            cur = conn.cursor()
-            cur.execute("PRAGMA table_info(photo_metadata)")
-            cols = {r[1] for r in cur.fetchall()}
-            self._created_cols_present = all(c in cols for c in ("created_ts", "created_date", "created_year"))
-            return self._created_cols_present
+        """
+        Whether photo_metadata has the created_* columns, answered from the
+        _table_columns() probe, so every migration that invalidates that cache
+        is seen here too.
+        """
+        with self._connect(read_only=True) as conn:
+            cols = self._table_columns(conn, "photo_metadata")
+        return {"created_ts", "created_date", "created_year"} <= cols
 
     def _normalize_created_fields(self, date_taken: str | None, modified: str | None):
         """
         Return (created_ts:int|None, created_date:'YYYY-MM-DD'|None, created_year:int|None).
         Uses date_taken if parseable, else falls back to modified.
         """
-        import datetime as dt
-        def parse_one(s: str | None):
-            if not s:
-                return None
-            fmts = [
-                "%Y:%m:%d %H:%M:%S",   # EXIF DateTimeOriginal
-                "%Y-%m-%d %H:%M:%S",
-                "%Y/%m/%d %H:%M:%S",
-                "%d.%m.%Y %H:%M:%S",
-                "%Y-%m-%d",
-            ]
-            for f in fmts:
-                try:
-                    return dt.datetime.strptime(s, f)
-                except Exception:
-                    pass
-            return None
-        t = parse_one(date_taken) or parse_one(modified)
+        t = _parse_created_datetime(date_taken) or _parse_created_datetime(modified)
         if not t:
             return (None, None, None)
-        ts = int(t.timestamp())
-        dstr = t.strftime("%Y-%m-%d")
-        return (ts, dstr, int(dstr[:4]))
+        return (int(t.timestamp()), f"{t.year:04d}-{t.month:02d}-{t.day:02d}", t.year)
 
     # CLI migration entrypoint for metadata columns:
     def ensure_created_date_fields(self) -> None:
         """Add created_ts / created_date / created_year + indexes (idempotent)."""
         with self._connect() as conn:
             cur = conn.cursor()
-            cur.execute("PRAGMA table_info(photo_metadata)")
-            cols = {row[1] for row in cur.fetchall()}
+            cols = self._table_columns(conn, "photo_metadata")
             if "created_ts" not in cols:
                 cur.execute("ALTER TABLE photo_metadata ADD COLUMN created_ts INTEGER")
             if "created_date" not in cols:
                 cur.execute("ALTER TABLE photo_metadata ADD COLUMN created_date TEXT")
             if "created_year" not in cols:
                 cur.execute("ALTER TABLE photo_metadata ADD COLUMN created_year INTEGER")
+            self._invalidate_table_columns("photo_metadata")
             cur.execute("CREATE INDEX IF NOT EXISTS idx_photo_created_year  ON photo_metadata(created_year)")
             cur.execute("CREATE INDEX IF NOT EXISTS idx_photo_created_date  ON photo_metadata(created_date)")
             cur.execute("CREATE INDEX IF NOT EXISTS idx_photo_created_ts    ON photo_metadata(created_ts)")
@@ -2001,12 +2746,11 @@ class ReferenceDB:
         """
         if not self._has_created_columns():
             return []
-        with self._connect() as conn:
-            cur = conn.cursor()
+        with self._connect(read_only=True) as conn:
             if project_id is not None:
                 # PERFORMANCE: Use direct project_id column (schema v3.2.0+)
                 # Uses compound index idx_photo_metadata_project_date for fast filtering
-                cur.execute("""
+                cur = conn.execute("""
                     SELECT created_year, COUNT(*)
                     FROM photo_metadata
                     WHERE project_id = ?
@@ -2016,7 +2760,7 @@ class ReferenceDB:
                 """, (project_id,))
             else:
                 # No project filter - use all photos globally
-                cur.execute("""
+                cur = conn.execute("""
                     SELECT created_year, COUNT(*)
                     FROM photo_metadata
                     WHERE created_year IS NOT NULL
@@ -2029,7 +2773,7 @@ class ReferenceDB:
         """[(YYYY-MM-DD, count)] newest first. Returns [] if migration not yet run."""
         if not self._has_created_columns():
             return []
-        with self._connect() as conn:
+        with self._connect(read_only=True) as conn:
             cur = conn.execute("""
                 SELECT created_date, COUNT(*)
                 FROM photo_metadata
@@ -2049,7 +2793,7 @@ class ReferenceDB:
         """
         if not self._has_created_columns():
             return []
-        with self._connect() as conn:
+        with self._connect(read_only=True) as conn:
             if project_id is not None:
                 # Schema v3.0.0: Filter by project_id
                 cur = conn.execute("""
@@ -2066,7 +2810,7 @@ class ReferenceDB:
                     WHERE created_year = ?
                     ORDER BY created_ts ASC, path ASC
                 """, (year,))
-            return [r[0] for r in cur.fetchall()]
+            return list(map(itemgetter(0), cur))
 
     def get_images_by_date(self, ymd: str, project_id: int | None = None) -> list[str]:
         """
@@ -2078,7 +2822,7 @@ class ReferenceDB:
         """
         if not self._has_created_columns():
             return []
-        with self._connect() as conn:
+        with self._connect(read_only=True) as conn:
             if project_id is not None:
                 # Schema v3.0.0: Filter by project_id
                 cur = conn.execute("""
@@ -2095,7 +2839,7 @@ class ReferenceDB:
                     WHERE created_date = ?
                     ORDER BY created_ts ASC, path ASC
                 """, (ymd,))
-            return [r[0] for r in cur.fetchall()]
+            return list(map(itemgetter(0), cur))
 
     def get_videos_by_date(self, ymd: str, project_id: int | None = None) -> list[str]:
         """
@@ -2112,11 +2856,10 @@ class ReferenceDB:
             >>> db.get_videos_by_date("2024-11-12", project_id=1)
             ['/videos/vid1.mp4', '/videos/vid2.mp4']
         """
-        with self._connect() as conn:
-            cur = conn.cursor()
+        with self._connect(read_only=True) as conn:
             if project_id is not None:
                 # Filter by project_id
-                cur.execute("""
+                cur = conn.execute("""
                     SELECT path
                     FROM video_metadata
                     WHERE created_date = ? AND project_id = ?
@@ -2124,13 +2867,13 @@ class ReferenceDB:
                 """, (ymd, project_id))
             else:
                 # No project filter
-                cur.execute("""
+                cur = conn.execute("""
                     SELECT path
                     FROM video_metadata
                     WHERE created_date = ?
                     ORDER BY created_ts ASC, path ASC
                 """, (ymd,))
-            return [r[0] for r in cur.fetchall()]
+            return list(map(itemgetter(0), cur))
 
     def get_media_by_date(self, ymd: str, project_id: int | None = None) -> list[str]:
         """
@@ -2150,29 +2893,31 @@ class ReferenceDB:
             >>> db.get_media_by_date("2024-11-12", project_id=1)
             ['/photos/img1.jpg', '/videos/vid1.mp4', '/photos/img2.jpg', '/videos/vid2.mp4']
         """
-        with self._connect() as conn:
-            cur = conn.cursor()
+        with self._connect(read_only=True) as conn:
             if project_id is not None:
-                # UNION photos and videos, ordered by timestamp
-                cur.execute("""
+                # UNION photos and videos, ordered by timestamp. With the
+                # _DAY_GRID_INDEXES each arm is a covering index search already in
+                # (created_ts, path) order, so SQLite merges the two streams
+                # instead of sorting a temp B-tree.
+                cur = conn.execute("""
                     SELECT path, created_ts FROM photo_metadata
-                    WHERE created_date = ? AND project_id = ?
+                    WHERE created_date = ?1 AND project_id = ?2
                     UNION ALL
                     SELECT path, created_ts FROM video_metadata
-                    WHERE created_date = ? AND project_id = ?
+                    WHERE created_date = ?1 AND project_id = ?2
                     ORDER BY created_ts ASC, path ASC
-                """, (ymd, project_id, ymd, project_id))
+                """, (ymd, project_id))
             else:
                 # No project filter - get all media globally
-                cur.execute("""
+                cur = conn.execute("""
                     SELECT path, created_ts FROM photo_metadata
-                    WHERE created_date = ?
+                    WHERE created_date = ?1
                     UNION ALL
                     SELECT path, created_ts FROM video_metadata
-                    WHERE created_date = ?
+                    WHERE created_date = ?1
                     ORDER BY created_ts ASC, path ASC
-                """, (ymd, ymd))
-            return [r[0] for r in cur.fetchall()]
+                """, (ymd,))
+            return list(map(itemgetter(0), cur))
 
 
 # === BEGIN: Quick-date helpers =============================================
@@ -2185,150 +2930,170 @@ class ReferenceDB:
             cur.execute("CREATE INDEX IF NOT EXISTS idx_meta_modified  ON photo_metadata(modified)")
             cur.execute("CREATE INDEX IF NOT EXISTS idx_meta_updated   ON photo_metadata(updated_at)")
             cur.execute("CREATE INDEX IF NOT EXISTS idx_meta_folder    ON photo_metadata(folder_id)")
+            # count_for_folder(): both predicates in one covering range scan. Part of
+            # the v3.3.0 schema, but databases migrated from earlier versions lack it.
+            if "project_id" in self._table_columns(conn, "photo_metadata"):
+                cur.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_photo_metadata_project_folder "
+                    "ON photo_metadata(project_id, folder_id)"
+                )
+                # Recently Indexed with a project: covering seek that already
+                # yields the (updated_at DESC, path) order, so no temp B-tree
+                cur.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_photo_metadata_project_updated "
+                    "ON photo_metadata(project_id, updated_at DESC, path)"
+                )
+            # get_child_folders(): children already in name order, rowid rides along,
+            # so no sort and no table lookup (parent_id IS NULL seeks it too)
+            if "project_id" in self._table_columns(conn, "photo_folders"):
+                cur.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_photo_folders_parent_project_name "
+                    "ON photo_folders(parent_id, project_id, name)"
+                )
+                # Leads with parent_id, so the old single-column index is redundant
+                cur.execute("DROP INDEX IF EXISTS idx_photo_folders_parent")
+            # Serves get_project_images(branch_key=None) in image_path order
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_projimgs_project_path ON project_images(project_id, image_path)")
+            # Most rows carry no label, so the partial index stays small
+            cur.execute(
+                "CREATE INDEX IF NOT EXISTS idx_projimgs_project_label "
+                "ON project_images(project_id, label) WHERE label IS NOT NULL"
+            )
+            # Partial index over representative crops only (tiny next to face_crops)
+            cur.execute(
+                "CREATE INDEX IF NOT EXISTS idx_face_crops_rep_only "
+                "ON face_crops(project_id, is_representative, branch_key, crop_path) WHERE is_representative = 1"
+            )
+            self._create_day_grid_indexes(conn)
             conn.commit()
-
-    # -- internal: compute [start, end] iso dates for a quick key
-    def _date_window_for_key(self, quick_key: str) -> tuple[str | None, str | None, str]:
-        """
-        Returns (start_iso, end_iso, mode)
-        - mode 'meta'  -> filter by date(COALESCE(date_taken, modified))
-        - mode 'updated' -> filter by updated_at (Recently Indexed)
-        """
-        from datetime import datetime, timedelta, timezone
-        # local today (assume strings stored as local timestamps "YYYY-MM-DD HH:MM:SS")
-        today = datetime.now().date()
+        # Folder counts become a primary-key lookup on upgraded databases too
+        self.ensure_folder_photo_counts()
+
+    def _create_day_grid_indexes(self, conn) -> None:
+        """Create the _DAY_GRID_INDEXES whose table has project_id and created_* columns."""
+        needed = {"project_id", "created_date", "created_ts"}
+        for table, ddl in _DAY_GRID_INDEXES.items():
+            if needed <= self._table_columns(conn, table):
+                conn.execute(ddl)
+
+    # -- internal: compute [start, end] created_ts bounds for a quick key
+    def _date_window_for_key(self, quick_key: str, now: datetime | None = None) -> tuple[int | str | None, int | None, str]:
+        """
+        Returns (start, end, mode)
+        - mode 'meta'  -> start/end are inclusive created_ts bounds (local time,
+          whole days), so the filter is an integer range on the created_ts indexes
+        - mode 'updated' -> start is an updated_at string (Recently Indexed)
+
+        now (local, naive) defaults to datetime.now(); pass one value to get
+        consistent windows for several keys.
+        """
+        from datetime import timedelta
+        if now is None:
+            now = datetime.now()
+        # local today (created_ts holds local wall-clock times, see _normalize_created_fields)
+        today = now.date()
         if quick_key == "date:today":
             start = today
-            end = today
-            return (start.isoformat(), end.isoformat(), "meta")
-        if quick_key == "date:this-week":
+        elif quick_key == "date:this-week":
             # Monday as first day of week
             start = today - timedelta(days=today.weekday())
-            end = today
-            return (start.isoformat(), end.isoformat(), "meta")
-        if quick_key == "date:this-month":
+        elif quick_key == "date:this-month":
             start = today.replace(day=1)
-            end = today
-            return (start.isoformat(), end.isoformat(), "meta")
-        if quick_key == "date:last-30d":
+        elif quick_key == "date:last-30d":
             start = today - timedelta(days=29)
-            end = today
-            return (start.isoformat(), end.isoformat(), "meta")
-        if quick_key == "date:this-year":
+        elif quick_key == "date:this-year":
             start = today.replace(month=1, day=1)
-            end = today
-            return (start.isoformat(), end.isoformat(), "meta")
-        if quick_key in ("date:recent", "date:indexed-7d"):
+        elif quick_key in ("date:recent", "date:indexed-7d"):
             # recent by UPDATED_AT (index-friendly)
-            start_dt = datetime.now() - timedelta(days=7)
+            start_dt = now - timedelta(days=7)
             return (start_dt.strftime("%Y-%m-%d %H:%M:%S"), None, "updated")
-        # unsupported → no window
-        return (None, None, "meta")
+        else:
+            # unsupported → no window
+            return (None, None, "meta")
+        start_ts = int(datetime(start.year, start.month, start.day).timestamp())
+        end_ts = int(datetime(today.year, today.month, today.day).timestamp()) + 86400 - 1
+        return (start_ts, end_ts, "meta")
 
-    def _count_between_meta_dates(self, conn, start_iso: str, end_iso: str, project_id: int | None = None) -> int:
-        cur = conn.cursor()
+    @staticmethod
+    def _window_dates(start_ts: int, end_ts: int) -> tuple[str, str]:
+        """The local 'YYYY-MM-DD' days of a _date_window_for_key() range."""
+        return (datetime.fromtimestamp(start_ts).date().isoformat(),
+                datetime.fromtimestamp(end_ts).date().isoformat())
+
+    # Quick-date windows (get_quick_date_counts, get_images_for_quick_key): an
+    # integer range on created_ts instead of date(COALESCE(date_taken, modified))
+    # per row. Bounds come from _date_window_for_key() and span whole local days,
+    # so the project forms filter on the same days as 'YYYY-MM-DD' created_date
+    # bounds (see _window_dates): that is a seek on the (project_id, created_date,
+    # ...) day-grid index, where a created_ts range would walk every index entry
+    # of the project. The project listing orders by that index's own columns,
+    # read backwards (newest first, path descending on equal timestamps), so
+    # there is no temp B-tree sort either.
+    def _count_between_meta_dates(self, conn, start_ts: int, end_ts: int, project_id: int | None = None) -> int:
+        if not self._has_created_columns():
+            return 0
         if project_id is not None:
-            # PERFORMANCE: Use direct project_id column (schema v3.2.0+)
-            cur.execute(
-                """
+            row = conn.execute("""
                 SELECT COUNT(*)
                 FROM photo_metadata
-                WHERE project_id = ?
-                  AND date(COALESCE(date_taken, modified)) BETWEEN ? AND ?
-                """,
-                (project_id, start_iso, end_iso)
-            )
+                WHERE project_id = ?1 AND created_date BETWEEN ?2 AND ?3
+            """, (project_id, *self._window_dates(start_ts, end_ts))).fetchone()
         else:
             # No project filter - count all photos globally
-            cur.execute(
-                """
+            row = conn.execute("""
                 SELECT COUNT(*)
                 FROM photo_metadata
-                WHERE date(COALESCE(date_taken, modified)) BETWEEN ? AND ?
-                """,
-                (start_iso, end_iso)
-            )
-        row = cur.fetchone()
+                WHERE created_ts BETWEEN ? AND ?
+            """, (start_ts, end_ts)).fetchone()
         return int(row[0] or 0)
 
-    def _paths_between_meta_dates(self, conn, start_iso: str, end_iso: str, project_id: int | None = None) -> list[str]:
-        cur = conn.cursor()
+    def _paths_between_meta_dates(self, conn, start_ts: int, end_ts: int, project_id: int | None = None) -> list[str]:
+        if not self._has_created_columns():
+            return []
         if project_id is not None:
-            # Schema v3.0.0: Filter by project_id
-            cur.execute(
-                """
+            cur = conn.execute("""
                 SELECT path
                 FROM photo_metadata
-                WHERE date(COALESCE(date_taken, modified)) BETWEEN ? AND ?
-                  AND project_id = ?
-                ORDER BY COALESCE(date_taken, modified) DESC, path
-                """,
-                (start_iso, end_iso, project_id)
-            )
+                WHERE project_id = ?1 AND created_date BETWEEN ?2 AND ?3
+                ORDER BY created_date DESC, created_ts DESC, path DESC
+            """, (project_id, *self._window_dates(start_ts, end_ts)))
         else:
             # No project filter
-            cur.execute(
-                """
+            cur = conn.execute("""
                 SELECT path
                 FROM photo_metadata
-                WHERE date(COALESCE(date_taken, modified)) BETWEEN ? AND ?
-                ORDER BY COALESCE(date_taken, modified) DESC, path
-                """,
-                (start_iso, end_iso)
-            )
-        return [r[0] for r in cur.fetchall()]
+                WHERE created_ts BETWEEN ? AND ?
+                ORDER BY created_ts DESC, path
+            """, (start_ts, end_ts))
+        return list(map(itemgetter(0), cur))
 
     def _count_recent_updated(self, conn, start_ts: str, project_id: int | None = None) -> int:
-        cur = conn.cursor()
         if project_id is not None:
             # PERFORMANCE: Use direct project_id column (schema v3.2.0+)
-            cur.execute(
-                """
-                SELECT COUNT(*)
-                FROM photo_metadata
-                WHERE project_id = ?
-                  AND updated_at >= ?
-                """,
-                (project_id, start_ts)
-            )
+            row = conn.execute("SELECT COUNT(*) FROM photo_metadata WHERE project_id = ? AND updated_at >= ?", (project_id, start_ts)).fetchone()
         else:
             # No project filter - count all photos globally
-            cur.execute(
-                """
-                SELECT COUNT(*)
-                FROM photo_metadata
-                WHERE updated_at >= ?
-                """,
-                (start_ts,)
-            )
-        row = cur.fetchone()
+            row = conn.execute("SELECT COUNT(*) FROM photo_metadata WHERE updated_at >= ?", (start_ts,)).fetchone()
         return int(row[0] or 0)
 
     def _paths_recent_updated(self, conn, start_ts: str, project_id: int | None = None) -> list[str]:
-        cur = conn.cursor()
         if project_id is not None:
             # Schema v3.0.0: Filter by project_id
-            cur.execute(
-                """
+            cur = conn.execute("""
                 SELECT path
                 FROM photo_metadata
                 WHERE updated_at >= ? AND project_id = ?
                 ORDER BY updated_at DESC, path
-                """,
-                (start_ts, project_id)
-            )
+            """, (start_ts, project_id))
         else:
             # No project filter
-            cur.execute(
-                """
+            cur = conn.execute("""
                 SELECT path
                 FROM photo_metadata
                 WHERE updated_at >= ?
                 ORDER BY updated_at DESC, path
-                """,
-                (start_ts,)
-            )
-        return [r[0] for r in cur.fetchall()]
+            """, (start_ts,))
+        return list(map(itemgetter(0), cur))
 
     def get_quick_date_counts(self, project_id: int | None = None) -> list[dict]:
         """
@@ -2345,15 +3110,46 @@ class ReferenceDB:
             ("date:this-year",   "This Year"),
             ("date:indexed-7d",  "Recently Indexed"),
         ]
+        # One clock reading for all six windows, so they agree on "today"
+        now = datetime.now()
+        params = [project_id]
+        for key, _ in QUICK:
+            start, end, mode = self._date_window_for_key(key, now)
+            if mode == "updated":
+                params.append(start)
+            else:
+                params.extend(self._window_dates(start, end) if project_id is not None else (start, end))
         out = []
-        with self._connect() as conn:
-            for key, label in QUICK:
-                start, end, mode = self._date_window_for_key(key)
-                if mode == "updated":
-                    cnt = self._count_recent_updated(conn, start, project_id) if start else 0
-                else:
-                    cnt = self._count_between_meta_dates(conn, start, end, project_id) if start and end else 0
-                out.append({"key": key, "label": label, "count": cnt})
+        with self._connect(read_only=True) as conn:
+            if not self._has_created_columns():
+                # Pre-migration: only Recently Indexed can be answered
+                counts = [0] * (len(QUICK) - 1) + [self._count_recent_updated(conn, params[-1], project_id)]
+            elif project_id is not None:
+                # Every quick-date count in one statement and one round trip; each
+                # scalar subquery is still its own index range count. ?2..?11 are
+                # the five windows (start, end pairs), ?12 the updated_at cutoff.
+                counts = conn.execute("""
+                    SELECT
+                        (SELECT COUNT(*) FROM photo_metadata WHERE project_id = ?1 AND created_date BETWEEN ?2 AND ?3),
+                        (SELECT COUNT(*) FROM photo_metadata WHERE project_id = ?1 AND created_date BETWEEN ?4 AND ?5),
+                        (SELECT COUNT(*) FROM photo_metadata WHERE project_id = ?1 AND created_date BETWEEN ?6 AND ?7),
+                        (SELECT COUNT(*) FROM photo_metadata WHERE project_id = ?1 AND created_date BETWEEN ?8 AND ?9),
+                        (SELECT COUNT(*) FROM photo_metadata WHERE project_id = ?1 AND created_date BETWEEN ?10 AND ?11),
+                        (SELECT COUNT(*) FROM photo_metadata WHERE project_id = ?1 AND updated_at >= ?12)
+                """, params).fetchone()
+            else:
+                # Same shape on created_ts; ?1 stays bound but unused
+                counts = conn.execute("""
+                    SELECT
+                        (SELECT COUNT(*) FROM photo_metadata WHERE created_ts BETWEEN ?2 AND ?3),
+                        (SELECT COUNT(*) FROM photo_metadata WHERE created_ts BETWEEN ?4 AND ?5),
+                        (SELECT COUNT(*) FROM photo_metadata WHERE created_ts BETWEEN ?6 AND ?7),
+                        (SELECT COUNT(*) FROM photo_metadata WHERE created_ts BETWEEN ?8 AND ?9),
+                        (SELECT COUNT(*) FROM photo_metadata WHERE created_ts BETWEEN ?10 AND ?11),
+                        (SELECT COUNT(*) FROM photo_metadata WHERE updated_at >= ?12)
+                """, params).fetchone()
+        for (key, label), cnt in zip(QUICK, counts):
+            out.append({"key": key, "label": label, "count": int(cnt or 0)})
         return out
 
     def get_images_for_quick_key(self, key: str, project_id: int | None = None) -> list[str]:
@@ -2383,7 +3179,7 @@ class ReferenceDB:
 
         # otherwise treat as a "quick window" key
         start, end, mode = self._date_window_for_key(k)
-        with self._connect() as conn:
+        with self._connect(read_only=True) as conn:
             if mode == "updated":
                 return self._paths_recent_updated(conn, start, project_id) if start else []
             if start and end:
@@ -2437,86 +3233,69 @@ class ReferenceDB:
                 print(f"[build_date_branches] ERROR: Project {project_id} not found!")
                 return 0
 
-            # CRITICAL: First, populate the 'all' branch with ALL photos from THIS project
-            # This ensures the default view shows all photos for the project
-            # Schema v3.0.0: Filter by project_id
-            cur.execute("SELECT path FROM photo_metadata WHERE project_id = ?", (project_id,))
-            all_paths = [r[0] for r in cur.fetchall()]
-            print(f"[build_date_branches] Populating 'all' branch with {len(all_paths)} photos for project {project_id}")
+            # One write transaction for the whole build instead of one per row
+            self._begin_immediate(conn)
 
+            # CRITICAL: First, populate the 'all' branch with ALL photos from THIS project
+            # This ensures the default view shows all photos for the project.
+            # The rows stay materialized (scan, import, tagging and face
+            # detection read and write them as ordinary branch rows); the link
+            # below only adds photos that are not in the branch yet.
             # Ensure 'all' branch exists
             cur.execute(
                 "INSERT OR IGNORE INTO branches (project_id, branch_key, display_name) VALUES (?,?,?)",
                 (project_id, "all", "📁 All Photos"),
             )
 
-            # Insert all photos into 'all' branch
-            all_inserted = 0
-            for p in all_paths:
-                cur.execute(
-                    "INSERT OR IGNORE INTO project_images (project_id, branch_key, image_path) VALUES (?,?,?)",
-                    (project_id, "all", p),
-                )
-                if cur.rowcount > 0:
-                    all_inserted += 1
-            print(f"[build_date_branches] Inserted {all_inserted}/{len(all_paths)} photos into 'all' branch")
+            # Insert all photos into 'all' branch; conn.total_changes deltas
+            # give the linked counts (no triggers on project_images to inflate them)
+            before = conn.total_changes
+            cur.execute("""
+                INSERT OR IGNORE INTO project_images (project_id, branch_key, image_path)
+                SELECT ?1, 'all', path FROM photo_metadata WHERE project_id = ?1
+            """, (project_id,))
+            all_inserted = conn.total_changes - before
+            print(f"[build_date_branches] Linked {all_inserted} new photos into 'all' branch for project {project_id}")
 
             # Now build date-specific branches using created_date (normalized YYYY-MM-DD format)
             # This is consistent with get_date_hierarchy() which also uses created_date
             cur.execute("""
-                SELECT DISTINCT created_date
+                SELECT created_date, COUNT(*)
                 FROM photo_metadata
                 WHERE created_date IS NOT NULL
                   AND project_id = ?
+                GROUP BY created_date
                 ORDER BY created_date
             """, (project_id,))
-            dates = [r[0] for r in cur.fetchall()]
+            dates = cur.fetchall()
             print(f"[build_date_branches] Found {len(dates)} unique dates for project {project_id}")
 
-            n_total = 0
-            for d in dates:
-                branch_key = f"by_date:{d}"
-                branch_name = d
-                # ensure branch exists
-                cur.execute(
-                    "INSERT OR IGNORE INTO branches (project_id, branch_key, display_name) VALUES (?,?,?)",
-                    (project_id, branch_key, branch_name),
-                )
-                # link photos - match on created_date (Schema v3.0.0: filter by project_id)
-                cur.execute(
-                    "SELECT path FROM photo_metadata WHERE created_date = ? AND project_id = ?",
-                    (d, project_id)
-                )
-                paths = [r[0] for r in cur.fetchall()]
-                print(f"[build_date_branches] Date {d}: found {len(paths)} photos for project {project_id}")
-                if len(paths) > 0:
-                    print(f"[build_date_branches] Sample path: {paths[0]}")
-
-                inserted = 0
-                for p in paths:
-                    cur.execute(
-                        "INSERT OR IGNORE INTO project_images (project_id, branch_key, image_path) VALUES (?,?,?)",
-                        (project_id, branch_key, p),
-                    )
-                    if cur.rowcount > 0:
-                        inserted += 1
-                # Note: inserted=0 is normal for incremental scans (photos already linked)
-                status = "new" if inserted > 0 else "already linked"
-                print(f"[build_date_branches] Date {d}: inserted {inserted}/{len(paths)} into project_images ({status})")
-                n_total += len(paths)
+            # ensure one branch per date
+            cur.executemany(
+                "INSERT OR IGNORE INTO branches (project_id, branch_key, display_name) VALUES (?,?,?)",
+                [(project_id, f"by_date:{d}", d) for d, _ in dates],
+            )
+            # link photos - match on created_date (Schema v3.0.0: filter by project_id).
+            # One statement fills every date branch, deriving the key from
+            # created_date, so no path makes the trip through Python.
+            n_total = sum(n for _, n in dates)
+            before = conn.total_changes
+            cur.execute("""
+                INSERT OR IGNORE INTO project_images (project_id, branch_key, image_path)
+                SELECT ?1, 'by_date:' || created_date, path FROM photo_metadata
+                WHERE project_id = ?1 AND created_date IS NOT NULL
+            """, (project_id,))
+            inserted = conn.total_changes - before
+            # Note: inserted=0 is normal for incremental scans (photos already linked)
+            status = "new" if inserted > 0 else "already linked"
+            print(f"[build_date_branches] Date branches: inserted {inserted}/{n_total} into project_images ({status})")
 
-            conn.commit()
             print(f"[build_date_branches] Total entries processed: {n_total}")
 
             # Verify what's in project_images table
             cur.execute("SELECT COUNT(*) FROM project_images WHERE project_id = ?", (project_id,))
             count = cur.fetchone()[0]
             print(f"[build_date_branches] project_images table has {count} rows for project {project_id}")
-        # ✅ Ensure outer connection also flushes
-        try:
-            self._connect().commit()
-        except Exception:
-            pass
 
         return n_total
 
@@ -2549,78 +3328,60 @@ class ReferenceDB:
                 print(f"[build_video_date_branches] ERROR: Project {project_id} not found!")
                 return 0
 
-            # Get all videos with dates
+            # Count videos with dates, per date
             cur.execute("""
-                SELECT path FROM video_metadata
+                SELECT created_date, COUNT(*)
+                FROM video_metadata
                 WHERE project_id = ? AND created_date IS NOT NULL
+                GROUP BY created_date
+                ORDER BY created_date DESC
             """, (project_id,))
-            all_video_paths = [r[0] for r in cur.fetchall()]
-            print(f"[build_video_date_branches] Found {len(all_video_paths)} videos with dates for project {project_id}")
+            dates = cur.fetchall()
+            n_videos = sum(n for _, n in dates)
+            print(f"[build_video_date_branches] Found {n_videos} videos with dates for project {project_id}")
 
-            if not all_video_paths:
+            if not n_videos:
                 print(f"[build_video_date_branches] No videos with dates found, skipping branch creation")
                 return 0
 
+            # One write transaction for the whole build instead of one per row
+            self._begin_immediate(conn)
+
             # Ensure 'all' branch exists for videos
             cur.execute("""
                 INSERT OR IGNORE INTO branches (project_id, branch_key, display_name)
                 VALUES (?,?,?)
             """, (project_id, "videos:all", "🎬 All Videos"))
-
-            # Insert all videos into 'all' branch
-            all_inserted = 0
-            for video_path in all_video_paths:
-                cur.execute("""
-                    INSERT OR IGNORE INTO project_videos (project_id, branch_key, video_path)
-                    VALUES (?,?,?)
-                """, (project_id, "videos:all", video_path))
-                if cur.rowcount > 0:
-                    all_inserted += 1
-            print(f"[build_video_date_branches] Inserted {all_inserted}/{len(all_video_paths)} videos into 'all' branch")
-
-            # Get unique dates from video_metadata
-            cur.execute("""
-                SELECT DISTINCT created_date
-                FROM video_metadata
-                WHERE project_id = ? AND created_date IS NOT NULL
-                ORDER BY created_date DESC
+
+            # Insert all videos into 'all' branch (counted like build_date_branches)
+            before = conn.total_changes
+            cur.execute("""
+                INSERT OR IGNORE INTO project_videos (project_id, branch_key, video_path)
+                SELECT ?1, 'videos:all', path FROM video_metadata
+                WHERE project_id = ?1 AND created_date IS NOT NULL
             """, (project_id,))
-            dates = [r[0] for r in cur.fetchall()]
+            all_inserted = conn.total_changes - before
+            print(f"[build_video_date_branches] Inserted {all_inserted}/{n_videos} videos into 'all' branch")
             print(f"[build_video_date_branches] Found {len(dates)} unique video dates")
 
             # Create branch for each date
-            n_total = 0
-            for date_str in dates:
-                branch_key = f"videos:by_date:{date_str}"
-
-                # Ensure branch exists
-                cur.execute("""
-                    INSERT OR IGNORE INTO branches (project_id, branch_key, display_name)
-                    VALUES (?,?,?)
-                """, (project_id, branch_key, f"📹 {date_str}"))
+            cur.executemany("""
+                INSERT OR IGNORE INTO branches (project_id, branch_key, display_name)
+                VALUES (?,?,?)
+            """, [(project_id, f"videos:by_date:{date_str}", f"📹 {date_str}") for date_str, _ in dates])
 
-                # Get videos for this date
-                cur.execute("""
-                    SELECT path FROM video_metadata
-                    WHERE project_id = ? AND created_date = ?
-                """, (project_id, date_str))
-                video_paths = [r[0] for r in cur.fetchall()]
-
-                # Insert videos into branch
-                inserted = 0
-                for video_path in video_paths:
-                    cur.execute("""
-                        INSERT OR IGNORE INTO project_videos (project_id, branch_key, video_path)
-                        VALUES (?,?,?)
-                    """, (project_id, branch_key, video_path))
-                    if cur.rowcount > 0:
-                        inserted += 1
-
-                status = "new" if inserted > 0 else "already linked"
-                print(f"[build_video_date_branches] Date {date_str}: inserted {inserted}/{len(video_paths)} ({status})")
-                n_total += len(video_paths)
+            # Link every dated video into its date's branch
+            n_total = n_videos
+            before = conn.total_changes
+            cur.execute("""
+                INSERT OR IGNORE INTO project_videos (project_id, branch_key, video_path)
+                SELECT ?1, 'videos:by_date:' || created_date, path FROM video_metadata
+                WHERE project_id = ?1 AND created_date IS NOT NULL
+            """, (project_id,))
+            inserted = conn.total_changes - before
+            status = "new" if inserted > 0 else "already linked"
+            print(f"[build_video_date_branches] Date branches: inserted {inserted}/{n_total} ({status})")
 
-            conn.commit()
             print(f"[build_video_date_branches] Total entries processed: {n_total}")
 
             # Verify what's in project_videos table
@@ -2628,12 +3389,6 @@ class ReferenceDB:
             count = cur.fetchone()[0]
             print(f"[build_video_date_branches] project_videos table has {count} rows for project {project_id}")
 
-        # Ensure outer connection also flushes
-        try:
-            self._connect().commit()
-        except Exception:
-            pass
-
         return n_total
 
 
@@ -2653,35 +3408,52 @@ class ReferenceDB:
         Returns:
             Nested dict {year: {month: [days...]}}
         """
-        from collections import defaultdict
-        hier = defaultdict(lambda: defaultdict(list))
-        with self._connect() as conn:
-            cur = conn.cursor()
-            if project_id is not None:
-                # PERFORMANCE: Use direct project_id column (schema v3.2.0+)
-                # Uses compound index idx_photo_metadata_project_date for fast filtering
-                cur.execute("""
-                    SELECT DISTINCT created_date
-                    FROM photo_metadata
-                    WHERE project_id = ?
-                      AND created_date IS NOT NULL
-                    ORDER BY created_date ASC
-                """, (project_id,))
-            else:
-                # No project filter - use all photos globally
-                cur.execute("""
-                    SELECT DISTINCT created_date
-                    FROM photo_metadata
-                    WHERE created_date IS NOT NULL
-                    ORDER BY created_date ASC
-                """)
-            for (ds,) in cur.fetchall():
-                try:
-                    y, m, d = str(ds).split("-", 2)
+        # Year and month are split off in SQL; the GLOB keeps out values that do
+        # not look like YYYY-MM-..., which the old Python split() used to skip.
+        if project_id is not None:
+            # PERFORMANCE: Use direct project_id column (schema v3.2.0+)
+            # Uses compound index idx_photo_metadata_project_date for fast filtering
+            return self._date_hierarchy("""
+                SELECT substr(created_date, 1, 4), substr(created_date, 6, 2), created_date
+                FROM photo_metadata
+                WHERE project_id = ?
+                  AND created_date GLOB '????-??-*'
+                GROUP BY created_date
+                ORDER BY created_date ASC
+            """, (project_id,))
+        # No project filter - use all photos globally
+        return self._date_hierarchy("""
+            SELECT substr(created_date, 1, 4), substr(created_date, 6, 2), created_date
+            FROM photo_metadata
+            WHERE created_date GLOB '????-??-*'
+            GROUP BY created_date
+            ORDER BY created_date ASC
+        """, ())
+
+    def _date_hierarchy(self, sql: str, params) -> dict:
+        """
+        {year: {month: [days...]}} from sql's (year, month, day) rows, memoized
+        per thread and statement.
+
+        The cache token is the reader handle's PRAGMA data_version, which
+        changes whenever any other connection (this thread's writer included)
+        commits, so an unchanged database costs one pragma instead of the
+        DISTINCT scan. Callers get their own copy to mutate.
+        """
+        cache = getattr(self._pool_local, "hier_cache", None)
+        if cache is None:
+            cache = self._pool_local.hier_cache = {}
+        key = (sql, params)
+        with self._connect(read_only=True) as conn:
+            token = (ReferenceDB._pool_generation, id(conn),
+                     conn.execute("PRAGMA data_version").fetchone()[0])
+            hit = cache.get(key)
+            if hit is None or hit[0] != token:
+                hier = defaultdict(lambda: defaultdict(list))
+                for y, m, ds in conn.execute(sql, params):
                     hier[y][m].append(ds)
-                except Exception:
-                    pass
-        return {y: dict(m) for y, m in hier.items()}
+                hit = cache[key] = (token, {y: dict(m) for y, m in hier.items()})
+        return {y: {m: list(days) for m, days in months.items()} for y, months in hit[1].items()}
 
     def count_for_year(self, year: int | str, project_id: int | None = None) -> int:
         """
@@ -2691,25 +3463,17 @@ class ReferenceDB:
             year: Year to count (e.g., 2024)
             project_id: Filter by project_id if provided, otherwise count all photos globally
         """
-        y = str(year)
-        with self._connect() as conn:
-            cur = conn.cursor()
+        rng = _year_range(year)
+        if rng is None:
+            return 0
+        with self._connect(read_only=True) as conn:
             if project_id is not None:
                 # PERFORMANCE: Use direct project_id column (schema v3.2.0+)
                 # Uses compound index idx_photo_metadata_project_date for fast filtering
-                cur.execute("""
-                    SELECT COUNT(*)
-                    FROM photo_metadata
-                    WHERE project_id = ?
-                      AND created_date LIKE ? || '-%'
-                """, (project_id, y))
+                row = conn.execute(_SQL_COUNT_PHOTOS_RANGE_PROJECT, (project_id, *rng)).fetchone()
             else:
                 # No project filter - count all photos globally
-                cur.execute("""
-                    SELECT COUNT(*) FROM photo_metadata
-                    WHERE created_date LIKE ? || '-%'
-                """, (y,))
-            row = cur.fetchone()
+                row = conn.execute(_SQL_COUNT_PHOTOS_RANGE, rng).fetchone()
             return int(row[0] if row and row[0] is not None else 0)
 
     def count_for_month(self, year: int | str, month: int | str, project_id: int | None = None) -> int:
@@ -2721,27 +3485,17 @@ class ReferenceDB:
             month: Month (1-12)
             project_id: Filter by project_id if provided, otherwise count all photos globally
         """
-        y = str(year)
-        m = f"{int(month):02d}" if str(month).isdigit() else str(month)
-        ym = f"{y}-{m}"
-        with self._connect() as conn:
-            cur = conn.cursor()
+        rng = _month_range(year, month)
+        if rng is None:
+            return 0
+        with self._connect(read_only=True) as conn:
             if project_id is not None:
                 # PERFORMANCE: Use direct project_id column (schema v3.2.0+)
                 # Uses compound index idx_photo_metadata_project_date for fast filtering
-                cur.execute("""
-                    SELECT COUNT(*)
-                    FROM photo_metadata
-                    WHERE project_id = ?
-                      AND created_date LIKE ? || '-%'
-                """, (project_id, ym))
+                row = conn.execute(_SQL_COUNT_PHOTOS_RANGE_PROJECT, (project_id, *rng)).fetchone()
             else:
                 # No project filter - count all photos globally
-                cur.execute("""
-                    SELECT COUNT(*) FROM photo_metadata
-                    WHERE created_date LIKE ? || '-%'
-                """, (ym,))
-            row = cur.fetchone()
+                row = conn.execute(_SQL_COUNT_PHOTOS_RANGE, rng).fetchone()
             return int(row[0] if row and row[0] is not None else 0)
 
     def count_for_day(self, day_yyyymmdd: str, project_id: int | None = None) -> int:
@@ -2752,24 +3506,14 @@ class ReferenceDB:
             day_yyyymmdd: Date in YYYY-MM-DD format
             project_id: Filter by project_id if provided, otherwise count all photos globally
         """
-        with self._connect() as conn:
-            cur = conn.cursor()
+        with self._connect(read_only=True) as conn:
             if project_id is not None:
                 # PERFORMANCE: Use direct project_id column (schema v3.2.0+)
                 # Uses compound index idx_photo_metadata_project_date for fast filtering
-                cur.execute("""
-                    SELECT COUNT(*)
-                    FROM photo_metadata
-                    WHERE project_id = ?
-                      AND created_date = ?
-                """, (project_id, day_yyyymmdd))
+                row = conn.execute("SELECT COUNT(*) FROM photo_metadata WHERE project_id = ? AND created_date = ?", (project_id, day_yyyymmdd)).fetchone()
             else:
                 # No project filter - count all photos globally
-                cur.execute("""
-                    SELECT COUNT(*) FROM photo_metadata
-                    WHERE created_date = ?
-                """, (day_yyyymmdd,))
-            row = cur.fetchone()
+                row = conn.execute("SELECT COUNT(*) FROM photo_metadata WHERE created_date = ?", (day_yyyymmdd,)).fetchone()
             return int(row[0] if row and row[0] is not None else 0)
 
 
@@ -2788,34 +3532,25 @@ class ReferenceDB:
         Returns:
             Nested dict {year: {month: [days...]}}
         """
-        from collections import defaultdict
-        hier = defaultdict(lambda: defaultdict(list))
-        with self._connect() as conn:
-            cur = conn.cursor()
-            if project_id is not None:
-                # Filter by project_id (video_metadata has project_id column)
-                cur.execute("""
-                    SELECT DISTINCT created_date
-                    FROM video_metadata
-                    WHERE project_id = ?
-                      AND created_date IS NOT NULL
-                    ORDER BY created_date ASC
-                """, (project_id,))
-            else:
-                # No project filter - use all videos globally
-                cur.execute("""
-                    SELECT DISTINCT created_date
-                    FROM video_metadata
-                    WHERE created_date IS NOT NULL
-                    ORDER BY created_date ASC
-                """)
-            for (ds,) in cur.fetchall():
-                try:
-                    y, m, d = str(ds).split("-", 2)
-                    hier[y][m].append(ds)
-                except Exception:
-                    pass
-        return {y: dict(m) for y, m in hier.items()}
+        # Same statement shape as get_date_hierarchy()
+        if project_id is not None:
+            # Filter by project_id (video_metadata has project_id column)
+            return self._date_hierarchy("""
+                SELECT substr(created_date, 1, 4), substr(created_date, 6, 2), created_date
+                FROM video_metadata
+                WHERE project_id = ?
+                  AND created_date GLOB '????-??-*'
+                GROUP BY created_date
+                ORDER BY created_date ASC
+            """, (project_id,))
+        # No project filter - use all videos globally
+        return self._date_hierarchy("""
+            SELECT substr(created_date, 1, 4), substr(created_date, 6, 2), created_date
+            FROM video_metadata
+            WHERE created_date GLOB '????-??-*'
+            GROUP BY created_date
+            ORDER BY created_date ASC
+        """, ())
 
     def list_video_years_with_counts(self, project_id: int | None = None) -> list[tuple[int, int]]:
         """
@@ -2828,10 +3563,9 @@ class ReferenceDB:
             [(year, count)] newest first
         """
         with self._connect() as conn:
-            cur = conn.cursor()
             if project_id is not None:
                 # Filter by project_id
-                cur.execute("""
+                cur = conn.execute("""
                     SELECT created_year, COUNT(*)
                     FROM video_metadata
                     WHERE project_id = ?
@@ -2841,7 +3575,7 @@ class ReferenceDB:
                 """, (project_id,))
             else:
                 # No project filter - count all videos globally
-                cur.execute("""
+                cur = conn.execute("""
                     SELECT created_year, COUNT(*)
                     FROM video_metadata
                     WHERE created_year IS NOT NULL
@@ -2861,24 +3595,16 @@ class ReferenceDB:
         Returns:
             Count of videos in that year
         """
-        y = str(year)
-        with self._connect() as conn:
-            cur = conn.cursor()
+        rng = _year_range(year)
+        if rng is None:
+            return 0
+        with self._connect(read_only=True) as conn:
             if project_id is not None:
                 # Filter by project_id
-                cur.execute("""
-                    SELECT COUNT(*)
-                    FROM video_metadata
-                    WHERE project_id = ?
-                      AND created_date LIKE ? || '-%'
-                """, (project_id, y))
+                row = conn.execute(_SQL_COUNT_VIDEOS_RANGE_PROJECT, (project_id, *rng)).fetchone()
             else:
                 # No project filter - count all videos globally
-                cur.execute("""
-                    SELECT COUNT(*) FROM video_metadata
-                    WHERE created_date LIKE ? || '-%'
-                """, (y,))
-            row = cur.fetchone()
+                row = conn.execute(_SQL_COUNT_VIDEOS_RANGE, rng).fetchone()
             return int(row[0] if row and row[0] is not None else 0)
 
     def count_videos_for_month(self, year: int | str, month: int | str, project_id: int | None = None) -> int:
@@ -2893,26 +3619,16 @@ class ReferenceDB:
         Returns:
             Count of videos in that month
         """
-        y = str(year)
-        m = f"{int(month):02d}" if str(month).isdigit() else str(month)
-        ym = f"{y}-{m}"
-        with self._connect() as conn:
-            cur = conn.cursor()
+        rng = _month_range(year, month)
+        if rng is None:
+            return 0
+        with self._connect(read_only=True) as conn:
             if project_id is not None:
                 # Filter by project_id
-                cur.execute("""
-                    SELECT COUNT(*)
-                    FROM video_metadata
-                    WHERE project_id = ?
-                      AND created_date LIKE ? || '-%'
-                """, (project_id, ym))
+                row = conn.execute(_SQL_COUNT_VIDEOS_RANGE_PROJECT, (project_id, *rng)).fetchone()
             else:
                 # No project filter - count all videos globally
-                cur.execute("""
-                    SELECT COUNT(*) FROM video_metadata
-                    WHERE created_date LIKE ? || '-%'
-                """, (ym,))
-            row = cur.fetchone()
+                row = conn.execute(_SQL_COUNT_VIDEOS_RANGE, rng).fetchone()
             return int(row[0] if row and row[0] is not None else 0)
 
     def count_videos_for_day(self, day_yyyymmdd: str, project_id: int | None = None) -> int:
@@ -2926,23 +3642,13 @@ class ReferenceDB:
         Returns:
             Count of videos on that day
         """
-        with self._connect() as conn:
-            cur = conn.cursor()
+        with self._connect(read_only=True) as conn:
             if project_id is not None:
                 # Filter by project_id
-                cur.execute("""
-                    SELECT COUNT(*)
-                    FROM video_metadata
-                    WHERE project_id = ?
-                      AND created_date = ?
-                """, (project_id, day_yyyymmdd))
+                row = conn.execute("SELECT COUNT(*) FROM video_metadata WHERE project_id = ? AND created_date = ?", (project_id, day_yyyymmdd)).fetchone()
             else:
                 # No project filter - count all videos globally
-                cur.execute("""
-                    SELECT COUNT(*) FROM video_metadata
-                    WHERE created_date = ?
-                """, (day_yyyymmdd,))
-            row = cur.fetchone()
+                row = conn.execute("SELECT COUNT(*) FROM video_metadata WHERE created_date = ?", (day_yyyymmdd,)).fetchone()
             return int(row[0] if row and row[0] is not None else 0)
 
 
@@ -2966,28 +3672,16 @@ class ReferenceDB:
             >>> db.count_media_for_year(2024, project_id=1)
             523  # 395 photos + 128 videos
         """
-        y = str(year)
-        with self._connect() as conn:
-            cur = conn.cursor()
+        rng = _year_range(year)
+        if rng is None:
+            return 0
+        with self._connect(read_only=True) as conn:
             if project_id is not None:
                 # Filter by project_id for both tables
-                cur.execute("""
-                    SELECT
-                        (SELECT COUNT(*) FROM photo_metadata
-                         WHERE project_id = ? AND created_date LIKE ? || '-%')
-                        +
-                        (SELECT COUNT(*) FROM video_metadata
-                         WHERE project_id = ? AND created_date LIKE ? || '-%')
-                """, (project_id, y, project_id, y))
+                row = conn.execute(_SQL_COUNT_MEDIA_RANGE_PROJECT, (project_id, *rng)).fetchone()
             else:
                 # No project filter - count all media globally
-                cur.execute("""
-                    SELECT
-                        (SELECT COUNT(*) FROM photo_metadata WHERE created_date LIKE ? || '-%')
-                        +
-                        (SELECT COUNT(*) FROM video_metadata WHERE created_date LIKE ? || '-%')
-                """, (y, y))
-            row = cur.fetchone()
+                row = conn.execute(_SQL_COUNT_MEDIA_RANGE, rng).fetchone()
             return int(row[0] if row and row[0] is not None else 0)
 
     def count_media_for_month(self, year: int | str, month: int | str, project_id: int | None = None) -> int:
@@ -3006,30 +3700,16 @@ class ReferenceDB:
             >>> db.count_media_for_month(2024, 11, project_id=1)
             87  # 62 photos + 25 videos in November 2024
         """
-        y = str(year)
-        m = f"{int(month):02d}" if str(month).isdigit() else str(month)
-        ym = f"{y}-{m}"
-        with self._connect() as conn:
-            cur = conn.cursor()
+        rng = _month_range(year, month)
+        if rng is None:
+            return 0
+        with self._connect(read_only=True) as conn:
             if project_id is not None:
                 # Filter by project_id for both tables
-                cur.execute("""
-                    SELECT
-                        (SELECT COUNT(*) FROM photo_metadata
-                         WHERE project_id = ? AND created_date LIKE ? || '-%')
-                        +
-                        (SELECT COUNT(*) FROM video_metadata
-                         WHERE project_id = ? AND created_date LIKE ? || '-%')
-                """, (project_id, ym, project_id, ym))
+                row = conn.execute(_SQL_COUNT_MEDIA_RANGE_PROJECT, (project_id, *rng)).fetchone()
             else:
                 # No project filter - count all media globally
-                cur.execute("""
-                    SELECT
-                        (SELECT COUNT(*) FROM photo_metadata WHERE created_date LIKE ? || '-%')
-                        +
-                        (SELECT COUNT(*) FROM video_metadata WHERE created_date LIKE ? || '-%')
-                """, (ym, ym))
-            row = cur.fetchone()
+                row = conn.execute(_SQL_COUNT_MEDIA_RANGE, rng).fetchone()
             return int(row[0] if row and row[0] is not None else 0)
 
     def count_media_for_day(self, day_yyyymmdd: str, project_id: int | None = None) -> int:
@@ -3047,27 +3727,23 @@ class ReferenceDB:
             >>> db.count_media_for_day("2024-11-12", project_id=1)
             23  # 15 photos + 8 videos on Nov 12, 2024
         """
-        with self._connect() as conn:
-            cur = conn.cursor()
+        with self._connect(read_only=True) as conn:
             if project_id is not None:
                 # Filter by project_id for both tables
-                cur.execute("""
+                row = conn.execute("""
                     SELECT
-                        (SELECT COUNT(*) FROM photo_metadata
-                         WHERE project_id = ? AND created_date = ?)
+                        (SELECT COUNT(*) FROM photo_metadata WHERE project_id = ?1 AND created_date = ?2)
                         +
-                        (SELECT COUNT(*) FROM video_metadata
-                         WHERE project_id = ? AND created_date = ?)
-                """, (project_id, day_yyyymmdd, project_id, day_yyyymmdd))
+                        (SELECT COUNT(*) FROM video_metadata WHERE project_id = ?1 AND created_date = ?2)
+                """, (project_id, day_yyyymmdd)).fetchone()
             else:
                 # No project filter - count all media globally
-                cur.execute("""
+                row = conn.execute("""
                     SELECT
-                        (SELECT COUNT(*) FROM photo_metadata WHERE created_date = ?)
+                        (SELECT COUNT(*) FROM photo_metadata WHERE created_date = ?1)
                         +
-                        (SELECT COUNT(*) FROM video_metadata WHERE created_date = ?)
-                """, (day_yyyymmdd, day_yyyymmdd))
-            row = cur.fetchone()
+                        (SELECT COUNT(*) FROM video_metadata WHERE created_date = ?1)
+                """, (day_yyyymmdd,)).fetchone()
             return int(row[0] if row and row[0] is not None else 0)
 
 
@@ -3087,10 +3763,8 @@ class ReferenceDB:
         prefix = f"{y}-{m}"
 
         with self._connect() as conn:
-            cur = conn.cursor()
             # pick available column
-            cur.execute("PRAGMA table_info(photo_metadata)")
-            cols = {r[1] for r in cur.fetchall()}
+            cols = self._table_columns(conn, "photo_metadata")
             if "created_date" in cols:
                 date_col = "created_date"
             elif "date_taken" in cols:
@@ -3100,7 +3774,7 @@ class ReferenceDB:
 
             if project_id is not None:
                 # Schema v3.0.0: Filter by project_id
-                cur.execute(
+                cur = conn.execute(
                     f"""
                     SELECT path FROM photo_metadata
                     WHERE {date_col} LIKE ? || '%' AND project_id = ?
@@ -3110,7 +3784,7 @@ class ReferenceDB:
                 )
             else:
                 # No project filter
-                cur.execute(
+                cur = conn.execute(
                     f"""
                     SELECT path FROM photo_metadata
                     WHERE {date_col} LIKE ? || '%'
@@ -3118,7 +3792,7 @@ class ReferenceDB:
                     """,
                     (prefix,)
                 )
-            return [r[0] for r in cur.fetchall()]
+            return list(map(itemgetter(0), cur))
 
     # ======================================================
     # 🏷️ New Tagging System (normalized)
@@ -3126,11 +3800,10 @@ class ReferenceDB:
 
     def _get_photo_id_by_path(self, path: str, project_id: int | None = None) -> int | None:
         with self._connect() as conn:
-            cur = conn.cursor()
             if project_id is not None:
-                cur.execute("SELECT id FROM photo_metadata WHERE path = ? AND project_id = ?", (path, project_id))
+                cur = conn.execute("SELECT id FROM photo_metadata WHERE path = ? AND project_id = ?", (path, project_id))
             else:
-                cur.execute("SELECT id FROM photo_metadata WHERE path = ?", (path,))
+                cur = conn.execute("SELECT id FROM photo_metadata WHERE path = ?", (path,))
             row = cur.fetchone()
             return row[0] if row else None
 
@@ -3300,13 +3973,15 @@ class ReferenceDB:
         with self._connect() as conn:
             cur = conn.cursor()
             # Add GPS columns if they don't exist yet
-            existing_cols = [r[1] for r in cur.execute("PRAGMA table_info(photo_metadata)")]
-            if 'gps_latitude' not in existing_cols:
-                cur.execute("ALTER TABLE photo_metadata ADD COLUMN gps_latitude REAL")
-            if 'gps_longitude' not in existing_cols:
-                cur.execute("ALTER TABLE photo_metadata ADD COLUMN gps_longitude REAL")
-            if 'location_name' not in existing_cols:
-                cur.execute("ALTER TABLE photo_metadata ADD COLUMN location_name TEXT")
+            existing_cols = self._table_columns(conn, "photo_metadata")
+            if not {'gps_latitude', 'gps_longitude', 'location_name'} <= existing_cols:
+                if 'gps_latitude' not in existing_cols:
+                    cur.execute("ALTER TABLE photo_metadata ADD COLUMN gps_latitude REAL")
+                if 'gps_longitude' not in existing_cols:
+                    cur.execute("ALTER TABLE photo_metadata ADD COLUMN gps_longitude REAL")
+                if 'location_name' not in existing_cols:
+                    cur.execute("ALTER TABLE photo_metadata ADD COLUMN location_name TEXT")
+                self._invalidate_table_columns("photo_metadata")
             
             # Update the photo record
             cur.execute("""
@@ -3325,7 +4000,7 @@ class ReferenceDB:
         with self._connect() as conn:
             cur = conn.cursor()
             # First check if GPS columns exist
-            existing_cols = [r[1] for r in cur.execute("PRAGMA table_info(photo_metadata)")]
+            existing_cols = self._table_columns(conn, "photo_metadata")
             if 'gps_latitude' not in existing_cols or 'gps_longitude' not in existing_cols:
                 return {}
             
@@ -3514,7 +4189,6 @@ class ReferenceDB:
         paths_with_tags = 0
         
         with self._connect() as conn:
-            cur = conn.cursor()
             for i in range(0, len(npaths), CHUNK):
                 chunk = npaths[i:i+CHUNK]
                 if project_id is not None:
@@ -3545,10 +4219,10 @@ class ReferenceDB:
                         print(f"[DB_TAGS_SQL] project_id: {project_id}")
                     
                     # Execute both queries and combine results
-                    cur.execute(q_photos, chunk + [project_id])
+                    cur = conn.execute(q_photos, chunk + [project_id])
                     rows = cur.fetchall()
                     
-                    cur.execute(q_videos, chunk + [project_id])
+                    cur = conn.execute(q_videos, chunk + [project_id])
                     video_rows = cur.fetchall()
                     rows.extend(video_rows)
                     
@@ -3603,10 +4277,10 @@ class ReferenceDB:
                         JOIN tags t        ON t.id = vt.tag_id
                         WHERE vm.path IN ({','.join(['?']*len(chunk))})
                     """
-                    cur.execute(q_photos, chunk)
+                    cur = conn.execute(q_photos, chunk)
                     rows = cur.fetchall()
                     
-                    cur.execute(q_videos, chunk)
+                    cur = conn.execute(q_videos, chunk)
                     video_rows = cur.fetchall()
                     rows.extend(video_rows)
                 for row in rows:
@@ -3735,21 +4409,24 @@ class ReferenceDB:
             cur = conn.cursor()
 
             if include_subfolders:
-                # Get all descendant folder IDs
-                folder_ids = self.get_descendant_folder_ids(folder_id, project_id=project_id)
-                placeholders = ','.join('?' * len(folder_ids))
-
-                rows = cur.execute(f"""
+                # Folder subtree walked inside the query; fixed SQL text
+                rows = cur.execute("""
+                    WITH RECURSIVE sub(id) AS (
+                        SELECT ?1
+                        UNION
+                        SELECT f.id FROM photo_folders f JOIN sub ON f.parent_id = sub.id
+                        WHERE f.project_id = ?2
+                    )
                     SELECT DISTINCT pm.path
                     FROM photo_metadata pm
                     JOIN photo_tags pt ON pm.id = pt.photo_id
                     JOIN tags t ON pt.tag_id = t.id
-                    WHERE pm.project_id = ?
-                      AND pm.folder_id IN ({placeholders})
-                      AND t.name = ?
-                      AND t.project_id = ?
+                    WHERE pm.project_id = ?2
+                      AND pm.folder_id IN sub
+                      AND t.name = ?3
+                      AND t.project_id = ?2
                     ORDER BY pm.path
-                """, [project_id] + folder_ids + [tag_name, project_id]).fetchall()
+                """, (folder_id, project_id, tag_name)).fetchall()
             else:
                 rows = cur.execute("""
                     SELECT DISTINCT pm.path
@@ -3874,11 +4551,10 @@ class ReferenceDB:
         Performance: Uses compound index idx_photo_metadata_project_folder for fast filtering.
         """
         with self._connect() as conn:
-            cur = conn.cursor()
             if project_id is not None:
                 # PERFORMANCE: Use direct project_id column (no JOIN to project_images needed)
                 # Schema v3.2.0 has project_id directly in photo_metadata and photo_folders
-                cur.execute("""
+                cur = conn.execute("""
                     WITH RECURSIVE subfolders(id) AS (
                         SELECT id FROM photo_folders
                         WHERE id = ? AND project_id = ?
@@ -3895,7 +4571,7 @@ class ReferenceDB:
                 """, (folder_id, project_id, project_id, project_id))
             else:
                 # No filter - count all photos (backward compatibility)
-                cur.execute("""
+                cur = conn.execute("""
                     WITH RECURSIVE subfolders(id) AS (
                         SELECT id FROM photo_folders WHERE id = ?
                         UNION ALL
@@ -3933,11 +4609,9 @@ class ReferenceDB:
         Note: Uses compound index idx_photo_metadata_project_folder for optimal performance.
         """
         with self._connect() as conn:
-            cur = conn.cursor()
 
-            # OPTIMIZATION: Get counts for ALL folders at once using recursive CTE
             # This replaces N individual queries with ONE query
-            cur.execute("""
+            cur = conn.execute("""
                 WITH RECURSIVE folder_tree AS (
                     -- Start with all folders in this project
                     SELECT id, parent_id, id as root_id
@@ -3996,11 +4670,9 @@ class ReferenceDB:
         Note: Uses same recursive CTE pattern as photo counts.
         """
         with self._connect() as conn:
-            cur = conn.cursor()
 
-            # OPTIMIZATION: Get counts for ALL folders at once using recursive CTE
             # This replaces N individual queries with ONE query
-            cur.execute("""
+            cur = conn.execute("""
                 WITH RECURSIVE folder_tree AS (
                     -- Start with all folders in this project
                     SELECT id, parent_id, id as root_id
@@ -4067,11 +4739,9 @@ class ReferenceDB:
               idx_video_metadata_project_date for optimal performance.
         """
         with self._connect() as conn:
-            cur = conn.cursor()
 
-            # OPTIMIZATION: Single query with GROUP BY instead of N individual COUNTs
             # Combines photos and videos, groups by date fields
-            cur.execute("""
+            cur = conn.execute("""
                 WITH all_dates AS (
                     -- Get all photo dates
                     SELECT created_date, created_year
@@ -4145,10 +4815,8 @@ class ReferenceDB:
             day_count = video_counts['days'].get('2024-11-12', 0)  # 2
         """
         with self._connect() as conn:
-            cur = conn.cursor()
 
-            # OPTIMIZATION: Single query with GROUP BY instead of N individual COUNTs
-            cur.execute("""
+            cur = conn.execute("""
                 SELECT
                     created_year,
                     SUBSTR(created_date, 1, 7) as year_month,
@@ -4301,26 +4969,19 @@ class ReferenceDB:
     def ensure_created_date_fields(self) -> None:
         """Add created_ts / created_date / created_year + indexes (idempotent)."""
         with self._connect() as conn:
-            cur = conn.cursor()
-            cur.execute("PRAGMA table_info(photo_metadata)")
-            cols = {row[1] for row in cur.fetchall()}
-            if "created_ts" not in cols:
-                cur.execute("ALTER TABLE photo_metadata ADD COLUMN created_ts INTEGER")
-            if "created_date" not in cols:
-                cur.execute("ALTER TABLE photo_metadata ADD COLUMN created_date TEXT")
-            if "created_year" not in cols:
-                cur.execute("ALTER TABLE photo_metadata ADD COLUMN created_year INTEGER")
-            cur.execute("CREATE INDEX IF NOT EXISTS idx_photo_created_year  ON photo_metadata(created_year)")
-            cur.execute("CREATE INDEX IF NOT EXISTS idx_photo_created_date  ON photo_metadata(created_date)")
-            cur.execute("CREATE INDEX IF NOT EXISTS idx_photo_created_ts    ON photo_metadata(created_ts)")
-            conn.commit()
+            # One transaction for the whole migration
+            self._begin_immediate(conn)
+            self._add_missing_columns(conn, "photo_metadata", _CREATED_COLUMNS)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_photo_created_year  ON photo_metadata(created_year)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_photo_created_date  ON photo_metadata(created_date)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_photo_created_ts    ON photo_metadata(created_ts)")
+            self._create_day_grid_indexes(conn)
 
     def count_missing_created_fields(self) -> int:
         """Return how many rows still need created_* filled. If cols missing, return total rows."""
         with self._connect() as conn:
             cur = conn.cursor()
-            cur.execute("PRAGMA table_info(photo_metadata)")
-            cols = {row[1] for row in cur.fetchall()}
+            cols = self._table_columns(conn, "photo_metadata")
             if not {"created_ts", "created_date", "created_year"}.issubset(cols):
                 cur.execute("SELECT COUNT(*) FROM photo_metadata")
                 return cur.fetchone()[0]
@@ -4357,8 +5018,7 @@ class ReferenceDB:
 
         with self._connect() as conn:
             cur = conn.cursor()
-            cur.execute("PRAGMA table_info(photo_metadata)")
-            cols = {row[1] for row in cur.fetchall()}
+            cols = self._table_columns(conn, "photo_metadata")
             if not {"created_ts", "created_date", "created_year"}.issubset(cols):
                 return 0
 
@@ -4432,8 +5092,7 @@ class ReferenceDB:
             cur = conn.cursor()
 
             # Check if video_metadata has created_* columns
-            cur.execute("PRAGMA table_info(video_metadata)")
-            cols = {row[1] for row in cur.fetchall()}
+            cols = self._table_columns(conn, "video_metadata")
             if not {"created_ts", "created_date", "created_year"}.issubset(cols):
                 return 0
 
@@ -4614,7 +5273,6 @@ class ReferenceDB:
         all_keys = [target_branch] + src_list
 
         from datetime import datetime
-        import json as _json
 
         with self._connect() as conn:
 
@@ -4728,7 +5386,7 @@ class ReferenceDB:
                         project_id,
                         target_branch,
                         ",".join(src_list),
-                        _json.dumps(snapshot),
+                        _json_dumps(snapshot),
                         datetime.utcnow().isoformat(timespec="seconds"),
                     ),
                 )
@@ -4947,65 +5605,35 @@ class ReferenceDB:
                 "distance": float
             }
         """
-        import math
-        import array
+        import numpy as np
 
-        reps = self.get_face_branch_reps(project_id)
-        if not reps:
+        reps, centroids = self.get_face_branch_centroids(project_id, min_count=min_count)
+        if len(reps) < 2:
             return []
 
-        # Only consider clusters with a centroid and at least min_count faces
-        filtered = [
-            r for r in reps
-            if r.get("centroid_bytes") is not None
-            and (r.get("count") or 0) >= min_count
-        ]
-        if len(filtered) < 2:
-            return []
+        # All pairwise Euclidean distances at once: |a|^2 + |b|^2 - 2ab, with the
+        # Gram matrix from a single matmul (float64 to avoid cancellation)
+        X = centroids.astype(np.float64)
+        sq = np.einsum("ij,ij->i", X, X)
+        dist = np.sqrt(np.maximum(sq[:, None] + sq[None, :] - 2.0 * (X @ X.T), 0.0))
 
-        # Decode centroid bytes into arrays of float32
-        vecs = []
-        for r in filtered:
-            centroid_bytes = r["centroid_bytes"]
-            arr = array.array("f")
-            try:
-                arr.frombytes(centroid_bytes)
-            except Exception:
-                # If decoding fails for some row, just skip it
-                continue
-            vecs.append(
-                (
-                    r["branch_key"],
-                    r.get("label") or r["branch_key"],
-                    r.get("count") or 0,
-                    arr,
-                )
-            )
+        ii, jj = np.triu_indices(len(reps), k=1)
+        close = dist[ii, jj] <= threshold
 
         suggestions: list[dict] = []
-        n = len(vecs)
-        for i in range(n):
-            key_i, label_i, cnt_i, v_i = vecs[i]
-            for j in range(i + 1, n):
-                key_j, label_j, cnt_j, v_j = vecs[j]
-                if len(v_i) != len(v_j) or not v_i:
-                    continue
-                # Euclidean distance
-                dist = math.sqrt(
-                    sum((v_i[k] - v_j[k]) ** 2 for k in range(len(v_i)))
-                )
-                if dist <= threshold:
-                    suggestions.append(
-                        {
-                            "a_branch": key_i,
-                            "b_branch": key_j,
-                            "a_label": label_i,
-                            "b_label": label_j,
-                            "a_count": cnt_i,
-                            "b_count": cnt_j,
-                            "distance": dist,
-                        }
-                    )
+        for i, j in zip(ii[close].tolist(), jj[close].tolist()):
+            a, b = reps[i], reps[j]
+            suggestions.append(
+                {
+                    "a_branch": a["branch_key"],
+                    "b_branch": b["branch_key"],
+                    "a_label": a["label"] or a["branch_key"],
+                    "b_label": b["label"] or b["branch_key"],
+                    "a_count": a["count"],
+                    "b_count": b["count"],
+                    "distance": float(dist[i, j]),
+                }
+            )
 
         suggestions.sort(key=lambda d: d["distance"])
         return suggestions[:max_pairs]
@@ -5064,9 +5692,8 @@ class ReferenceDB:
 
     def get_device(self, device_id: str) -> dict | None:
         """Get device information by ID."""
-        with self._connect() as conn:
-            cur = conn.cursor()
-            cur.execute("""
+        with self._connect(read_only=True) as conn:
+            cur = conn.execute("""
                 SELECT device_id, device_name, device_type, serial_number,
                        volume_guid, mount_point, first_seen, last_seen,
                        last_import_session, total_imports,
@@ -5076,24 +5703,7 @@ class ReferenceDB:
             """, (device_id,))
 
             row = cur.fetchone()
-            if not row:
-                return None
-
-            return {
-                "device_id": row[0],
-                "device_name": row[1],
-                "device_type": row[2],
-                "serial_number": row[3],
-                "volume_guid": row[4],
-                "mount_point": row[5],
-                "first_seen": row[6],
-                "last_seen": row[7],
-                "last_import_session": row[8],
-                "total_imports": row[9],
-                "total_photos_imported": row[10],
-                "total_videos_imported": row[11],
-                "notes": row[12]
-            }
+            return dict(row) if row else None
 
     def list_all_devices(self, device_type: str = None) -> list[dict]:
         """
@@ -5105,11 +5715,9 @@ class ReferenceDB:
         Returns:
             List of device dictionaries, sorted by last_seen (newest first)
         """
-        with self._connect() as conn:
-            cur = conn.cursor()
-
+        with self._connect(read_only=True) as conn:
             if device_type:
-                cur.execute("""
+                cur = conn.execute("""
                     SELECT device_id, device_name, device_type,
                            first_seen, last_seen, total_imports,
                            total_photos_imported, total_videos_imported
@@ -5118,7 +5726,7 @@ class ReferenceDB:
                     ORDER BY last_seen DESC
                 """, (device_type,))
             else:
-                cur.execute("""
+                cur = conn.execute("""
                     SELECT device_id, device_name, device_type,
                            first_seen, last_seen, total_imports,
                            total_photos_imported, total_videos_imported
@@ -5126,20 +5734,7 @@ class ReferenceDB:
                     ORDER BY last_seen DESC
                 """)
 
-            devices = []
-            for row in cur.fetchall():
-                devices.append({
-                    "device_id": row[0],
-                    "device_name": row[1],
-                    "device_type": row[2],
-                    "first_seen": row[3],
-                    "last_seen": row[4],
-                    "total_imports": row[5],
-                    "total_photos_imported": row[6],
-                    "total_videos_imported": row[7]
-                })
-
-            return devices
+            return [dict(row) for row in cur.fetchall()]
 
     def create_import_session(self, device_id: str, project_id: int,
                              import_type: str = "manual") -> int:
@@ -5231,10 +5826,9 @@ class ReferenceDB:
         Returns:
             List of import session dictionaries
         """
-        with self._connect() as conn:
-            cur = conn.cursor()
-            cur.execute("""
-                SELECT id, project_id, import_date, import_type,
+        with self._connect(read_only=True) as conn:
+            cur = conn.execute("""
+                SELECT id AS session_id, project_id, import_date, import_type,
                        photos_imported, videos_imported, duplicates_skipped,
                        status, duration_seconds
                 FROM import_sessions
@@ -5243,21 +5837,7 @@ class ReferenceDB:
                 LIMIT ?
             """, (device_id, limit))
 
-            sessions = []
-            for row in cur.fetchall():
-                sessions.append({
-                    "session_id": row[0],
-                    "project_id": row[1],
-                    "import_date": row[2],
-                    "import_type": row[3],
-                    "photos_imported": row[4],
-                    "videos_imported": row[5],
-                    "duplicates_skipped": row[6],
-                    "status": row[7],
-                    "duration_seconds": row[8]
-                })
-
-            return sessions
+            return [dict(row) for row in cur.fetchall()]
 
     def track_device_file(self, device_id: str, device_path: str,
                          device_folder: str, file_hash: str, file_size: int,
@@ -5278,10 +5858,8 @@ class ReferenceDB:
             local_video_id: Local video ID (if imported)
         """
         with self._connect() as conn:
-            cur = conn.cursor()
 
-            # Check if file already tracked
-            cur.execute("""
+            cur = conn.execute("""
                 SELECT id, import_status FROM device_files
                 WHERE device_id = ? AND device_path = ?
             """, (device_id, device_path))
@@ -5293,7 +5871,7 @@ class ReferenceDB:
                 file_id, current_status = existing
                 new_status = "imported" if (local_photo_id or local_video_id) else current_status
 
-                cur.execute("""
+                cur = conn.execute("""
                     UPDATE device_files
                     SET last_seen = CURRENT_TIMESTAMP,
                         import_status = ?,
@@ -5307,7 +5885,7 @@ class ReferenceDB:
                 # Insert new entry
                 import_status = "imported" if (local_photo_id or local_video_id) else "new"
 
-                cur.execute("""
+                cur = conn.execute("""
                     INSERT INTO device_files (
                         device_id, device_path, device_folder, file_hash,
                         file_size, file_mtime, import_status,
@@ -5330,26 +5908,15 @@ class ReferenceDB:
         Returns:
             List of file dictionaries with import_status='new'
         """
-        with self._connect() as conn:
-            cur = conn.cursor()
-            cur.execute("""
+        with self._connect(read_only=True) as conn:
+            cur = conn.execute("""
                 SELECT device_path, device_folder, file_hash, file_size, file_mtime
                 FROM device_files
                 WHERE device_id = ? AND import_status = 'new'
                 ORDER BY device_path
             """, (device_id,))
 
-            files = []
-            for row in cur.fetchall():
-                files.append({
-                    "device_path": row[0],
-                    "device_folder": row[1],
-                    "file_hash": row[2],
-                    "file_size": row[3],
-                    "file_mtime": row[4]
-                })
-
-            return files
+            return [dict(row) for row in cur.fetchall()]
 
     # =========================================================================
     # PHASE 4: AUTO-IMPORT PREFERENCES
@@ -5461,6 +6028,7 @@ _db = ReferenceDB()
 
 def get_all_references(): return _db.get_all_references()
 def log_match_result(filename, label, score, match_mode=None): return _db.log_match_result(filename, label, score, match_mode)
+def log_match_results_bulk(rows): return _db.log_match_results_bulk(rows)
 def get_threshold_for_label(label): return _db.get_threshold_for_label(label)
 def purge_missing_references(): return _db.purge_missing_references()
 
@@ -5480,32 +6048,44 @@ if __name__ == "__main__":
 # =========================================================
 #  Module-level Migration Helpers (manual, from menu)
 # =========================================================
+@contextmanager
 def _connect_for_path(db_path: str | None):
-    import sqlite3 as _sqlite3, os as _os
-    path = db_path or ReferenceDB().db_file  # <-- unify defaul
-    con = _sqlite3.connect(path)
-    con.execute("PRAGMA foreign_keys = ON")
-    return con
+    """
+    Connection for the helpers below. The app's own database goes through the
+    calling thread's pooled handle (warm page cache, cached statements), so
+    calling single_pass_backfill_created_fields() in a loop no longer opens,
+    and leaks, a fresh connection per pass. Any other file gets a private
+    connection that is committed and closed on exit.
+    """
+    db = ReferenceDB()
+    if db_path is None or os.path.abspath(db_path) == db.db_file:
+        with db._connect() as conn:
+            yield conn
+        return
+    con = sqlite3.connect(db_path)
+    try:
+        con.execute("PRAGMA foreign_keys = ON")
+        with con:
+            yield con
+    finally:
+        con.close()
 
 def ensure_created_date_fields(db_path: str | None = None) -> None:
     """Add created_ts / created_date / created_year + indexes, idempotent."""
     with _connect_for_path(db_path) as conn:
         cur = conn.cursor()
+        # Probe under the write lock so only the missing ALTERs run, all in one
+        # transaction (or the caller's bulk() one); the scope commits on exit
+        ReferenceDB._begin_immediate(conn)
         cur.execute("PRAGMA table_info(photo_metadata)")
         cols = {row[1] for row in cur.fetchall()}
-        if "created_ts" not in cols:
-            try: cur.execute("ALTER TABLE photo_metadata ADD COLUMN created_ts INTEGER"); 
-            except Exception: pass
-        if "created_date" not in cols:
-            try: cur.execute("ALTER TABLE photo_metadata ADD COLUMN created_date TEXT");
-            except Exception: pass
-        if "created_year" not in cols:
-            try: cur.execute("ALTER TABLE photo_metadata ADD COLUMN created_year INTEGER");
-            except Exception: pass
+        for name, decl in _CREATED_COLUMNS:
+            if name not in cols:
+                cur.execute(f"ALTER TABLE photo_metadata ADD COLUMN {name} {decl}")
         cur.execute("CREATE INDEX IF NOT EXISTS idx_photo_created_year  ON photo_metadata(created_year)")
         cur.execute("CREATE INDEX IF NOT EXISTS idx_photo_created_date  ON photo_metadata(created_date)")
         cur.execute("CREATE INDEX IF NOT EXISTS idx_photo_created_ts    ON photo_metadata(created_ts)")
-        conn.commit()
+    ReferenceDB._table_columns_cache.clear()  # columns may have changed behind the pool
 
 def count_missing_created_fields(db_path: str | None = None) -> int:
     """How many rows still need created_* filled. If cols missing, return total rows."""
@@ -5571,7 +6151,6 @@ def single_pass_backfill_created_fields(db_path: str | None = None, chunk_size:
             SET created_ts = ?, created_date = ?, created_year = ?
             WHERE path = ?
         """, updates)
-        conn.commit()
         return len(updates)
         
         
@@ -177,6 +177,7 @@ CREATE TABLE IF NOT EXISTS photo_folders (
     path TEXT NOT NULL,
     parent_id INTEGER NULL,
     project_id INTEGER NOT NULL,
+    photo_count INTEGER NOT NULL DEFAULT 0,
     FOREIGN KEY(parent_id) REFERENCES photo_folders(id),
     FOREIGN KEY(project_id) REFERENCES projects(id) ON DELETE CASCADE,
     UNIQUE(path, project_id)
@@ -364,6 +365,8 @@ CREATE TABLE IF NOT EXISTS device_files (
 CREATE INDEX IF NOT EXISTS idx_face_crops_proj ON face_crops(project_id);
 CREATE INDEX IF NOT EXISTS idx_face_crops_proj_branch ON face_crops(project_id, branch_key);
 CREATE INDEX IF NOT EXISTS idx_face_crops_proj_rep ON face_crops(project_id, is_representative);
+-- Partial index: only representative crops, covering the rep lookup in get_face_branch_summary
+CREATE INDEX IF NOT EXISTS idx_face_crops_rep_only ON face_crops(project_id, is_representative, branch_key, crop_path) WHERE is_representative = 1;
 
 -- Face branch reps indexes
 CREATE INDEX IF NOT EXISTS idx_fbreps_proj ON face_branch_reps(project_id);
@@ -377,10 +380,13 @@ CREATE INDEX IF NOT EXISTS idx_branches_key ON branches(project_id, branch_key);
 CREATE INDEX IF NOT EXISTS idx_projimgs_project ON project_images(project_id);
 CREATE INDEX IF NOT EXISTS idx_projimgs_branch ON project_images(project_id, branch_key);
 CREATE INDEX IF NOT EXISTS idx_projimgs_path ON project_images(image_path);
+-- Lets SELECT DISTINCT image_path ... WHERE project_id = ? stream in index order (no temp B-tree)
+CREATE INDEX IF NOT EXISTS idx_projimgs_project_path ON project_images(project_id, image_path);
+-- Partial index: only labelled rows, for the face-label fallback in get_project_images
+CREATE INDEX IF NOT EXISTS idx_projimgs_project_label ON project_images(project_id, label) WHERE label IS NOT NULL;
 
 -- Photo folders indexes
 CREATE INDEX IF NOT EXISTS idx_photo_folders_project ON photo_folders(project_id);
-CREATE INDEX IF NOT EXISTS idx_photo_folders_parent ON photo_folders(parent_id);
 CREATE INDEX IF NOT EXISTS idx_photo_folders_path ON photo_folders(path);
 
 -- Photo metadata indexes (project_id for fast filtering)
@@ -431,8 +437,15 @@ CREATE INDEX IF NOT EXISTS idx_video_metadata_project_folder ON video_metadata(p
 CREATE INDEX IF NOT EXISTS idx_video_metadata_project_date ON video_metadata(project_id, created_year, created_date);
 CREATE INDEX IF NOT EXISTS idx_video_metadata_project_thumb_status ON video_metadata(project_id, thumbnail_status);
 CREATE INDEX IF NOT EXISTS idx_video_metadata_project_meta_status ON video_metadata(project_id, metadata_status);
+-- Day grid: filter on (project_id, created_date), rows already in (created_ts, path) order
+CREATE INDEX IF NOT EXISTS idx_photo_metadata_project_day ON photo_metadata(project_id, created_date, created_ts, path);
+CREATE INDEX IF NOT EXISTS idx_video_metadata_project_day ON video_metadata(project_id, created_date, created_ts, path);
+-- Recently Indexed: seek (project_id, updated_at), rows already in (updated_at DESC, path) order
+CREATE INDEX IF NOT EXISTS idx_photo_metadata_project_updated ON photo_metadata(project_id, updated_at DESC, path);
 CREATE INDEX IF NOT EXISTS idx_project_images_project_branch ON project_images(project_id, branch_key, image_path);
 CREATE INDEX IF NOT EXISTS idx_photo_folders_project_parent ON photo_folders(project_id, parent_id);
+-- Covering + ordered for the sidebar's children lookup (... ORDER BY name), root level included
+CREATE INDEX IF NOT EXISTS idx_photo_folders_parent_project_name ON photo_folders(parent_id, project_id, name);
 
 -- Mobile device tracking indexes (v5.0.0: Device import tracking)
 CREATE INDEX IF NOT EXISTS idx_mobile_devices_type ON mobile_devices(device_type);
@@ -451,6 +464,31 @@ CREATE INDEX IF NOT EXISTS idx_device_files_photo ON device_files(local_photo_id
 CREATE INDEX IF NOT EXISTS idx_device_files_video ON device_files(local_video_id);
 CREATE INDEX IF NOT EXISTS idx_device_files_session ON device_files(import_session_id);
 CREATE INDEX IF NOT EXISTS idx_device_files_last_seen ON device_files(device_id, last_seen);
+
+-- ============================================================================
+-- TRIGGERS
+-- ============================================================================
+
+-- Keep photo_folders.photo_count equal to the folder's photo_metadata rows
+CREATE TRIGGER IF NOT EXISTS trg_photo_metadata_count_ins
+AFTER INSERT ON photo_metadata
+BEGIN
+    UPDATE photo_folders SET photo_count = photo_count + 1 WHERE id = NEW.folder_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_photo_metadata_count_del
+AFTER DELETE ON photo_metadata
+BEGIN
+    UPDATE photo_folders SET photo_count = photo_count - 1 WHERE id = OLD.folder_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_photo_metadata_count_move
+AFTER UPDATE OF folder_id ON photo_metadata
+WHEN OLD.folder_id IS NOT NEW.folder_id
+BEGIN
+    UPDATE photo_folders SET photo_count = photo_count - 1 WHERE id = OLD.folder_id;
+    UPDATE photo_folders SET photo_count = photo_count + 1 WHERE id = NEW.folder_id;
+END;
 """
 
 
@@ -518,6 +556,7 @@ def get_expected_indexes() -> list[str]:
         "idx_face_crops_proj",
         "idx_face_crops_proj_branch",
         "idx_face_crops_proj_rep",
+        "idx_face_crops_rep_only",
         "idx_fbreps_proj",
         "idx_fbreps_proj_branch",
         "idx_branches_project",
@@ -525,8 +564,9 @@ def get_expected_indexes() -> list[str]:
         "idx_projimgs_project",
         "idx_projimgs_branch",
         "idx_projimgs_path",
+        "idx_projimgs_project_path",
+        "idx_projimgs_project_label",
         "idx_photo_folders_project",
-        "idx_photo_folders_parent",
         "idx_photo_folders_path",
         "idx_photo_metadata_project",
         "idx_meta_date",
@@ -558,8 +598,12 @@ def get_expected_indexes() -> list[str]:
         "idx_photo_metadata_project_date",
         "idx_video_metadata_project_folder",
         "idx_video_metadata_project_date",
+        "idx_photo_metadata_project_day",
+        "idx_video_metadata_project_day",
+        "idx_photo_metadata_project_updated",
         "idx_project_images_project_branch",
         "idx_photo_folders_project_parent",
+        "idx_photo_folders_parent_project_name",
         # Mobile device tracking indexes (v5.0.0)
         "idx_mobile_devices_type",
         "idx_mobile_devices_last_seen",
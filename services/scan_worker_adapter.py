@@ -116,6 +116,14 @@ class ScanWorkerAdapter(QObject):
             self._skipped_count = result.photos_skipped
             self._photos_indexed = result.photos_indexed
 
+            # Refresh planner stats so date/status queries see the new rows
+            if result.photos_indexed or result.videos_indexed:
+                try:
+                    from reference_db import ReferenceDB
+                    ReferenceDB().post_ingest_optimize()
+                except Exception as e:
+                    logger.warning(f"Post-scan ANALYZE failed: {e}")
+
             # Emit completion
             logger.info(
                 f"Scan completed: {result.photos_indexed} photos, "
@@ -748,7 +748,10 @@ class ThumbnailService:
         except Exception as e:
             logger.warning(f"[ThumbCache] Failed to clear L2 cache: {e}")
             # Attempt fallback
-            self.l2_cache.purge_stale(max_age_days=0)
+            try:
+                self.l2_cache.purge_stale(max_age_days=0)
+            except Exception as e2:
+                logger.warning(f"[ThumbCache] Fallback purge failed: {e2}")
 
         # Clear failed images list
         with self._failed_images_lock:  # P0 Fix #3: Thread-safe access
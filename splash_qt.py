@@ -98,8 +98,12 @@ class StartupWorker(QThread):
             print(f"[Cache] {stats}")
             self.emit_detail(f"✓ Cache: {stats.get('entries', 0)} entries, {stats.get('size_mb', 0):.1f} MB")
             if self.settings.get("cache_auto_cleanup", True):
-                cache.purge_stale(max_age_days=7)
-                self.emit_detail("✓ Stale cache entries purged")
+                try:
+                    cache.purge_stale(max_age_days=7)
+                    self.emit_detail("✓ Stale cache entries purged")
+                except Exception as e:
+                    print(f"[Startup] Cache purge skipped: {e}")
+                    self.emit_detail("⚠ Stale cache purge skipped")
             if self._cancel:
                 return
 
@@ -0,0 +1,406 @@
+# tests/test_reference_db.py
+# Integration tests for ReferenceDB against a temporary database
+
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from reference_db import ReferenceDB, _month_range, _year_range
+
+
+@pytest.fixture
+def ref_db(test_db_path: Path):
+    """ReferenceDB singleton pointed at a fresh temporary database."""
+    ReferenceDB.close_all_connections()
+    ReferenceDB._instance = None
+    db = ReferenceDB(str(test_db_path))
+    yield db
+    ReferenceDB.close_all_connections()
+    ReferenceDB._instance = None
+
+
+@pytest.fixture
+def project_id(ref_db: ReferenceDB) -> int:
+    """Create a test project."""
+    return ref_db.create_project("Test", "/photos", "scan")
+
+
+def add_photo(db: ReferenceDB, path: str, folder_id: int, project_id: int, date_taken=None):
+    """Insert a photo row the way the metadata backfill does."""
+    db.upsert_photo_metadata(path, folder_id, 10.0, "2020-01-01 00:00:00", None, None,
+                             date_taken=date_taken, project_id=project_id)
+
+
+def folder_counts(db_path: Path) -> dict:
+    """Trigger-maintained photo_count next to the actual row count, per folder."""
+    conn = sqlite3.connect(str(db_path))
+    try:
+        return {
+            fid: (stored, actual)
+            for fid, stored, actual in conn.execute("""
+                SELECT f.id, f.photo_count,
+                       (SELECT COUNT(*) FROM photo_metadata p WHERE p.folder_id = f.id)
+                FROM photo_folders f
+            """)
+        }
+    finally:
+        conn.close()
+
+
+class TestFolderPhotoCountTriggers:
+    """photo_folders.photo_count must follow photo_metadata."""
+
+    @pytest.fixture
+    def folders(self, ref_db: ReferenceDB, project_id: int) -> tuple[int, int]:
+        """Create a root folder and one subfolder."""
+        root = ref_db.ensure_folder("/photos", "photos", None, project_id)
+        sub = ref_db.ensure_folder("/photos/sub", "sub", root, project_id)
+        return root, sub
+
+    def test_insert_increments_count(self, ref_db, project_id, folders, test_db_path):
+        """Test that inserts bump the folder count."""
+        root, sub = folders
+        for i in range(3):
+            add_photo(ref_db, f"/photos/{i}.jpg", root, project_id)
+        add_photo(ref_db, "/photos/sub/a.jpg", sub, project_id)
+
+        counts = folder_counts(test_db_path)
+        assert counts[root] == (3, 3)
+        assert counts[sub] == (1, 1)
+        assert ref_db.count_for_folder(root, project_id) == 3
+
+    def test_upsert_of_existing_row_keeps_count(self, ref_db, project_id, folders, test_db_path):
+        """Test that re-upserting the same path does not count it twice."""
+        root, _sub = folders
+        add_photo(ref_db, "/photos/a.jpg", root, project_id)
+        add_photo(ref_db, "/photos/a.jpg", root, project_id, date_taken="2024:01:15 10:00:00")
+
+        assert folder_counts(test_db_path)[root] == (1, 1)
+
+    def test_delete_decrements_count(self, ref_db, project_id, folders, test_db_path):
+        """Test that deletes lower the folder count."""
+        root, _sub = folders
+        add_photo(ref_db, "/photos/a.jpg", root, project_id)
+        add_photo(ref_db, "/photos/b.jpg", root, project_id)
+
+        with ref_db._connect() as conn:
+            conn.execute("DELETE FROM photo_metadata WHERE path = ?", ("/photos/a.jpg",))
+
+        assert folder_counts(test_db_path)[root] == (1, 1)
+        assert ref_db.count_for_folder(root, project_id) == 1
+
+    def test_folder_move_updates_both_folders(self, ref_db, project_id, folders, test_db_path):
+        """Test that moving a photo moves its count."""
+        root, sub = folders
+        add_photo(ref_db, "/photos/a.jpg", root, project_id)
+        add_photo(ref_db, "/photos/b.jpg", root, project_id)
+
+        # Upsert with a new folder_id goes through ON CONFLICT ... DO UPDATE
+        add_photo(ref_db, "/photos/a.jpg", sub, project_id)
+
+        counts = folder_counts(test_db_path)
+        assert counts[root] == (1, 1)
+        assert counts[sub] == (1, 1)
+
+    def test_triggers_installed_on_older_database(self, ref_db, project_id, folders, test_db_path):
+        """Test that a database without the triggers gets them and a backfill."""
+        root, _sub = folders
+        with ref_db._connect() as conn:
+            for name in ("ins", "del", "move"):
+                conn.execute(f"DROP TRIGGER trg_photo_metadata_count_{name}")
+        add_photo(ref_db, "/photos/a.jpg", root, project_id)
+        assert folder_counts(test_db_path)[root] == (0, 1)
+
+        ref_db.ensure_folder_photo_counts()
+        assert folder_counts(test_db_path)[root] == (1, 1)
+
+        add_photo(ref_db, "/photos/b.jpg", root, project_id)
+        assert folder_counts(test_db_path)[root] == (2, 2)
+
+
+class TestDateHierarchyCache:
+    """Memoized get_date_hierarchy() results."""
+
+    @pytest.fixture
+    def folder_id(self, ref_db: ReferenceDB, project_id: int) -> int:
+        """Create the folder the photos go in."""
+        return ref_db.ensure_folder("/photos", "photos", None, project_id)
+
+    def test_hierarchy_shape(self, ref_db, project_id, folder_id):
+        """Test year/month/day nesting."""
+        add_photo(ref_db, "/photos/a.jpg", folder_id, project_id, "2024:01:15 10:00:00")
+        add_photo(ref_db, "/photos/b.jpg", folder_id, project_id, "2024:03:02 10:00:00")
+
+        assert ref_db.get_date_hierarchy(project_id) == {
+            "2024": {"01": ["2024-01-15"], "03": ["2024-03-02"]},
+        }
+
+    def test_caller_mutation_does_not_leak(self, ref_db, project_id, folder_id):
+        """Test that callers get their own copy of the cached result."""
+        add_photo(ref_db, "/photos/a.jpg", folder_id, project_id, "2024:01:15 10:00:00")
+
+        first = ref_db.get_date_hierarchy(project_id)
+        first["2024"]["01"].append("bogus")
+        first["1999"] = {}
+
+        assert ref_db.get_date_hierarchy(project_id) == {"2024": {"01": ["2024-01-15"]}}
+
+    def test_invalidated_by_own_write(self, ref_db, project_id, folder_id):
+        """Test that a commit through ReferenceDB refreshes the cache."""
+        add_photo(ref_db, "/photos/a.jpg", folder_id, project_id, "2024:01:15 10:00:00")
+        ref_db.get_date_hierarchy(project_id)
+
+        add_photo(ref_db, "/photos/b.jpg", folder_id, project_id, "2023:12:31 10:00:00")
+
+        assert ref_db.get_date_hierarchy(project_id) == {
+            "2023": {"12": ["2023-12-31"]},
+            "2024": {"01": ["2024-01-15"]},
+        }
+
+    def test_invalidated_by_other_connection(self, ref_db, project_id, folder_id, test_db_path):
+        """Test that a commit from another connection refreshes the cache."""
+        add_photo(ref_db, "/photos/a.jpg", folder_id, project_id, "2024:01:15 10:00:00")
+        assert ref_db.get_date_hierarchy(project_id) == {"2024": {"01": ["2024-01-15"]}}
+
+        other = sqlite3.connect(str(test_db_path))
+        try:
+            other.execute(
+                "UPDATE photo_metadata SET created_date = '2022-06-01' WHERE path = ?",
+                ("/photos/a.jpg",),
+            )
+            other.commit()
+        finally:
+            other.close()
+
+        assert ref_db.get_date_hierarchy(project_id) == {"2022": {"06": ["2022-06-01"]}}
+
+
+class TestDateRangeCounts:
+    """Half-open created_date ranges behind the year and month counters."""
+
+    def test_year_range(self):
+        """Test year bounds."""
+        assert _year_range(2024) == ("2024-01-01", "2025-01-01")
+        assert _year_range("2024") == ("2024-01-01", "2025-01-01")
+        assert _year_range("n/a") is None
+
+    def test_month_range(self):
+        """Test month bounds, including the December rollover."""
+        assert _month_range(2024, 2) == ("2024-02-01", "2024-03-01")
+        assert _month_range("2024", "12") == ("2024-12-01", "2025-01-01")
+        assert _month_range(2024, None) is None
+
+    def test_counts_respect_boundaries(self, ref_db, project_id):
+        """Test that boundary days land in exactly one bucket."""
+        folder_id = ref_db.ensure_folder("/photos", "photos", None, project_id)
+        for i, taken in enumerate([
+            "2023:12:31 23:59:59",
+            "2024:01:01 00:00:00",
+            "2024:01:31 12:00:00",
+            "2024:02:01 00:00:00",
+            "2024:12:31 23:59:59",
+            "2025:01:01 00:00:00",
+        ]):
+            add_photo(ref_db, f"/photos/{i}.jpg", folder_id, project_id, taken)
+
+        assert ref_db.count_for_year(2024, project_id) == 4
+        assert ref_db.count_for_year(2024) == 4
+        assert ref_db.count_for_month(2024, 1, project_id) == 2
+        assert ref_db.count_for_month(2024, 12, project_id) == 1
+        assert ref_db.count_for_month(2023, 12) == 1
+        assert ref_db.count_for_year("bad", project_id) == 0
+
+
+class TestMetadataClaims:
+    """claim_metadata_batch() and the claim bookkeeping around it."""
+
+    @pytest.fixture
+    def paths(self, ref_db: ReferenceDB, project_id: int) -> list[str]:
+        """Five photos that still need metadata."""
+        folder_id = ref_db.ensure_folder("/photos", "photos", None, project_id)
+        paths = [f"/photos/{i}.jpg" for i in range(5)]
+        for p in paths:
+            add_photo(ref_db, p, folder_id, project_id)
+        return paths
+
+    def test_claims_do_not_overlap(self, ref_db, paths):
+        """Test that two claims never return the same path."""
+        first = ref_db.claim_metadata_batch(limit=3)
+        second = ref_db.claim_metadata_batch(limit=3)
+
+        assert len(first) == 3
+        assert len(second) == 2
+        assert set(first).isdisjoint(second)
+        assert ref_db.claim_metadata_batch() == []
+
+    def test_stats_count_in_progress(self, ref_db, paths):
+        """Test that claimed rows show up as in_progress."""
+        ref_db.claim_metadata_batch(limit=2)
+
+        stats = ref_db.get_metadata_stats()
+        assert stats["in_progress"] == 2
+        assert stats["pending"] == 3
+        assert stats["missing_metadata"] == 5
+
+    def test_release_returns_rows_to_queue(self, ref_db, paths):
+        """Test that released claims can be claimed again."""
+        claimed = ref_db.claim_metadata_batch(limit=2)
+
+        assert ref_db.release_metadata_claims(claimed) == 2
+        assert ref_db.get_metadata_stats()["in_progress"] == 0
+        assert set(ref_db.claim_metadata_batch()) == set(paths)
+
+    def test_finished_rows_are_not_released(self, ref_db, paths):
+        """Test that release leaves rows already marked ok alone."""
+        claimed = ref_db.claim_metadata_batch(limit=1)
+        ref_db.mark_metadata_success(claimed[0], 800, 600, "2024:01:15 10:00:00")
+
+        assert ref_db.release_metadata_claims(claimed) == 0
+        assert ref_db.get_metadata_stats()["ok"] == 1
+
+    def test_stale_claims_are_reset(self, ref_db, paths):
+        """Test that claims older than the cutoff go back to the queue."""
+        ref_db.claim_metadata_batch()
+
+        assert ref_db.release_stale_metadata_claims() == 0
+        assert ref_db.release_stale_metadata_claims(stale_after=-60) == len(paths)
+        assert ref_db.get_metadata_stats()["in_progress"] == 0
+
+    def test_refreshed_claims_are_not_stale(self, ref_db, paths):
+        """Test that a live run's heartbeat keeps its claims from another run's reset."""
+        claimed = ref_db.claim_metadata_batch()
+        with ref_db._connect() as conn:
+            conn.execute("UPDATE photo_metadata SET updated_at = '2000-01-01 00:00:00'")
+
+        assert ref_db.refresh_metadata_claims(claimed[:3]) == 3
+        assert ref_db.release_stale_metadata_claims() == 2
+        assert ref_db.get_metadata_stats()["in_progress"] == 3
+        assert set(ref_db.claim_metadata_batch()) == set(paths) - set(claimed[:3])
+
+    def test_refresh_skips_finished_rows(self, ref_db, paths):
+        """Test that the heartbeat only touches rows still claimed."""
+        claimed = ref_db.claim_metadata_batch(limit=2)
+        ref_db.mark_metadata_success(claimed[0], 800, 600, "2024:01:15 10:00:00")
+
+        assert ref_db.refresh_metadata_claims(claimed) == 1
+
+    def test_stale_reset_restores_failure_state(self, ref_db, paths):
+        """Test that a reset claim keeps its failure bookkeeping."""
+        ref_db.mark_metadata_failure(paths[0], "boom", max_retries=3)
+        ref_db.claim_metadata_batch()
+
+        ref_db.release_stale_metadata_claims(stale_after=-60)
+
+        stats = ref_db.get_metadata_stats()
+        assert stats["failed_retry"] == 1
+        assert stats["pending"] == len(paths) - 1
+
+
+class TestRebuildDateIndex:
+    """rebuild_date_index() after a scan."""
+
+    @pytest.fixture
+    def folder_id(self, ref_db: ReferenceDB, project_id: int) -> int:
+        """Create the folder the photos go in."""
+        return ref_db.ensure_folder("/photos", "photos", None, project_id)
+
+    def created(self, db_path: Path, path: str) -> tuple:
+        """created_ts / created_date / created_year of one photo."""
+        conn = sqlite3.connect(str(db_path))
+        try:
+            return conn.execute(
+                "SELECT created_ts, created_date, created_year FROM photo_metadata WHERE path = ?",
+                (path,),
+            ).fetchone()
+        finally:
+            conn.close()
+
+    def clear_created(self, db_path: Path) -> None:
+        """Wipe the created_* columns the way an older database has them."""
+        conn = sqlite3.connect(str(db_path))
+        try:
+            conn.execute("UPDATE photo_metadata SET created_ts = NULL, created_date = NULL, created_year = NULL")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def test_unchanged_rows_are_not_rewritten(self, ref_db, project_id, folder_id):
+        """Test that a rebuild over an up-to-date index updates nothing."""
+        add_photo(ref_db, "/photos/a.jpg", folder_id, project_id, "2024:01:15 10:00:00")
+        add_photo(ref_db, "/photos/b.jpg", folder_id, project_id)
+
+        assert ref_db.rebuild_date_index() == 0
+
+    def test_rebuilds_from_date_taken_or_modified(self, ref_db, project_id, folder_id, test_db_path):
+        """Test that missing values are filled and match what the upsert wrote."""
+        add_photo(ref_db, "/photos/a.jpg", folder_id, project_id, "2024:01:15 10:00:00")
+        add_photo(ref_db, "/photos/b.jpg", folder_id, project_id)
+        before = {p: self.created(test_db_path, p) for p in ("/photos/a.jpg", "/photos/b.jpg")}
+        self.clear_created(test_db_path)
+
+        assert ref_db.rebuild_date_index() == 2
+        assert {p: self.created(test_db_path, p) for p in before} == before
+        assert before["/photos/b.jpg"][1] == "2020-01-01"
+
+    def test_dotted_date_taken_is_not_replaced_by_modified(self, ref_db, project_id, folder_id, test_db_path):
+        """Test that a date_taken SQLite cannot parse never falls back to modified."""
+        add_photo(ref_db, "/photos/a.jpg", folder_id, project_id, "15.03.2019 10:00:00")
+        before = self.created(test_db_path, "/photos/a.jpg")
+        assert before[1:] == ("2019-03-15", 2019)
+
+        assert ref_db.rebuild_date_index() == 0
+        assert self.created(test_db_path, "/photos/a.jpg") == before
+
+        self.clear_created(test_db_path)
+        assert ref_db.rebuild_date_index() == 1
+        assert self.created(test_db_path, "/photos/a.jpg") == before
+
+    def test_unparsable_date_taken_keeps_current_values(self, ref_db, project_id, folder_id, test_db_path):
+        """Test that a date_taken nothing can parse leaves the row alone."""
+        add_photo(ref_db, "/photos/a.jpg", folder_id, project_id, "2024:01:15 10:00:00")
+        before = self.created(test_db_path, "/photos/a.jpg")
+        with ref_db._connect() as conn:
+            conn.execute("UPDATE photo_metadata SET date_taken = 'unknown' WHERE path = ?", ("/photos/a.jpg",))
+
+        assert ref_db.rebuild_date_index() == 0
+        assert self.created(test_db_path, "/photos/a.jpg") == before
+
+
+class TestBuildDateBranches:
+    """Branch linking counted with conn.total_changes."""
+
+    @pytest.fixture
+    def dated_photos(self, ref_db: ReferenceDB, project_id: int) -> list[str]:
+        """Three photos over two days."""
+        folder_id = ref_db.ensure_folder("/photos", "photos", None, project_id)
+        paths = []
+        for i, taken in enumerate(["2024:01:15 10:00:00", "2024:01:15 11:00:00", "2024:02:01 09:00:00"]):
+            paths.append(f"/photos/{i}.jpg")
+            add_photo(ref_db, paths[-1], folder_id, project_id, taken)
+        return paths
+
+    def test_links_photos_into_branches(self, ref_db, project_id, dated_photos):
+        """Test the 'all' and per-date branches."""
+        assert ref_db.build_date_branches(project_id) == 3
+
+        assert sorted(ref_db.get_images_by_branch(project_id, "all")) == dated_photos
+        assert sorted(ref_db.get_images_by_branch(project_id, "by_date:2024-01-15")) == dated_photos[:2]
+        assert ref_db.get_images_by_branch(project_id, "by_date:2024-02-01") == dated_photos[2:]
+
+    def test_reports_only_new_links(self, ref_db, project_id, dated_photos, capsys):
+        """Test that a rebuild links nothing twice and says so."""
+        ref_db.build_date_branches(project_id)
+        first = capsys.readouterr().out
+        ref_db.build_date_branches(project_id)
+        second = capsys.readouterr().out
+
+        assert "Linked 3 new photos into 'all' branch" in first
+        assert "inserted 3/3 into project_images (new)" in first
+        assert "Linked 0 new photos into 'all' branch" in second
+        assert "inserted 0/3 into project_images (already linked)" in second
+        assert ref_db.count_images_by_branch(project_id, "all") == 3
+
+    def test_unknown_project(self, ref_db):
+        """Test that a missing project builds nothing."""
+        assert ref_db.build_date_branches(9999) == 0
@@ -10,6 +10,10 @@ from PySide6.QtGui import QPixmap, QImage
 
 from PySide6.QtCore import QByteArray, QBuffer, QIODevice, Qt
 
+from logging_config import get_logger
+
+logger = get_logger(__name__)
+
 # Normalizer
 def norm(p: str) -> str:
     try:
@@ -129,7 +133,7 @@ class ThumbCacheDB:
             self.metrics["get_hits"] += 1
             return pm
         except Exception as e:
-            print(f"[ThumbCacheDB] get_cached_thumbnail failed: {e}")
+            logger.warning(f"get_cached_thumbnail failed: {e}")
             return None
         finally:
             self.metrics["get_total_ms"] += (time.time() - start) * 1000.0
@@ -191,7 +195,7 @@ class ThumbCacheDB:
             self.metrics["stores"] += 1
             return True
         except Exception as e:
-            print(f"[ThumbCacheDB] store_thumbnail failed: {e}")
+            logger.warning(f"store_thumbnail failed: {e}")
             return False
         finally:
             self.metrics["store_total_ms"] += (time.time() - start) * 1000.0
@@ -208,18 +212,47 @@ class ThumbCacheDB:
             pass
 
    # -------------------------------------------------------
-    def purge_stale(self, max_age_days: int = 30):
-        try:
-            cutoff = time.time() - max_age_days * 86400
-            with self.lock:
-                cur = self.conn.cursor()
-                cur.execute("DELETE FROM thumbnail_cache WHERE mtime < ?", (cutoff,))
-                n = cur.rowcount
+    def purge_stale(self, max_age_days: int = 30) -> int:
+        """
+        Delete entries older than max_age_days in a single indexed DELETE.
+        Returns the number of purged entries; database errors propagate.
+        """
+        cutoff = time.time() - max_age_days * 86400
+        with self.lock:
+            try:
+                n = self.conn.execute("DELETE FROM thumbnail_cache WHERE mtime < ?", (cutoff,)).rowcount
                 self.conn.commit()
-            if n:
-                print(f"[ThumbCacheDB] Purged {n} stale thumbnails (> {max_age_days} days).")
-        except Exception as e:
-            print(f"[ThumbCacheDB] purge_stale failed: {e}")
+            except Exception:
+                self.conn.rollback()
+                raise
+        if n:
+            logger.info(f"Purged {n} stale thumbnails (> {max_age_days} days).")
+        return n
+
+    def compact(self) -> float:
+        """
+        VACUUM the cache so pages freed by purges go back to the filesystem.
+
+        Runs on its own connection without taking self.lock: under WAL,
+        thumbnail reads keep going and writes wait on the busy timeout.
+        Slow on a large cache, so call it from a worker thread. Returns the
+        megabytes reclaimed; database errors propagate.
+        """
+        def on_disk():
+            wal = self.db_path + "-wal"
+            return os.path.getsize(self.db_path) + (os.path.getsize(wal) if os.path.exists(wal) else 0)
+
+        before = on_disk()
+        con = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            con.execute("VACUUM")
+            # Under WAL the rewritten pages land in the -wal file first
+            con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        finally:
+            con.close()
+        freed_mb = max(0, before - on_disk()) / (1024 * 1024)
+        logger.info(f"Compacted thumbnail cache, reclaimed {freed_mb:.1f} MB.")
+        return freed_mb
 
    # -------------------------------------------------------
     def get_stats(self) -> dict:
@@ -258,14 +291,14 @@ class ThumbCacheDB:
                 # check file size on disk
                 size_mb = os.path.getsize(self.db_path) / (1024 * 1024)
                 if size_mb > MAX_CACHE_MB:
-                    print(f"[ThumbCacheDB] 🚮 Auto-purging: cache {size_mb:.1f} MB > limit {MAX_CACHE_MB} MB")
+                    logger.info(f"Auto-purging: cache {size_mb:.1f} MB > limit {MAX_CACHE_MB} MB")
                     self.purge_stale(max_age_days=7)
                 # weekly cleanup
                 if time.time() - last_run > PURGE_INTERVAL_DAYS * 86400:
                     self.purge_stale(max_age_days=30)
                     last_run = time.time()
             except Exception as e:
-                print(f"[ThumbCacheDB] Auto-purge thread error: {e}")
+                logger.warning(f"Auto-purge thread error: {e}")
             self._stop_event.wait(timeout=6 * 3600)
 
     def __del__(self):
@@ -297,7 +330,7 @@ def get_cache() -> ThumbCacheDB:
 def _shutdown_cache():
     global _global_cache
     if _global_cache:
-        print("[ThumbCacheDB] Closing cache gracefully...")
+        logger.info("Closing cache gracefully...")
         _global_cache.close()
         _global_cache = None
 
@@ -0,0 +1,39 @@
+"""
+Per-user application data locations.
+
+Startup check flags used to live in the process working directory, which
+made them depend on where the app was launched from.  They now live in the
+platform's local app-data folder (e.g. %LOCALAPPDATA% on Windows).
+"""
+
+from functools import lru_cache
+from pathlib import Path
+
+
+@lru_cache(maxsize=1)
+def get_app_data_dir() -> Path:
+    """
+    Return the writable local app-data directory, creating it if needed.
+
+    Resolved lazily so the QApplication name is already set when
+    QStandardPaths is queried. Falls back to ~/.memorymate.
+    """
+    try:
+        from PySide6.QtCore import QStandardPaths
+        location = QStandardPaths.writableLocation(QStandardPaths.AppLocalDataLocation)
+    except ImportError:
+        location = ""
+
+    data_dir = Path(location) if location else Path.home() / ".memorymate"
+    data_dir.mkdir(parents=True, exist_ok=True)
+    return data_dir
+
+
+def insightface_check_flag() -> Path:
+    """Flag file marking that the InsightFace startup check has passed."""
+    return get_app_data_dir() / ".insightface_check_done"
+
+
+def ffmpeg_check_flag() -> Path:
+    """Flag file marking that the FFmpeg startup check has passed."""
+    return get_app_data_dir() / ".ffmpeg_check_done"
@@ -333,7 +333,8 @@ def show_ffmpeg_status_once():
     Returns:
         Message string if this is the first check, None otherwise
     """
-    flag_file = Path('.ffmpeg_check_done')
+    from utils.app_paths import ffmpeg_check_flag
+    flag_file = ffmpeg_check_flag()
 
     # Check FFmpeg availability
     ffmpeg_ok, ffprobe_ok, message = check_ffmpeg_availability()
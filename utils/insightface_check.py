@@ -267,7 +267,8 @@ def show_insightface_status_once() -> str:
     Returns:
         Message string if this is the first check, None otherwise
     """
-    flag_file = Path('.insightface_check_done')
+    from utils.app_paths import insightface_check_flag
+    flag_file = insightface_check_flag()
 
     # Check availability
     available, message = check_insightface_availability()
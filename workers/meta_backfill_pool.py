@@ -35,6 +35,10 @@ except Exception as e:
     print("Failed to import dependencies:", e)
     raise
 
+# Seconds between re-stamps of a run's outstanding claims; must stay well under
+# the stale_after of ReferenceDB.release_stale_metadata_claims()
+CLAIM_HEARTBEAT = 60.0
+
 # Worker function that runs inside a child process
 
 # Worker function that runs inside a child process
@@ -143,6 +147,27 @@ class PersistentPool:
                 pass
    
 
+def _flush_results(db, results, max_retries):
+    """Write one drained batch of worker results in two batched transactions."""
+    ok = [(r["path"], r.get("width"), r.get("height"), r.get("date_taken"))
+          for r in results if r.get("ok") and r.get("path")]
+    failed = [(r["path"], r.get("error"))
+              for r in results if not r.get("ok") and r.get("path")]
+    if ok:
+        db.mark_metadata_success_many(ok)
+    if failed:
+        db.mark_metadata_failure_many(failed, max_retries=max_retries)
+
+
+def _heartbeat(db, outstanding, last_beat):
+    """Re-stamp the run's unfinished claims every CLAIM_HEARTBEAT seconds; returns the last beat time."""
+    now = time.time()
+    if outstanding and now - last_beat >= CLAIM_HEARTBEAT:
+        db.refresh_metadata_claims(outstanding)
+        return now
+    return last_beat
+
+
 def controller_1st(workers=4, timeout=8.0, batch=200, limit=0, dry_run=False, max_retries=3, quiet=False):
     db = ReferenceDB()
     # Ensure DB has the metadata columns
@@ -151,7 +176,13 @@ def controller_1st(workers=4, timeout=8.0, batch=200, limit=0, dry_run=False, ma
     except Exception:
         pass
 
-    to_proc = db.get_images_missing_metadata(limit=limit or None, max_failures=max_retries)
+    if dry_run:
+        to_proc = db.get_images_missing_metadata(limit=limit or None, max_failures=max_retries)
+    else:
+        # Hand back claims a crashed run left 'in_progress', then claim: claimed
+        # rows are skipped by any other backfill running at the same time
+        db.release_stale_metadata_claims(max_failures=max_retries)
+        to_proc = db.claim_metadata_batch(limit=limit or None, max_failures=max_retries)
     total = len(to_proc)
     if not quiet:
         print(f"[meta_backfill] found {total} images needing metadata")
@@ -163,18 +194,16 @@ def controller_1st(workers=4, timeout=8.0, batch=200, limit=0, dry_run=False, ma
 
     processed = 0
     start = time.time()
+    outstanding = set(to_proc)
+    last_beat = start
     try:
         while True:
             results = pool.drain_results(max_items=batch * 2)
             if results:
-                for r in results:
-                    processed += 1
-                    if r.get("ok"):
-                        if not dry_run:
-                            db.mark_metadata_success(r["path"], r.get("width"), r.get("height"), r.get("date_taken"))
-                    else:
-                        if not dry_run:
-                            db.mark_metadata_failure(r["path"], error=r.get("error"), max_retries=max_retries)
+                processed += len(results)
+                if not dry_run:
+                    _flush_results(db, results, max_retries)
+                    outstanding.difference_update(r.get("path") for r in results)
                 if (processed % 10 == 0 or processed == total) and not quiet:
                     elapsed = time.time() - start
                     rate = processed / elapsed if elapsed > 0 else 0.0
@@ -182,9 +211,15 @@ def controller_1st(workers=4, timeout=8.0, batch=200, limit=0, dry_run=False, ma
             # exit condition
             if processed >= total and pool.result_q.empty():
                 break
+            if not dry_run:
+                last_beat = _heartbeat(db, outstanding, last_beat)
             time.sleep(0.3)
     finally:
         pool.shutdown()
+        if not dry_run:
+            # Anything not marked ok/failed (cancelled, timed out) is handed back
+            db.release_metadata_claims(to_proc, max_failures=max_retries)
+            db.flush_audit()
     elapsed = time.time() - start
     if not quiet:
         print(f"[meta_backfill] DONE processed={processed} total={total} elapsed={elapsed:.1f}s")
@@ -198,7 +233,13 @@ def controller(workers=4, timeout=8.0, batch=200, limit=0, dry_run=False, max_re
     except Exception:
         pass
 
-    to_proc = db.get_images_missing_metadata(limit=limit or None, max_failures=max_retries)
+    if dry_run:
+        to_proc = db.get_images_missing_metadata(limit=limit or None, max_failures=max_retries)
+    else:
+        # Hand back claims a crashed run left 'in_progress', then claim: claimed
+        # rows are skipped by any other backfill running at the same time
+        db.release_stale_metadata_claims(max_failures=max_retries)
+        to_proc = db.claim_metadata_batch(limit=limit or None, max_failures=max_retries)
     total = len(to_proc)
     if not quiet:
         print(f"[meta_backfill] found {total} images needing metadata")
@@ -210,6 +251,8 @@ def controller(workers=4, timeout=8.0, batch=200, limit=0, dry_run=False, max_re
 
     processed = 0
     start = time.time()
+    outstanding = set(to_proc)
+    last_beat = start
 #    status_path = os.path.join(os.getcwd(), "status", "backfill_status.json")
 #    write_status(status_path, "starting", 0, total)
 
@@ -229,14 +272,10 @@ def controller(workers=4, timeout=8.0, batch=200, limit=0, dry_run=False, max_re
         while True:
             results = pool.drain_results(max_items=batch * 2)
             if results:
-                for r in results:
-                    processed += 1
-                    if r.get("ok"):
-                        if not dry_run:
-                            db.mark_metadata_success(r["path"], r.get("width"), r.get("height"), r.get("date_taken"))
-                    else:
-                        if not dry_run:
-                            db.mark_metadata_failure(r["path"], error=r.get("error"), max_retries=max_retries)
+                processed += len(results)
+                if not dry_run:
+                    _flush_results(db, results, max_retries)
+                    outstanding.difference_update(r.get("path") for r in results)
                 # 🧩 Emit progress update every 20 items or at end            
                 if processed % 20 == 0 or processed >= total:
                     write_status(status_path, "processing", processed, total)
@@ -248,6 +287,8 @@ def controller(workers=4, timeout=8.0, batch=200, limit=0, dry_run=False, max_re
             # exit condition
             if processed >= total and pool.result_q.empty():
                 break                    
+            if not dry_run:
+                last_beat = _heartbeat(db, outstanding, last_beat)
 
             time.sleep(0.3)
         # ✅ Mark completion
@@ -256,6 +297,10 @@ def controller(workers=4, timeout=8.0, batch=200, limit=0, dry_run=False, max_re
 
     finally:
         pool.shutdown()
+        if not dry_run:
+            # Anything not marked ok/failed (cancelled, timed out) is handed back
+            db.release_metadata_claims(to_proc, max_failures=max_retries)
+            db.flush_audit()
 
 
 def parse_args(argv=None):